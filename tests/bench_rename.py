@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Benchmarks Timefops._rename_duplicates against the previous (nested
+Counter) implementation, on names shared across many dates.
+
+usage: python -m tests.bench_rename [num_items ...]
+"""
+
+import os
+import sys
+import random
+import timeit
+import collections
+import logging
+from timefops import Timefops
+
+
+def legacy_rename_duplicates(tf, f):
+    """_rename_duplicates as of timefops 0.3 (kept here for comparison)."""
+    basename_map = {x: os.path.basename(x) for x in f}
+
+    filter_dict = collections.defaultdict(dict)
+    for fn, date in f.items():
+        filter_dict[os.path.basename(fn)].update({fn: date})
+
+    to_rename = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+
+    for key, val in filter_dict.items():
+        if len(val) > 1:
+            for date, occur in collections.Counter(val.values()).items():
+                if occur > 1:
+                    for subk, subv in val.items():
+                        if subv == date:
+                            to_rename[subv][os.path.basename(subk)
+                                    ].append(subk)
+
+    for d, i in to_rename.items():
+        for bn, p in i.items():
+            for k, v in enumerate(p):
+                if k > 0:
+                    basename_map[v] = tf.add_enumerate(os.path.basename(v), k)
+                else:
+                    basename_map[v] = os.path.basename(v)
+
+    return basename_map, to_rename
+
+
+def make_data(num, names=("index.html", "IMG_0001.JPG", "notes.txt")):
+    """Maps 'num' paths, sharing a handful of basenames, to ~num/10 dates."""
+    dates = [f"2020-{m:02}-{d:02}" for m in range(1, 13) for d in range(1, 29)]
+    dates = dates[:max(1, num // 10)]
+    return {f"/src/{n}/{random.choice(names)}": random.choice(dates)
+            for n in range(num)}
+
+
+def main(argv):
+    tf = Timefops(logging.INFO)
+    for num in map(int, argv or (1000, 10000, 50000)):
+        data = make_data(num)
+        assert tf._rename_duplicates(data)[0] == \
+               legacy_rename_duplicates(tf, data)[0]
+
+        old = min(timeit.repeat(lambda: legacy_rename_duplicates(tf, data),
+                                number=1, repeat=3))
+        new = min(timeit.repeat(lambda: tf._rename_duplicates(data),
+                                number=1, repeat=3))
+        print(f"{num:>8} items: legacy {old:8.4f}s, "
+              f"single pass {new:8.4f}s ({old / new:6.1f}x)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Benchmark suite for timefops: builds a synthetic source tree, times the
+scan/bucket/rename stages and every operation in its main modes, and writes
+the results as JSON so runs of different versions can be compared.
+
+usage: python -m tests.bench_suite [options]    (see --help)
+
+    python -m tests.bench_suite --files 100000 --out 0.4.json
+    python -m tests.bench_suite --files 100000 --compare 0.4.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from timefops import Timefops, __version__
+
+
+# file size distributions: (name) -> callable(rng) returning a size in bytes
+SIZES = {
+    "empty": lambda rng: 0,
+    "small": lambda rng: rng.randint(0, 4096),
+    "mixed": lambda rng: min(int(rng.lognormvariate(8, 2.5)), 1 << 26),
+    "large": lambda rng: rng.randint(1 << 20, 1 << 24),
+}
+
+COMMON_NAMES = ("index.html", "README.md", "IMG_0001.JPG", "notes.txt",
+                "data.csv", "thumbs.db", "output.log", "config.json")
+
+
+def make_tree(root, files=10000, depth=3, fanout=8, dup_rate=0.2,
+              sizes="small", spread=365, seed=0):
+    """
+    *args:
+    root - str: directory to create the tree in.
+
+    **kwargs:
+    files - int: number of files.
+    depth - int: maximum directory depth under 'root'.
+    fanout - int: subdirectories per directory.
+    dup_rate - float: share of files named after a handful of common names
+               (so they collide within their time folder).
+    sizes - str: size distribution (see SIZES).
+    spread - float: days the modification/access times are spread over.
+    seed - int: random seed, the same arguments always give the same tree.
+
+    Returns:
+    dict - totals (files, dirs, bytes).
+    """
+    rng = random.Random(seed)
+    size_of = SIZES[sizes]
+    dirs = [root]
+    frontier = [root]
+    for _ in range(depth):
+        frontier = [os.path.join(d, f"d{i}") for d in frontier
+                    for i in range(fanout)]
+        # keep roughly 8 files per directory at most levels
+        if len(dirs) + len(frontier) > max(1, files // 8):
+            frontier = frontier[:max(1, files // 8 - len(dirs))]
+        dirs.extend(frontier)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    total = 0
+    base = 1.6e9
+    zero = bytes(1 << 16)
+    for n in range(files):
+        name = rng.choice(COMMON_NAMES) if rng.random() < dup_rate else \
+               f"file{n}.{rng.choice(('txt', 'jpg', 'log', 'bin'))}"
+        path = os.path.join(rng.choice(dirs), name)
+        if os.path.exists(path):
+            path = os.path.join(os.path.dirname(path), f"{n}-{name}")
+        size = size_of(rng)
+        with open(path, "wb") as f:
+            left = size
+            while left > 0:
+                f.write(zero[:min(left, len(zero))])
+                left -= len(zero)
+        ts = base - rng.uniform(0, spread * 86400)
+        os.utime(path, (ts, ts))
+        total += size
+
+    return {"files": files, "dirs": len(dirs), "bytes": total}
+
+
+class Suite:
+    def __init__(self, src, scratch, repeat=3, jobs=4):
+        """
+        *args:
+        src - str: generated source tree (never modified).
+        scratch - str: directory for destinations and move sources.
+
+        **kwargs:
+        repeat - int: runs per benchmark, the fastest one is kept.
+        jobs - int: workers for the parallel modes.
+        """
+        self.src = src
+        self.scratch = scratch
+        self.repeat = repeat
+        self.jobs = jobs
+        self.tf = Timefops(logging.WARNING)
+        self.results = {}
+        self._n = 0
+
+
+    def _tmp(self, name):
+        self._n += 1
+        return os.path.join(self.scratch, f"{name}-{self._n}")
+
+
+    def bench(self, name, func, setup=None, items=None):
+        """Times func(*setup()) 'repeat' times; setup isn't timed."""
+        runs = []
+        for _ in range(self.repeat):
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            out = func(*args)
+            runs.append(time.perf_counter() - start)
+            if items is None and hasattr(out, "__len__"):
+                items = len(out)
+        best = min(runs)
+        self.results[name] = {
+            "seconds": best,
+            "runs": runs,
+            "items": items,
+            "items_per_second": items / best if items and best else None,
+        }
+        print(f"{name:<40} {best:9.4f}s" +
+              (f" {items / best:12.0f} items/s" if items and best else ""),
+              flush=True)
+
+
+    def run(self, only=None):
+        tf, src, fmt = self.tf, [self.src], ["%Y-%m-%d"]
+
+        def selected(name):
+            return not only or any(name.startswith(x) for x in only)
+
+        for recursive in (False, True):
+            mode = "recursive" if recursive else "top"
+            entries = tf.scan(src, recursive=recursive)
+            time_map = tf.path_time_map(src, "mtime", fmt, entries=entries)
+
+            if selected("scan"):
+                self.bench(f"scan/{mode}",
+                           lambda: tf.scan(src, recursive=recursive))
+                if recursive:
+                    self.bench(f"scan/{mode}/walk_threads={self.jobs}",
+                               lambda: tf.scan(src, recursive=True,
+                                               walk_threads=self.jobs))
+            if selected("path_time_map"):
+                self.bench(f"path_time_map/{mode}",
+                           lambda: tf.path_time_map(src, "mtime", fmt,
+                                                    entries=entries))
+            if selected("rename_duplicates"):
+                self.bench(f"rename_duplicates/{mode}",
+                           lambda: tf._rename_duplicates(time_map)[0])
+            if selected("plan"):
+                for stream in (False, True):
+                    self.bench(f"plan/{mode}/stream={stream}",
+                               lambda: list(tf._plan(src, None, "mtime", fmt,
+                                                     stream=stream,
+                                                     recursive=recursive)))
+
+            if selected("copy"):
+                for stream, jobs in ((False, 1), (True, 1),
+                                     (False, self.jobs)):
+                    self.bench(f"copy/{mode}/stream={stream}/jobs={jobs}",
+                               lambda dst: tf.copy(src, dst, "mtime", fmt,
+                                                   stream=stream, jobs=jobs,
+                                                   recursive=recursive),
+                               setup=lambda: (self._mkdir("copy"),),
+                               items=len(entries))
+
+            if selected("move"):
+                for stream in (False, True):
+                    self.bench(f"move/{mode}/stream={stream}",
+                               lambda s, dst: tf.move([s], dst, "mtime", fmt,
+                                                      stream=stream,
+                                                      recursive=recursive),
+                               setup=lambda: (self._copytree(),
+                                              self._mkdir("move")),
+                               items=len(entries))
+
+            if selected("archive"):
+                for kind, kwargs in (
+                        ("tar", {}),
+                        ("tar.gz", {"cmp_sh": "gz"}),
+                        (f"tar.gz/threads={self.jobs}",
+                         {"cmp_sh": "gz", "threads": self.jobs}),
+                        ("zip", {"zip_file": True}),
+                        ("zip.deflate", {"zip_file": True,
+                                         "cmp_sh": "deflate"}),
+                        (f"zip.deflate/threads={self.jobs}",
+                         {"zip_file": True, "cmp_sh": "deflate",
+                          "threads": self.jobs})):
+                    self.bench(f"archive/{mode}/{kind}",
+                               lambda dst: tf.archive(src, dst, "mtime", fmt,
+                                                      recursive=recursive,
+                                                      **kwargs),
+                               setup=lambda: (self._tmp("archive"),),
+                               items=len(entries))
+
+            self._clean()
+        return self.results
+
+
+    def _mkdir(self, name):
+        path = self._tmp(name)
+        os.mkdir(path)
+        return path
+
+
+    def _copytree(self):
+        path = self._tmp("src")
+        shutil.copytree(self.src, path)
+        return path
+
+
+    def _clean(self):
+        for name in os.listdir(self.scratch):
+            path = os.path.join(self.scratch, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+def compare(old, new, threshold):
+    """Prints the speed of 'new' relative to 'old' (result dicts), returns the
+    names of benchmarks more than 'threshold' slower."""
+    slower = []
+    print(f"\n{'benchmark':<40} {'old':>9} {'new':>9}  change")
+    for name, res in new["results"].items():
+        if name not in old["results"]:
+            continue
+        was, now = old["results"][name]["seconds"], res["seconds"]
+        change = now / was - 1 if was else 0.0
+        flag = ""
+        if change > threshold:
+            slower.append(name)
+            flag = "  SLOWER"
+        print(f"{name:<40} {was:8.4f}s {now:8.4f}s {change:+7.1%}{flag}")
+    return slower
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.bench_suite",
+        description="Times timefops on a synthetic tree, saves JSON.")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--dup-rate", type=float, default=0.2,
+                        help="share of files with colliding names")
+    parser.add_argument("--sizes", choices=sorted(SIZES), default="small")
+    parser.add_argument("--spread", type=float, default=365,
+                        help="days the file times are spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 2,
+                        help="workers for the parallel modes")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX",
+                        help="only run benchmarks starting with these, e.g. "
+                             "scan plan copy/recursive")
+    parser.add_argument("--tmp", help="directory for the trees (a fresh "
+                                      "temporary one by default)")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="compare with earlier results, exits with 1 if "
+                             "anything got slower than --threshold")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    params = {k: getattr(args, k) for k in ("files", "depth", "fanout",
+                                            "dup_rate", "sizes", "spread",
+                                            "seed", "repeat", "jobs")}
+    with tempfile.TemporaryDirectory(dir=args.tmp) as tmp:
+        src, scratch = os.path.join(tmp, "src"), os.path.join(tmp, "scratch")
+        os.mkdir(scratch)
+        start = time.perf_counter()
+        tree = make_tree(src, files=args.files, depth=args.depth,
+                         fanout=args.fanout, dup_rate=args.dup_rate,
+                         sizes=args.sizes, spread=args.spread, seed=args.seed)
+        print(f"tree: {tree['files']} files, {tree['dirs']} dirs, "
+              f"{tree['bytes']} bytes ({time.perf_counter() - start:.1f}s)")
+        results = Suite(src, scratch, repeat=args.repeat,
+                        jobs=args.jobs).run(only=args.only)
+
+    out = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "tree": tree,
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(out, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get("params") != params:
+            print("warning: the runs used different parameters.")
+        if compare(old, out, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Benchmarks the parallel zip writer (Timefops._write_zip with several
+processes) against the serial one, on a tree of small files.
+
+usage: python -m tests.bench_zip [num_files] [processes]
+"""
+
+import os
+import sys
+import time
+import zipfile
+import logging
+import tempfile
+from timefops import Timefops
+
+
+def make_tree(root, num, dirs=100):
+    """Writes 'num' small, compressible files spread over 'dirs' folders."""
+    for n in range(num):
+        d = os.path.join(root, f"d{n % dirs}")
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"f{n}.log"), "wb") as f:
+            f.write(f"line {n}\n".encode() * (n % 200 + 20) + os.urandom(64))
+
+
+def main(argv):
+    num = int(argv[0]) if argv else 100000
+    processes = int(argv[1]) if len(argv) > 1 else os.cpu_count() or 2
+    tf = Timefops(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "src")
+        make_tree(src, num)
+        plan = tf._plan([src], None, "mtime", ["%Y-%m-%d"])
+
+        for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_LZMA):
+            out = {}
+            for procs in (1, processes):
+                path = os.path.join(tmp, f"{compression}-{procs}.zip")
+                start = time.perf_counter()
+                with zipfile.ZipFile(path, "x", compression=compression) as z:
+                    tf._write_zip(z, plan, processes=procs)
+                out[procs] = time.perf_counter() - start
+                with open(path, "rb") as f:
+                    out[procs, "data"] = f.read()
+
+            same = out[1, "data"] == out[processes, "data"]
+            print(f"{num} files, compression {compression}: serial "
+                  f"{out[1]:.2f}s, {processes} processes "
+                  f"{out[processes]:.2f}s ({out[1] / out[processes]:.1f}x), "
+                  f"identical: {same}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
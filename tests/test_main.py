@@ -3,11 +3,36 @@
 import unittest
 import unittest.mock as mock
 import os
+import errno
+import stat
 import random
+import time
 import uuid
 import collections
 import logging
-from timefops import Timefops 
+import tempfile
+import shutil
+import io
+import bz2
+import gzip
+import lzma
+import tarfile
+import zipfile
+import asyncio
+import threading
+import json
+import pyzipper
+from timefops import Timefops, AsyncTimefops
+from timefops._scan import Scanner
+from timefops._bucket import BucketFormatter, finest_unit
+from timefops._compress import ParallelWriter, member_compression
+from timefops._transfer import Mover, ordered_map, copy_file
+from timefops._journal import JournalError
+from timefops._dedup import find_duplicates
+from timefops._filter import EntryFilter, parse_time, parse_size
+from timefops._profile import Profiler
+from timefops._shard import parse_shard
+from timefops._cli import cli, run
 
 
 class TestHelpers(unittest.TestCase):
@@ -60,6 +85,960 @@ class TestHelpers(unittest.TestCase):
                                      "{}({})".format(
                                          item, len(dup_dict[v].get(item)) - 1))
 
+    def test_scanner(self):
+        """Checks the entries the scanner builds against os.lstat."""
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "dir"))
+            with open(os.path.join(tmp, "file.txt"), "wb") as f:
+                f.write(b"x" * 100)
+
+            scanner = Scanner()
+            entries = {os.path.basename(e.path): e
+                       for e in scanner.scan([tmp])}
+            self.assertEqual(set(entries), {"dir", "file.txt"})
+            for name, e in entries.items():
+                st = os.lstat(os.path.join(tmp, name))
+                self.assertEqual(e.path, os.path.join(tmp, name))
+                self.assertEqual((e.size, e.atime, e.ctime, e.mtime),
+                                 (st.st_size, st.st_atime, st.st_ctime,
+                                  st.st_mtime))
+                self.assertEqual(e.is_dir, name == "dir")
+                self.assertEqual(e.is_link, stat.S_ISLNK(st.st_mode))
+                self.assertEqual(e.inode, st.st_ino)
+            self.assertEqual(scanner.syscalls["scandir"], 1)
+            self.assertEqual(scanner.syscalls["stat"], 2)
+
+            e = scanner.scan([os.path.join(tmp, "file.txt")],
+                             individual=True)
+            self.assertEqual(next(e), entries["file.txt"])
+
+    def test_taken_names(self):
+        """Enumerated names must not clash with items that already have that
+        name, either in the same batch or in the destination.
+        """
+        with tempfile.TemporaryDirectory() as dst:
+            os.makedirs(os.path.join(dst, "2020", "b.txt"))
+            fn_dict = self.tf._rename_duplicates(collections.OrderedDict((
+                ("x/a.txt", "2020"), ("y/a.txt", "2020"),
+                ("z/a(1).txt", "2020"), ("x/b.txt", "2020"),
+                ("y/b.txt", "2021")
+            )), dst=dst)[0]
+
+        self.assertEqual(fn_dict, {"x/a.txt": "a.txt", "y/a.txt": "a(1).txt",
+                                   "z/a(1).txt": "a(1)(1).txt",
+                                   "x/b.txt": "b(1).txt",
+                                   "y/b.txt": "b.txt"})
+
+
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        self.tf = Timefops(logging.INFO)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = []
+        for n in range(3):
+            self.src.append(os.path.join(self.tmp.name, f"src{n}"))
+            os.mkdir(self.src[-1])
+            for i in range(30):
+                path = os.path.join(self.src[-1], f"f{i % 7}.txt")
+                if not os.path.exists(path):
+                    open(path, "w").close()
+                    ts = random.choice((1.6e9, 1.6e9 + 86400, 1.6e9 + 4e6))
+                    os.utime(path, (ts, ts))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stream_plan(self):
+        """The streaming pipeline must produce the same buckets and names as
+        path_time_map() + _rename_duplicates().
+        """
+        args = (self.src, None, "mtime", ["%Y", "%m-%d"])
+        self.assertEqual(list(self.tf._plan(*args)),
+                         list(self.tf._plan(*args, stream=True)))
+
+    def test_recursive(self):
+        """Walking on several threads must find every nested file, in the
+        same order as a serial walk.
+        """
+        for n in range(40):
+            path = os.path.join(self.src[0], *(f"d{i}" for i in range(n % 5)),
+                                f"n{n}")
+            os.makedirs(path, exist_ok=True)
+            open(os.path.join(path, "f.txt"), "w").close()
+
+        args = (self.src, None, "mtime", ["%Y"])
+        plans = [list(self.tf._plan(*args, recursive=True, walk_threads=t))
+                 for t in (1, 4)]
+        with mock.patch("timefops._scan.READ_AHEAD", 1):
+            plans.append(list(self.tf._plan(*args, recursive=True,
+                                            walk_threads=2)))
+        self.assertEqual(plans[0], plans[1])
+        self.assertEqual(plans[0], plans[2])
+        self.assertEqual(len(plans[0]), 21 + 40)
+        self.assertFalse(any(e.is_dir for e, _, _ in plans[0]))
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "needs symlinks")
+    def test_recursive_symlinks(self):
+        """A recursive walk must not follow a symlinked directory, whatever
+        the number of threads, copy must recreate it as a link, and zip files
+        must hold it as a link member (even when it loops back).
+        """
+        target = os.path.join(self.tmp.name, "elsewhere")
+        os.mkdir(target)
+        open(os.path.join(target, "big.bin"), "w").close()
+        link = os.path.join(self.src[0], "link")
+        os.symlink(target, link)
+
+        args = (self.src, None, "mtime", ["%Y"])
+        for t in (1, 4):
+            plan = list(self.tf._plan(*args, recursive=True, walk_threads=t))
+            linked = [e for e, _, _ in plan if e.path == link]
+            self.assertEqual(len(linked), 1)
+            self.assertTrue(linked[0].is_link)
+            self.assertFalse(linked[0].is_dir)
+            self.assertNotIn("big.bin",
+                             [os.path.basename(e.path) for e, _, _ in plan])
+
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        self.tf.copy(self.src, dst, "mtime", ["%Y"], recursive=True)
+        copied = [os.path.join(r, n) for r, ds, fs in os.walk(dst)
+                  for n in ds + fs if n == "link"]
+        self.assertEqual(len(copied), 1)
+        self.assertEqual(os.readlink(copied[0]), target)
+
+        os.mkdir(os.path.join(self.src[0], "sub"))
+        os.symlink(self.src[0], os.path.join(self.src[0], "sub", "loop"))
+        for recursive, threads in ((True, 1), (False, 1), (False, 2)):
+            dst = os.path.join(self.tmp.name, f"{recursive}{threads}.zip")
+            self.tf.archive([self.src[0]], dst, "mtime", ["%Y"],
+                            zip_file=True, recursive=recursive,
+                            threads=threads)
+            with zipfile.ZipFile(dst) as z:
+                links = {os.path.basename(i.filename): z.read(i).decode()
+                         for i in z.infolist()
+                         if stat.S_ISLNK(i.external_attr >> 16)}
+                names = z.namelist()
+            # without -r, 'link' is a source item, followed like any other
+            self.assertEqual(links, {"link": target, "loop": self.src[0]}
+                                    if recursive else {"loop": self.src[0]})
+            self.assertEqual(len(names), 9 if recursive else 11)
+
+    def test_filters(self):
+        """Filtered items must never make it into the plan, and the filters
+        must read times and sizes the way they're written on the CLI.
+        """
+        self.assertEqual(parse_time("3d", now=1e6), 1e6 - 3 * 86400)
+        self.assertEqual(parse_size("1.5K"), 1536)
+        self.assertRaises(ValueError, parse_time, "yesterday")
+
+        predicate = EntryFilter("mtime", newer=1.6e9 + 3600,
+                                exclude=["f1.*"])
+        for stream in (False, True):
+            plan = list(self.tf._plan(self.src, None, "mtime", ["%Y-%m-%d"],
+                                      stream=stream, predicate=predicate))
+            self.assertTrue(plan)
+            for e, _, _ in plan:
+                self.assertGreaterEqual(e.mtime, 1.6e9 + 3600)
+                self.assertNotEqual(os.path.basename(e.path), "f1.txt")
+        self.assertEqual(len(plan) * 2 + predicate.rejected, 42)
+
+    def test_report(self):
+        """copy must report every item with its folder, name and status, and
+        the totals must add up.
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        copy_item = Timefops._copy_item
+        def copy_or_fail(e, target, **kwargs):
+            if os.path.basename(e.path) == "f3.txt":
+                raise PermissionError(13, "denied", e.path)
+            return copy_item(e, target, **kwargs)
+
+        with mock.patch.object(Timefops, "_copy_item",
+                               staticmethod(copy_or_fail)):
+            report = self.tf.copy(self.src, dst, "mtime", ["%Y-%m-%d"])
+
+        self.assertEqual(len(report), 21)
+        self.assertEqual(report.skipped, 3)
+        self.assertEqual({os.path.basename(r.path) for r in report.failed()},
+                         {"f3.txt"})
+        for r in report:
+            self.assertEqual(os.path.exists(r.target), r.status == "done")
+            self.assertEqual(os.path.dirname(r.target),
+                             os.path.join(dst, r.bucket))
+        self.assertEqual(len(report.renamed()),
+                         21 - len({(r.bucket, os.path.basename(r.path))
+                                   for r in report}))
+        summary = report.summary()
+        self.assertEqual((summary["items"], summary["done"]), (21, 18))
+
+    def test_profile(self):
+        """A profiled copy must time every phase once (makedirs per item),
+        count the items and syscalls, and the phases must not add up to more
+        than the run took.
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        ended = collections.Counter()
+        prof = Profiler(hooks=[lambda phase, seconds: ended.update([phase])])
+        tf = Timefops(logging.WARNING, profiler=prof)
+        start = time.perf_counter()
+        tf.copy(self.src, dst, "mtime", ["%Y-%m-%d"])
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual({k: v[1] for k, v in prof.phases.items()},
+                         {"scan": 1, "bucket": 1, "rename": 1, "copy": 1,
+                          "makedirs": 21})
+        self.assertEqual(ended, {k: v[1] for k, v in prof.phases.items()})
+        self.assertEqual(prof.counters["items"], 21)
+        self.assertEqual(prof.counters["stat"], 21)
+        self.assertLessEqual(sum(v[0] for v in prof.phases.values()), elapsed)
+
+    def test_progress(self):
+        """Without a terminal, progress must be written as JSON lines, the
+        last one with the plan's totals all done.
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        with mock.patch("sys.stderr", new_callable=io.StringIO) as err:
+            report = self.tf.copy(self.src, dst, "mtime", ["%Y-%m-%d"],
+                                  progress=True)
+        last = json.loads(err.getvalue().splitlines()[-1])
+        self.assertTrue(last["done"])
+        self.assertEqual((last["items"], last["total_items"]), (21, 21))
+        self.assertEqual((last["bytes_left"], last["skipped"]), (0, 0))
+        self.assertEqual(last["bytes"], report.bytes)
+
+    def test_journal(self):
+        """A move stopped halfway must resume from its journal with the
+        names planned the first time, even though the leftover sources
+        would now be named differently, and the journal must go once done.
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        journal = os.path.join(self.tmp.name, "move.journal")
+        args = (self.src, dst, "mtime", ["%Y-%m-%d"])
+        expected = {(p, name) for _, p, name in self.tf._plan(*args)}
+
+        move = Mover.move
+        calls = [0]
+        def move_or_stop(mover, *a):
+            calls[0] += 1
+            if calls[0] > 8:
+                raise KeyboardInterrupt
+            return move(mover, *a)
+
+        with mock.patch.object(Mover, "move", move_or_stop):
+            with self.assertRaises(KeyboardInterrupt):
+                self.tf.move(*args, journal=journal)
+        self.assertTrue(os.path.exists(journal))
+        with self.assertRaises(JournalError):
+            self.tf.copy(*args, journal=journal)
+
+        self.tf.move(*args, journal=journal)
+        self.assertFalse(os.path.exists(journal))
+        self.assertEqual({(p, name) for p in os.listdir(dst)
+                          for name in os.listdir(os.path.join(dst, p))},
+                         expected)
+
+    def test_existing_target(self):
+        """A copy must never replace what is already at its target, unless
+        it is an earlier copy of the same item (see StateDB.replacing).
+        """
+        user = os.path.join(self.tmp.name, "dst", "f0.txt")
+        os.makedirs(user)
+        open(os.path.join(user, "keep.txt"), "w").close()
+        scanner = Scanner()
+        e = scanner.stat(os.path.join(self.src[0], "f0.txt"))
+        with self.assertRaises(FileExistsError):
+            Timefops._copy_item(e, user)
+        self.assertEqual(os.listdir(user), ["keep.txt"])
+
+        Timefops._copy_item(scanner.stat(self.src[1]), user, replace=True)
+        self.assertEqual(sorted(os.listdir(user)),
+                         sorted(os.listdir(self.src[1])))
+        self.assertEqual(os.listdir(os.path.dirname(user)), ["f0.txt"])
+
+    def test_plan_file(self):
+        """A plan written to a file must run later without scanning the
+        sources again, with the names it was planned with.
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        plan = os.path.join(self.tmp.name, "copy.plan")
+        args = (self.src, dst, "mtime", ["%Y-%m-%d"])
+        expected = {(p, name) for _, p, name in self.tf._plan(*args)}
+
+        self.assertIsNone(self.tf.copy(*args, plan_out=plan))
+        self.assertEqual(os.listdir(dst), [])
+        # would change the names if the sources were planned again
+        open(os.path.join(self.src[0], "f0(1).txt"), "w").close()
+
+        profiler = Profiler()
+        tf = Timefops(logging.WARNING, profiler=profiler)
+        report = tf.execute(plan, jobs=2)
+        self.assertEqual(report.done, len(expected))
+        self.assertNotIn("scandir", profiler.counters)
+        self.assertEqual({(p, name) for p in os.listdir(dst)
+                          for name in os.listdir(os.path.join(dst, p))},
+                         expected)
+
+    def test_stale_plan(self):
+        """Running a plan must never replace what is already at a target
+        (here, the destination got an item of the same name after the plan
+        was written).
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        os.mkdir(dst)
+        plan = os.path.join(self.tmp.name, "copy.plan")
+        args = (self.src, dst, "mtime", ["%Y-%m-%d"])
+        _, p, name = next(iter(self.tf._plan(*args)))
+        self.tf.copy(*args, plan_out=plan)
+
+        user = os.path.join(dst, p, name)
+        os.makedirs(user)
+        open(os.path.join(user, "keep.txt"), "w").close()
+        tf = Timefops(logging.ERROR)
+        report = tf.execute(plan)
+        self.assertEqual(len(report.failed()), 1)
+        self.assertEqual(tf.num_warn, 1)
+        self.assertEqual(os.listdir(user), ["keep.txt"])
+
+    def test_shards(self):
+        """Shards must split the plan into disjoint sets of whole time strs
+        with the names of the unsharded plan, whether streamed or not.
+        """
+        args = (self.src, None, "mtime", ["%Y-%m-%d"])
+        plan = self.tf._plan(*args)
+        for stream in (False, True):
+            shards = [list(self.tf._plan(*args, stream=stream,
+                                         shard=(k, 3)))
+                      for k in (1, 2, 3)]
+            self.assertEqual(sorted(x for s in shards for x in s),
+                             sorted(plan))
+            buckets = [{p for _, p, _ in s} for s in shards]
+            self.assertFalse(buckets[0] & buckets[1] or
+                             buckets[1] & buckets[2] or
+                             buckets[0] & buckets[2])
+        self.assertRaises(ValueError, parse_shard, "3/2")
+
+    def test_incremental(self):
+        """Items copied by an earlier run with the same state file must be
+        skipped, unless they changed; changed ones replace their old copy.
+        """
+        dst = os.path.join(self.tmp.name, "dst")
+        state = os.path.join(self.tmp.name, "state.db")
+        os.mkdir(dst)
+        args = (self.src, dst, "mtime", ["%Y-%m-%d"])
+
+        self.tf.copy(*args, state=state)
+        copies = sorted(os.path.join(r, f) for r, _, fs in os.walk(dst)
+                        for f in fs)
+        self.assertEqual(len(copies), 21)
+        for path in copies:
+            os.remove(path)
+
+        self.tf.copy(*args, state=state)
+        self.assertEqual(sum(len(fs) for _, _, fs in os.walk(dst)), 0)
+
+        changed = os.path.join(self.src[0], "f0.txt")
+        st = os.stat(changed)
+        with open(changed, "w") as f:
+            f.write("changed")
+        os.utime(changed, (st.st_atime, st.st_mtime))
+        self.tf.copy(*args, state=state)
+        copied = [os.path.join(r, f) for r, _, fs in os.walk(dst) for f in fs]
+        self.assertEqual(len(copied), 1)
+        self.assertIn(copied[0], copies)
+        with open(copied[0]) as f:
+            self.assertEqual(f.read(), "changed")
+
+
+class TestTransfer(unittest.TestCase):
+    def test_ordered_map(self):
+        """Results from the worker pool must come back in input order, with
+        exceptions attached to the item that raised them.
+        """
+        def work(n):
+            if n % 5 == 0:
+                raise PermissionError(n)
+            return n * 2
+
+        results = list(ordered_map(work, ((n,) for n in range(100)), jobs=8,
+                                   depth=3))
+        self.assertEqual([item for item, _, _ in results],
+                         [(n,) for n in range(100)])
+        for (n,), result, exc in results:
+            if n % 5 == 0:
+                self.assertIsInstance(exc, PermissionError)
+            else:
+                self.assertEqual(result, n * 2)
+
+    def test_copy_file(self):
+        """Files must be copied intact (with their times), whichever method
+        ends up being used.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            with open(src, "wb") as f:
+                f.write(os.urandom(300000))
+            os.utime(src, (1.6e9, 1.6e9))
+
+            how = copy_file(src, os.path.join(tmp, "dst"))
+            with open(src, "rb") as f, open(os.path.join(tmp, "dst"),
+                                            "rb") as g:
+                self.assertEqual(f.read(), g.read())
+            self.assertEqual(os.path.getmtime(os.path.join(tmp, "dst")), 1.6e9)
+            self.assertIn(how, ("reflink", "copy_file_range", "sendfile",
+                                "buffered"))
+
+    def test_mover(self):
+        """Moves must land in the right folders with only max_fds directory
+        fds open at a time, and fall back to shutil.move on EXDEV.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            dst = os.path.join(tmp, "dst")
+            os.mkdir(dst)
+            moves = []
+            for n in range(12):
+                src_dir = os.path.join(tmp, f"src{n % 4}")
+                os.makedirs(src_dir, exist_ok=True)
+                path = os.path.join(src_dir, f"f{n}")
+                with open(path, "w") as f:
+                    f.write(str(n))
+                moves.append((path, f"d{n % 3}", f"g{n}"))
+
+            rename, move = os.rename, shutil.move
+            in_move = []
+            def cross_device(*a, **kw):
+                # Mover's own rename fails, the one in shutil.move goes on
+                if not in_move:
+                    raise OSError(errno.EXDEV, "cross-device link")
+                return rename(*a, **kw)
+            def fallback(*a):
+                in_move.append(a)
+                try:
+                    return move(*a)
+                finally:
+                    in_move.pop()
+
+            with Mover(dst, max_fds=2) as mover:
+                for i, (path, folder, name) in enumerate(moves):
+                    if i < 6:
+                        mover.move(path, folder, name)
+                        # 7 distinct folders go through 2 cached fds
+                        self.assertEqual(len(mover._fds),
+                                         2 if mover._use_fds else 0)
+                    else:
+                        with mock.patch("os.rename", cross_device), \
+                             mock.patch("shutil.move", fallback):
+                            mover.move(path, folder, name)
+                    self.assertLessEqual(len(mover._fds), 2)
+            self.assertEqual(mover._fds, {})
+            self.assertEqual(mover.fallbacks, 6)
+            self.assertEqual(mover.dirs.made, {os.path.join(dst, f"d{n}")
+                                               for n in range(3)})
+            for path, folder, name in moves:
+                self.assertFalse(os.path.exists(path))
+                with open(os.path.join(dst, folder, name)) as f:
+                    self.assertEqual(f.read(), name[1:])
+
+            # the last move finds s2 cached and d3 not: s2, used last, must
+            # stay open while d3 is opened (evicting d2 instead)
+            for d, names in (("s1", "y"), ("s2", "xy")):
+                os.mkdir(os.path.join(tmp, d))
+                for name in names:
+                    with open(os.path.join(tmp, d, name), "w") as f:
+                        f.write(d + name)
+            with Mover(dst, max_fds=2) as mover:
+                mover.move(os.path.join(tmp, "s1", "y"), "d3", "y")
+                mover.move(os.path.join(tmp, "s2", "x"), "d2", "x")
+                mover.move(os.path.join(tmp, "s2", "y"), "d3", "y(1)")
+            for folder, name, data in (("d3", "y", "s1y"), ("d2", "x", "s2x"),
+                                       ("d3", "y(1)", "s2y")):
+                with open(os.path.join(dst, folder, name)) as f:
+                    self.assertEqual(f.read(), data)
+
+
+    def test_dedup(self):
+        """Only files with the same content are duplicates; they must end up
+        hardlinked to the first copy, or as hardlink members of the archive.
+        """
+        tf = Timefops(logging.WARNING)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            data = os.urandom(200000)
+            # same size and the same first 64 KiB, different content
+            contents = {"a": data, "b": data, "c": data[:-1] + b"x",
+                        "d": data, "e": b"e" * 10}
+            for name, content in contents.items():
+                with open(os.path.join(src, name), "wb") as f:
+                    f.write(content)
+
+            entries = [e for e, _, _ in tf._plan([src], None, "mtime",
+                                                  ["%Y"])]
+            links = find_duplicates(entries, jobs=2)
+            duplicates = {os.path.basename(p) for p in links}
+            originals = {os.path.basename(p) for p in links.values()}
+            self.assertEqual(len(duplicates), 2)
+            self.assertEqual(len(originals), 1)
+            self.assertEqual(duplicates | originals, set("abd"))
+
+            dst = os.path.join(tmp, "dst")
+            os.mkdir(dst)
+            report = tf.copy([src], dst, "mtime", ["%Y"], dedup=True, jobs=2)
+            self.assertEqual(report.done, 5)
+            folder = os.path.join(dst, os.listdir(dst)[0])
+            inodes = {n: os.stat(os.path.join(folder, n)).st_ino
+                      for n in contents}
+            self.assertEqual(inodes["a"], inodes["b"])
+            self.assertEqual(inodes["a"], inodes["d"])
+            self.assertEqual(len(set(inodes.values())), 3)
+
+            tf.archive([src], os.path.join(tmp, "a.tar"), "mtime", ["%Y"],
+                       dedup=True)
+            with tarfile.open(os.path.join(tmp, "a.tar")) as t:
+                self.assertEqual(sum(m.islnk() for m in t), 2)
+                for name, content in contents.items():
+                    member = next(m for m in t
+                                  if os.path.basename(m.name) == name)
+                    self.assertEqual(t.extractfile(member).read(), content)
+
+
+class TestAsync(unittest.TestCase):
+    def test_async_copy(self):
+        """The async API must give the same results as the sync one, and
+        stop between items when the consumer goes away.
+        """
+        async def run(atf, src, dst, stop=None):
+            events = atf.copy([src], dst, "mtime", ["%Y"])
+            got = []
+            async for event in events:
+                got.append(event)
+                if len(got) == stop:
+                    break
+            await events.aclose()
+            return got
+
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            for n in range(50):
+                with open(os.path.join(src, f"f{n}"), "wb") as f:
+                    f.write(b"timefops" * n)
+            for d in ("sync", "async", "stopped"):
+                os.mkdir(os.path.join(tmp, d))
+
+            sync = os.path.join(tmp, "sync")
+            Timefops(logging.INFO).copy([src], sync, "mtime", ["%Y"])
+            atf = AsyncTimefops(logging.INFO)
+            events = asyncio.run(run(atf, src, os.path.join(tmp, "async")))
+            self.assertEqual(
+                sorted(os.path.relpath(e.target, os.path.join(tmp, "async"))
+                       for e in events),
+                sorted(os.path.relpath(os.path.join(r, f), sync)
+                       for r, _, fs in os.walk(sync) for f in fs))
+
+            copy_item = Timefops._copy_item
+            def slow_copy(e, target, **kwargs):
+                time.sleep(0.01)
+                return copy_item(e, target, **kwargs)
+
+            with mock.patch.object(Timefops, "_copy_item",
+                                   staticmethod(slow_copy)):
+                asyncio.run(run(atf, src, os.path.join(tmp, "stopped"),
+                                stop=5))
+            copied = sum(len(fs) for _, _, fs in
+                         os.walk(os.path.join(tmp, "stopped")))
+            self.assertGreaterEqual(copied, 5)
+            self.assertLess(copied, 50)
+            atf.close()
+
+    def test_async_archive_cancel(self):
+        """Cancelling an archive must remove what the run made (every
+        volume and index, under the sharded names) and nothing else, even
+        if it is cancelled before it started.
+        """
+        async def run(atf, dst, stop, **kwargs):
+            events = atf.archive([src], dst, "mtime", ["%Y-%m-%d"], **kwargs)
+            got = 0
+            async for _ in events:
+                got += 1
+                if got == stop:
+                    break
+            await events.aclose()
+
+        async def cancel_queued(atf, dst):
+            # the only worker is busy, so the run is cancelled while queued
+            busy = threading.Event()
+            atf._executor.submit(busy.wait)
+            task = asyncio.ensure_future(run(atf, dst, None))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            threading.Timer(0.05, busy.set).start()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            for n in range(20):
+                path = os.path.join(src, f"f{n}")
+                with open(path, "wb") as f:
+                    f.write(b"timefops" * n)
+                os.utime(path, (1.6e9 + 86400 * n,) * 2)
+            mine = os.path.join(tmp, "logs.tar")
+            with open(mine, "w") as f:
+                f.write("keep")
+
+            def slow(add):
+                def slow_add(*args, **kwargs):
+                    time.sleep(0.01)
+                    return add(*args, **kwargs)
+                return slow_add
+
+            atf = AsyncTimefops(logging.CRITICAL, max_workers=1)
+            asyncio.run(cancel_queued(atf, mine))
+            with mock.patch.object(tarfile.TarFile, "add",
+                                   slow(tarfile.TarFile.add)), \
+                 mock.patch.object(zipfile.ZipFile, "write",
+                                   slow(zipfile.ZipFile.write)):
+                asyncio.run(run(atf, os.path.join(tmp, "one.tar"), 3,
+                                index=True, shard=(2, 2)))
+                asyncio.run(run(atf, os.path.join(tmp, "one.zip"), 3,
+                                zip_file=True))
+                asyncio.run(run(atf, mine, 3, split=True, index=True,
+                                shard=(1, 2)))
+            atf.close()
+            self.assertEqual(sorted(os.listdir(tmp)), ["logs.tar", "src"])
+            with open(mine) as f:
+                self.assertEqual(f.read(), "keep")
+
+
+class TestCompression(unittest.TestCase):
+    def test_parallel_blocks(self):
+        """Blocks compressed in parallel must decompress (as one stream) to
+        exactly what was written.
+        """
+        data = os.urandom(50000) * 7
+        for cmp_sh, mod in (("gz", gzip), ("bz2", bz2), ("xz", lzma)):
+            out = io.BytesIO()
+            with ParallelWriter(out, cmp_sh, 4, block_size=4096) as w:
+                for n in range(0, len(data), 1000):
+                    w.write(data[n:n + 1000])
+                self.assertEqual(w.tell(), len(data))
+            self.assertGreater(w.blocks, 1)
+            self.assertEqual(mod.decompress(out.getvalue()), data)
+
+    def test_parallel_zip(self):
+        """Zip files written by the worker processes must be byte for byte
+        the same as the ones written serially.
+        """
+        tf = Timefops(logging.INFO)
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "src", "sub"))
+            for n in range(20):
+                with open(os.path.join(tmp, "src", "sub" if n % 2 else "",
+                                       f"f{n}"), "wb") as f:
+                    f.write(b"timefops" * n * 100)
+
+            out = []
+            for processes in (1, 2):
+                buf = io.BytesIO()
+                with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+                    tf._write_zip(z, tf._plan([os.path.join(tmp, "src")], None,
+                                              "mtime", ["%Y"]),
+                                  processes=processes)
+                out.append(buf.getvalue())
+            self.assertEqual(out[0], out[1])
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "needs FIFOs")
+    def test_zip_item_order(self):
+        """Items must be reported in plan order, once their members are in
+        the archive, whether they are written serially or not; items without
+        any member (a FIFO) too.
+        """
+        tf = Timefops(logging.INFO)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            for n in range(200):
+                if n % 10:
+                    with open(os.path.join(src, f"f{n}"), "wb") as f:
+                        f.write(b"timefops" * n)
+                else:
+                    os.mkfifo(os.path.join(src, f"p{n}"))
+            plan = list(tf._plan([src], None, "mtime", ["%Y"]))
+
+            orders = []
+            for processes in (1, 2):
+                got = []
+                with zipfile.ZipFile(io.BytesIO(), "w") as z:
+                    def on_item(e, zp, exc):
+                        got.append(zp)
+                        if os.path.basename(zp).startswith("f"):
+                            self.assertIn(zp, z.namelist())
+                    tf._write_zip(z, plan, processes=processes,
+                                  on_item=on_item)
+                orders.append(got)
+            self.assertEqual(orders[0], [os.path.join(p, name)
+                                         for _, p, name in plan])
+            self.assertEqual(orders[0], orders[1])
+
+    def test_zip_round_trip(self):
+        """Stored, deflated and AES-encrypted members written by the worker
+        processes must pass testzip() and read back (decrypted), and so
+        must the serial fallback used when zipfile internals don't fit.
+        """
+        tf = Timefops(logging.WARNING)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            data = {}
+            for name in ("a.txt", "b.jpg", "c.log"):
+                data[name] = os.urandom(500) + name.encode() * 3000
+                with open(os.path.join(src, name), "wb") as f:
+                    f.write(data[name])
+
+            runs = [("plain", None, True), ("aes", 256, True),
+                    ("fallback", 128, False)]
+            for tag, nbits, supported in runs:
+                dst = os.path.join(tmp, f"{tag}.zip")
+                with mock.patch("timefops.timefops.can_write_members",
+                                return_value=supported):
+                    tf.archive([src], dst, "mtime", ["%Y"], cmp_sh="deflate",
+                               zip_file=True, threads=2,
+                               aes_zip_create=("pw", nbits) if nbits else ())
+                with pyzipper.AESZipFile(dst) as z:
+                    z.setpassword(b"pw")
+                    self.assertIsNone(z.testzip())
+                    got = {os.path.basename(i.filename):
+                           (i.compress_type, i.flag_bits & 1, z.read(i))
+                           for i in z.infolist()}
+                self.assertEqual({k: v[2] for k, v in got.items()}, data)
+                self.assertEqual(got["b.jpg"][0], zipfile.ZIP_STORED)
+                self.assertEqual(got["a.txt"][0], zipfile.ZIP_DEFLATED)
+                self.assertEqual({v[1] for v in got.values()},
+                                 {bool(nbits)})
+
+    def test_zip_compression(self):
+        """Members get the archive's compression, except for the stored
+        extensions, whether they are written serially or not.
+        """
+        self.assertEqual(member_compression("a/b.JPG", zipfile.ZIP_LZMA),
+                         zipfile.ZIP_STORED)
+        self.assertEqual(member_compression("a/b.txt", zipfile.ZIP_LZMA),
+                         zipfile.ZIP_LZMA)
+        self.assertEqual(member_compression("a/b.jpg", zipfile.ZIP_LZMA,
+                                            stored=()), zipfile.ZIP_LZMA)
+
+        tf = Timefops(logging.INFO)
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "src"))
+            for name in ("a.txt", "b.jpg"):
+                with open(os.path.join(tmp, "src", name), "wb") as f:
+                    f.write(b"timefops" * 1000)
+
+            for processes in (1, 2):
+                dst = os.path.join(tmp, f"{processes}.zip")
+                tf.archive([os.path.join(tmp, "src")], dst, "mtime", ["%Y"],
+                           cmp_sh="deflate", zip_file=True,
+                           threads=processes, level=1)
+                with zipfile.ZipFile(dst) as z:
+                    types = {os.path.basename(i.filename): i.compress_type
+                             for i in z.infolist()}
+                self.assertEqual(types, {"a.txt": zipfile.ZIP_DEFLATED,
+                                         "b.jpg": zipfile.ZIP_STORED})
+
+    def test_aes_dry_run(self):
+        """-z -zp --dry-run must not prompt or encode a password, with and
+        without --split.
+        """
+        tf = Timefops(logging.WARNING)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            open(os.path.join(src, "a.txt"), "w").close()
+            for extra in ([], ["--split"]):
+                args = cli(["mtime", "archive", src, "-a",
+                            os.path.join(tmp, "out"), "-z", "-zp",
+                            "--dry-run"] + extra)
+                self.assertIs(args.zip_password, True)
+                run(tf, args)
+            self.assertEqual(os.listdir(tmp), ["src"])
+
+    def test_aes_tar(self):
+        """-zp without -z has nothing to encrypt: tar archives are written
+        as usual, the password is never encoded.
+        """
+        tf = Timefops(logging.WARNING)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            open(os.path.join(src, "a.txt"), "w").close()
+            for extra in (["--dry-run"], ["--dry-run", "--split"], [],
+                          ["--split"]):
+                dst = os.path.join(tmp, f"out{len(extra)}.tar")
+                with mock.patch("getpass.getpass", return_value="secret"):
+                    args = cli(["mtime", "archive", src, "-a", dst,
+                                "-zp"] + extra)
+                with mock.patch.object(pyzipper, "AESZipFile") as aes:
+                    run(tf, args)
+                aes.assert_not_called()
+            names = sorted(os.listdir(tmp))
+            self.assertEqual(len(names), 3)
+            for name in names[:-1]:
+                with tarfile.open(os.path.join(tmp, name)) as t:
+                    self.assertEqual(len(t.getnames()), 1)
+
+    def test_split(self):
+        """Split archives must hold exactly the members of the single archive,
+        one time str per file, within the volume size.
+        """
+        tf = Timefops(logging.WARNING)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            for n in range(30):
+                path = os.path.join(src, f"f{n}.txt")
+                with open(path, "wb") as f:
+                    f.write(b"x" * 1000)
+                os.utime(path, (1.6e9 + 86400 * (n % 3),) * 2)
+
+            tf.archive([src], os.path.join(tmp, "all.tar"), "mtime",
+                       ["%Y-%m-%d"])
+            report = tf.archive([src], os.path.join(tmp, "day.tar.gz"),
+                                "mtime", ["%Y-%m-%d"], cmp_sh="gz",
+                                split=True, volume_size=4000, threads=2)
+            self.assertEqual(report.done, 30)
+
+            with tarfile.open(os.path.join(tmp, "all.tar")) as t:
+                expected = sorted(t.getnames())
+            names = []
+            volumes = [x for x in os.listdir(tmp) if x.startswith("day-")]
+            self.assertEqual(len(volumes), 9)
+            for vol in volumes:
+                with tarfile.open(os.path.join(tmp, vol)) as t:
+                    members = t.getmembers()
+                self.assertLessEqual(sum(m.size for m in members), 4000)
+                self.assertEqual(len({os.path.dirname(m.name)
+                                      for m in members}), 1)
+                self.assertTrue(vol.startswith(
+                    f"day-{os.path.dirname(members[0].name)}"))
+                names.extend(m.name for m in members)
+            self.assertEqual(sorted(names), expected)
+
+    def test_index(self):
+        """Members extracted through the index (by seeking to their offset, or
+        to their block) must be the ones archived, for tar and zip.
+        """
+        tf = Timefops(logging.WARNING)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.mkdir(src)
+            data = {}
+            for n in range(12):
+                data[f"f{n}"] = os.urandom(200000)
+                path = os.path.join(src, f"f{n}")
+                with open(path, "wb") as f:
+                    f.write(data[f"f{n}"])
+                os.utime(path, (1.6e9 + 86400 * 40 * (n % 2),) * 2)
+
+            for dst, kwargs in (("a.tar", {}), ("a.tar.gz", {"cmp_sh": "gz"}),
+                                ("a.zip", {"cmp_sh": "deflate",
+                                           "zip_file": True})):
+                dst = os.path.join(tmp, dst)
+                tf.archive([src], dst, "mtime", ["%Y-%m"], index=True,
+                           **kwargs)
+                buckets = tf.list_archive(dst)
+                self.assertEqual([b["members"] for b in buckets], [6, 6])
+
+                out = os.path.join(tmp, "out")
+                for b in buckets:
+                    names = tf.extract(dst, out, bucket=b["bucket"])
+                    self.assertEqual(len(names), 6)
+                names.append(tf.extract(dst, out, members=[names[0]])[0])
+                for name in names:
+                    with open(os.path.join(out, name), "rb") as f:
+                        self.assertEqual(f.read(),
+                                         data[os.path.basename(name)])
+                shutil.rmtree(out)
+
+
+class TestBuckets(unittest.TestCase):
+    def test_finest_unit(self):
+        """Makes sure the finest time unit of a format is detected, and that
+        formats which can't be truncated are rejected.
+        """
+        self.assertEqual(finest_unit(["%Y", "%m", "%d"]), "day")
+        self.assertEqual(finest_unit(["%Y-%m", "%I:%M%p"]), "minute")
+        self.assertEqual(finest_unit(["%-d %B"]), "day")
+        self.assertIsNone(finest_unit(["static"]))
+        self.assertRaises(ValueError, finest_unit, ["%S.%f"])
+
+    def test_cached_names(self):
+        """Cached folder names must be identical to plain strftime output."""
+        for fmt in (["%Y", "%m", "%d"], ["%Y-%m-%d"], ["%I:%M%p"],
+                    ["%H:%M:%S"], ["%S.%f"], ["%Y", "week %W"]):
+            bucket = BucketFormatter(fmt, maxsize=64)
+            for _ in range(2000):
+                ts = random.uniform(0, 2e9)
+                self.assertEqual(bucket(ts), bucket.strftime(ts))
+                self.assertEqual(bucket(ts + 1), bucket.strftime(ts + 1))
+
+    @unittest.skipUnless(hasattr(time, "tzset"), "needs time.tzset")
+    def test_dst_change(self):
+        """A slot with a DST change inside it (St. John's switched at 00:01
+        local time) must not be cached."""
+        tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/St_Johns"
+        time.tzset()
+        try:
+            for ts, fmt in ((1099190034.99, ["%Y", "%m", "%d"]),
+                            (972786937, ["%H"]),
+                            (972786937, ["%Y-%m-%d %H"]),
+                            (891747344, ["%I%p"])):
+                bucket = BucketFormatter(fmt)
+                self.assertEqual(bucket(ts), bucket.strftime(ts))
+            self.assertEqual(BucketFormatter(["%Y-%m-%d"])(1099190034.99),
+                             "2004-10-30")
+        finally:
+            if tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = tz
+            time.tzset()
+
+
+class TestLogging(unittest.TestCase):
+    def test_handlers(self):
+        """Loggers must keep one handler however many instances use them,
+        disabled levels must not emit, and JSON lines must be written through
+        the queue once the listener stops.
+        """
+        name = f"timefops.test.{uuid.uuid4().hex}"
+        Timefops(logging.INFO, name=name)
+        log = Timefops(logging.INFO, name=name, log_json=True).log
+        self.assertEqual(len(log.handlers), 1)
+        out = io.StringIO()
+        log.handlers[0].setStream(out)
+        log.verbose("hidden")
+        log.success("done: %s", "x")
+        self.assertEqual([(r["level"], r["message"]) for r in
+                          map(json.loads, out.getvalue().splitlines())],
+                         [("SUCCESS", "done: x")])
+
+        log = Timefops(logging.DEBUG, name=name, log_json=True,
+                       log_queue=True).log
+        out = io.StringIO()
+        log.handlers[0]._timefops.handlers[0].setStream(out)
+        log.verbose("queued")
+        Timefops(logging.INFO, name=name)
+        self.assertEqual(len(log.handlers), 1)
+        self.assertEqual(json.loads(out.getvalue())["message"], "queued")
+
 
 if __name__ == '__main__':
     unittest.main()
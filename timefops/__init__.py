@@ -1,4 +1,4 @@
-__all__ = ["Timefops"]
+__all__ = ["Timefops", "AsyncTimefops"]
 __author__ = "stiftcast"
 __license__ = "GPLv3"
 __version__ = "0.3"
@@ -8,3 +8,4 @@ TRANSLATIONS = {"atime": "access-time",
                 "mtime": "modified-time"}
 
 from .timefops import Timefops
+from ._async import AsyncTimefops
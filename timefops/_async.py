@@ -0,0 +1,159 @@
+"""asyncio interface for timefops.
+    AsyncTimefops runs the regular (blocking) Timefops operations on its own
+    thread pool, so they never block the event loop, and hands their
+    progress back to the loop as a stream of ItemEvents.  The planning,
+    bucketing and renaming are the sync code's, results are identical.
+"""
+
+import os
+import errno
+import asyncio
+import threading
+import contextlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from .timefops import Timefops
+
+
+ItemEvent = collections.namedtuple("ItemEvent", ("entry", "target", "error"))
+
+
+class OperationCancelled(Exception):
+    """Raised inside the worker thread to stop an operation between items."""
+
+
+class AsyncTimefops:
+    def __init__(self, log_level, color=True, name=__name__, max_workers=4,
+                 profiler=None, log_json=False, log_queue=True):
+        """
+        *args:
+        log_level - int: logging level.
+
+        **kwargs:
+        color - bool: coloured log output.
+        name - str: logger name.
+        max_workers - int: number of operations running at the same time,
+                      further ones wait for a free worker.
+        profiler - _profile.Profiler (optional): see Timefops.
+        log_json - bool: see Timefops.
+        log_queue - bool: see Timefops; on by default, so operations on
+                    the pool don't block on the log stream.
+
+        Every operation is an async generator of ItemEvents, one per item
+        (entry, target path, error or None):
+
+            async for event in atf.copy(src, dst, "mtime", ["%Y-%m-%d"]):
+                ...
+
+        Cancelling the consuming task (or closing the generator) stops the
+        operation between two items: items already being transferred are
+        finished, nothing new is started, and the files the run made are
+        removed, so the destination only ever holds complete items.
+        """
+        self.tf = Timefops(log_level, color=color, name=name,
+                           profiler=profiler, log_json=log_json,
+                           log_queue=log_queue)
+        self.log = self.tf.log
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+
+    async def _run(self, func, *args, cleanup=None, **kwargs):
+        """Runs 'func' (a Timefops operation) on the pool, yielding the
+        ItemEvents it reports.  'cleanup' is called on the pool if the
+        operation was cancelled."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def on_item(entry, target, error):
+            loop.call_soon_threadsafe(queue.put_nowait,
+                                      ItemEvent(entry, target, error))
+            if stop.is_set():
+                raise OperationCancelled()
+
+        def run():
+            try:
+                if stop.is_set():
+                    raise OperationCancelled()
+                return func(*args, on_item=on_item, **kwargs)
+            except OperationCancelled:
+                if cleanup is not None:
+                    cleanup()
+                raise
+            except SystemExit:
+                # move refuses to cross filesystems
+                raise OSError(errno.EXDEV, "source and destination are on "
+                                           "different filesystems") from None
+
+        fut = loop.run_in_executor(self._executor, run)
+        fut.add_done_callback(lambda _: queue.put_nowait(done))
+
+        try:
+            while True:
+                event = await queue.get()
+                if event is done:
+                    break
+                yield event
+            await fut
+        finally:
+            if not fut.done():
+                stop.set()
+                try:
+                    await asyncio.shield(fut)
+                except OperationCancelled:
+                    pass
+
+
+    def move(self, src, dst, method, fmt, **kwargs):
+        """Async version of Timefops.move (same arguments)."""
+        return self._run(self.tf.move, src, dst, method, fmt, **kwargs)
+
+
+    def copy(self, src, dst, method, fmt, **kwargs):
+        """Async version of Timefops.copy (same arguments)."""
+        return self._run(self.tf.copy, src, dst, method, fmt, **kwargs)
+
+
+    def execute(self, path, **kwargs):
+        """Async version of Timefops.execute (same arguments)."""
+        return self._run(self.tf.execute, path, **kwargs)
+
+
+    def archive(self, src, dst, method, fmt, **kwargs):
+        """Async version of Timefops.archive (same arguments).  If it is
+        cancelled, the files the run made (archive or volumes, and indexes)
+        are removed; nothing that was there before is touched."""
+        created = []
+        def cleanup():
+            for path in created:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+        return self._run(self.tf.archive, src, dst, method, fmt,
+                         cleanup=cleanup, created=created, **kwargs)
+
+
+    async def wait(self, events):
+        """
+        *args:
+        events - async iterator: an operation's events.
+
+        Runs an operation to the end.
+
+        Returns:
+        list - ItemEvents of the items that were skipped (error not None).
+        """
+        return [e async for e in events if e.error is not None]
+
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,116 @@
+"""Time-to-folder-name conversion for timefops.
+    The '--format' list is compiled once into a BucketFormatter, which works
+    out the finest time unit the format depends on and caches folder names
+    per truncated timestamp, so strftime only runs once per distinct bucket.
+"""
+
+import re
+import time
+from datetime import datetime as dt
+
+
+# strftime directives, by the finest time unit they depend on.
+UNITS = {
+    "second": "ScTXrs",
+    "minute": "MR",
+    "hour": "HIlkpPzZ",
+    "day": "daAwuejUWVxDFGg",
+    "month": "mbBh",
+    "year": "YyC",
+    None: "%nt",
+}
+
+_DIRECTIVE = re.compile(r"%[-_0^#]*(.)")
+
+# Width of a cache slot (in seconds) for each unit.  No bucket coarser than an
+# hour can change inside a 15 minute slot, as long as the UTC offset is a
+# multiple of 15 minutes (true for every zone in use today).
+_SLOT_WIDTH = {"second": 1, "minute": 60, "hour": 900, "day": 900,
+               "month": 900, "year": 900}
+
+_ORDER = ("second", "minute", "hour", "day", "month", "year")
+
+
+def finest_unit(fmt):
+    """
+    *args:
+    fmt - list: datetime format identifiers.
+
+    Returns the finest time unit used by 'fmt' ('second' ... 'year'), None if
+    the format doesn't depend on the time at all, or raises ValueError if it
+    contains a directive that can't be truncated (%f or an unknown one).
+    """
+    found = set()
+    for sub_fmt in fmt:
+        for directive in _DIRECTIVE.findall(sub_fmt):
+            for unit, chars in UNITS.items():
+                if directive in chars:
+                    found.add(unit)
+                    break
+            else:
+                raise ValueError(f"directive '%{directive}' can't be cached")
+
+    for unit in _ORDER:
+        if unit in found:
+            return unit
+    return None
+
+
+class BucketFormatter:
+    def __init__(self, fmt, maxsize=65536):
+        """
+        *args:
+        fmt - list: datetime format identifiers (one per folder level).
+
+        **kwargs:
+        maxsize - int: maximum number of cached folder names.
+        """
+        self.fmt = tuple(fmt)
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._cache = {}
+
+        try:
+            self.unit = finest_unit(self.fmt)
+            self._width = _SLOT_WIDTH.get(self.unit, 900)
+        except ValueError:
+            self.unit = self._width = None
+
+
+    def strftime(self, timestamp):
+        """Formats 'timestamp' without the cache."""
+        d = dt.fromtimestamp(timestamp)
+        return '/'.join(d.strftime(x) for x in self.fmt)
+
+
+    def _cacheable(self, start):
+        """Whether the UTC offset is the same at both ends of the slot (no DST
+        change inside it) and aligned with it, i.e. no bucket boundary can
+        fall inside the slot."""
+        first, last = (time.localtime(x).tm_gmtoff
+                       for x in (start, start + self._width - 1))
+        return first == last and first % self._width == 0
+
+
+    def __call__(self, timestamp):
+        """Returns the folder name (levels joined by '/') for 'timestamp'."""
+        if self._width is None:
+            return self.strftime(timestamp)
+
+        slot = int(timestamp // self._width)
+        try:
+            key = self._cache[slot]
+            self.hits += 1
+            return key
+        except KeyError:
+            pass
+
+        self.misses += 1
+        start = slot * self._width
+        if not self._cacheable(start):
+            return self.strftime(timestamp)
+
+        if len(self._cache) >= self.maxsize:
+            del self._cache[next(iter(self._cache))]
+        key = self._cache[slot] = self.strftime(start)
+        return key
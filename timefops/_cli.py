@@ -3,7 +3,37 @@ import os
 import sys
 import getpass
 import logging
+import cProfile
+import multiprocessing
 from . import Timefops, __version__, TRANSLATIONS
+from ._compress import STORED_EXTENSIONS
+from ._filter import EntryFilter, parse_time, parse_size
+from ._profile import Profiler
+from ._journal import JournalError
+from ._index import ArchiveIndexError, index_path
+from ._planfile import PlanError
+from ._shard import parse_shard, shard_path
+
+
+def _time_arg(value):
+    try:
+        return parse_time(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+
+def _size_arg(value):
+    try:
+        return parse_size(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+
+def _shard_arg(value):
+    try:
+        return parse_shard(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
 
 
 def cli(argv):
@@ -38,6 +68,27 @@ def cli(argv):
         help="Perform operations based on last modification-time.",
         description="Perform operations based on last modification-time.")
 
+    # Commands that aren't time predicates are parsed by the same
+    # subparsers, but listed in their own section: a parser added without
+    # help= is left out of the "Time predicate" list.
+    main_parser.add_argument_group(
+        title="Commands",
+        description="  extract      List or extract members of an archive "
+                    "made with --index.\n"
+                    "  execute      Run a plan written with --plan.")
+
+    extract_parser = sub_parsers.add_parser(
+        "extract",
+        description="List the folders of an archive made with --index (or "
+                    "the members in one), or extract members without "
+                    "reading the archive from the start.")
+
+    execute_parser = sub_parsers.add_parser(
+        "execute",
+        description="Run a plan written with --plan, without scanning the "
+                    "sources again: every item goes to the folder and name "
+                    "it was planned with.")
+
     dyn_opts = locals()
 
     for p in ('atime_parser', 'ctime_parser', 'mtime_parser'):
@@ -110,13 +161,88 @@ def cli(argv):
         gen_arc_args.add_argument("-z", "--zipfile",
                                   action="store_true",
                                   help="Makes a zip file instead of a "
-                                       "tar archive (GZ compression "
-                                       "is not available with this option)")
+                                       "tar archive (use 'deflate' instead "
+                                       "of 'gz' compression with this "
+                                       "option)")
 
         gen_arc_args.add_argument("-c", "--compression",
-                                  choices=("bz2", "gz", "xz"),
+                                  choices=("bz2", "deflate", "gz", "xz"),
                                   type=str.lower,
-                                  help="Compression format for the archive.")
+                                  help="Compression format for the archive "
+                                       "('deflate' is for zip files only).")
+
+        gen_arc_args.add_argument("-l", "--level",
+                                  type=int,
+                                  metavar="N",
+                                  help="Compression level, from 0 (fastest) "
+                                       "to 9 (smallest; 1-9 for bz2). The "
+                                       "preset for xz.")
+
+        gen_arc_args.add_argument("--store-ext",
+                                  nargs="*",
+                                  metavar="EXT",
+                                  help="With -z/--zipfile, files with these "
+                                       "extensions are stored as is instead "
+                                       "of compressed. Defaults to common "
+                                       "already compressed formats (jpg, "
+                                       "mp4, zip, gz, ...); give no EXT to "
+                                       "compress everything.")
+
+        gen_arc_args.add_argument("--threads",
+                                  type=int,
+                                  default=1,
+                                  metavar="N",
+                                  help="Number of threads compressing the "
+                                       "archive (default: 1). The tar "
+                                       "archive is compressed in independent "
+                                       "blocks, which standard tools can "
+                                       "still decompress. With -z/--zipfile, "
+                                       "members are compressed (and "
+                                       "encrypted) in N processes. With "
+                                       "--split, N archives are written at "
+                                       "the same time.")
+
+        gen_arc_args.add_argument("--split",
+                                  action="store_true",
+                                  help="Make an archive per folder name "
+                                       "instead of one archive, named after "
+                                       "NAME (e.g. 'logs-2020-04-01.tar.xz' "
+                                       "for '-a logs -c xz'); each can be "
+                                       "restored or deleted on its own.")
+
+        gen_arc_args.add_argument("--volume-size",
+                                  type=_size_arg,
+                                  metavar="SIZE",
+                                  help="With --split, put at most SIZE bytes "
+                                       "of items (before compression; K, M, G "
+                                       "suffixes allowed) in each archive, "
+                                       "continuing in numbered volumes "
+                                       "('logs-2020-04-01.2.tar.xz', ...).")
+
+        gen_arc_args.add_argument("--index",
+                                  action="store_true",
+                                  help="Also write an index of the members "
+                                       "(NAME.idx) for 'timefops extract'. "
+                                       "A compressed tar archive is then "
+                                       "compressed in blocks (as with "
+                                       "--threads), so a member can be read "
+                                       "from the start of its block.")
+
+        gen_arc_args.add_argument("--dedup",
+                                  action="store_true",
+                                  help="Add files with the same content as "
+                                       "a file already in the archive as "
+                                       "hardlinks to it (tar archives only). "
+                                       "Only files of the same size are "
+                                       "compared, by hashing them on "
+                                       "--hash-threads threads.")
+
+        gen_arc_args.add_argument("--hash-threads",
+                                  type=int,
+                                  default=4,
+                                  metavar="N",
+                                  help="Number of threads hashing files for "
+                                       "--dedup (default: 4).")
 
         gen_arc_args.add_argument("-f", "--format",
                                   type=str,
@@ -155,10 +281,44 @@ def cli(argv):
                                   action="store_false",
                                   help="Disable coloured logging output.")
 
+        gen_arc_args.add_argument("--log-json",
+                                  action="store_true",
+                                  help="Log JSON lines (time, level, logger, "
+                                       "message) instead of text, for log "
+                                       "shippers.")
+
         gen_arc_args.add_argument("--dry-run",
                                   action="store_true",
                                   help="Show results, but don't execute.")
 
+        gen_arc_args.add_argument("--plan",
+                                  type=str,
+                                  metavar="FILE",
+                                  help="Write the plan (every item's source, "
+                                       "folder, final name and size, as JSON "
+                                       "lines) to FILE instead of running; "
+                                       "run it with 'timefops execute FILE'.")
+
+        gen_arc_args.add_argument("--stream",
+                                  action="store_true",
+                                  help="Add items while the sources are "
+                                       "still being scanned, instead of "
+                                       "mapping every item first. Memory "
+                                       "still grows with the report (a few "
+                                       "bytes per item) and the distinct "
+                                       "names per folder; --split and "
+                                       "--dedup need the whole plan.")
+
+        gen_arc_args.add_argument("--state",
+                                  type=str,
+                                  metavar="FILE",
+                                  help="Incremental run: only archive items "
+                                       "that are new or changed since the "
+                                       "last run with the same state file "
+                                       "(an SQLite database, created if "
+                                       "needed). No archive is made when "
+                                       "nothing changed.")
+
         enc_zip = arc_p.add_argument_group("AES-Encrypted Zipfile options", 
                 description="Arguments for making a password-protected "
                             "AES-Encrypted zip file. The -z/--zipfile "
@@ -252,37 +412,535 @@ def cli(argv):
                                  action="store_false",
                                  help="Disable coloured logging output.")
 
+        gen_cm_args.add_argument("--log-json",
+                                 action="store_true",
+                                 help="Log JSON lines (time, level, logger, "
+                                      "message) instead of text, for log "
+                                      "shippers.")
+
         gen_cm_args.add_argument("--dry-run",
                                  action="store_true",
                                  help="Show results, but don't execute.")
 
+        gen_cm_args.add_argument("--plan",
+                                 type=str,
+                                 metavar="FILE",
+                                 help="Write the plan (every item's source, "
+                                      "folder, final name and size, as JSON "
+                                      "lines) to FILE instead of running; "
+                                      "run it with 'timefops execute FILE'.")
 
-    opts = main_parser.parse_args(argv)
+        gen_cm_args.add_argument("--stream",
+                                 action="store_true",
+                                 help="Transfer items while the sources are "
+                                      "still being scanned, instead of "
+                                      "mapping every item first. Memory "
+                                      "still grows with the report (a few "
+                                      "bytes per item) and the distinct "
+                                      "names per folder; --dedup needs the "
+                                      "whole plan.")
+
+        gen_cm_args.add_argument("--journal",
+                                 type=str,
+                                 metavar="FILE",
+                                 help="Write the planned items and every "
+                                      "item done to FILE as the run goes. If "
+                                      "the run is stopped, running the same "
+                                      "command again picks up where it "
+                                      "stopped, with the same names. FILE is "
+                                      "removed once the run completes.")
+
+    # arguments for copy operation only.
+    for c_p in (dyn_opts["copy_ops_atime_parser"],
+                dyn_opts["copy_ops_ctime_parser"],
+                dyn_opts["copy_ops_mtime_parser"]):
+
+        copy_args = c_p.add_argument_group("Copy arguments")
+
+        copy_args.add_argument("-j", "--jobs",
+                               type=int,
+                               default=1,
+                               metavar="N",
+                               help="Number of items to copy at the same time "
+                                    "(default: 1).")
+
+        copy_args.add_argument("--state",
+                               type=str,
+                               metavar="FILE",
+                               help="Incremental run: skip items that haven't "
+                                    "changed since they were copied by an "
+                                    "earlier run with the same state file (an "
+                                    "SQLite database, created if needed).")
+
+        copy_args.add_argument("--dedup",
+                               action="store_true",
+                               help="Hardlink files with the same content as "
+                                    "a file copied earlier in the run to its "
+                                    "copy, instead of copying them again "
+                                    "(copied if hardlinks can't be made). "
+                                    "Only files of the same size are "
+                                    "compared, by hashing them on "
+                                    "--hash-threads threads.")
+
+        copy_args.add_argument("--hash-threads",
+                               type=int,
+                               default=4,
+                               metavar="N",
+                               help="Number of threads hashing files for "
+                                    "--dedup (default: 4).")
+
+    # arguments for extract.
+    extract_parser.add_argument("-V", "--version",
+                                action="version",
+                                version=f"{__version__}",
+                                help="print version number/info and exit")
+
+    extract_parser.add_argument("archive",
+                                type=str,
+                                help="Archive made with --index.")
+
+    extract_parser.add_argument("members",
+                                type=str,
+                                nargs="*",
+                                metavar="MEMBER",
+                                help="Members to extract, as listed by "
+                                     "-l/--list -b/--bucket; directories "
+                                     "come with everything under them.")
+
+    extract_parser.add_argument("-l", "--list",
+                                action="store_true",
+                                help="List the folders in the archive, with "
+                                     "their number of members and size; with "
+                                     "-b/--bucket, the members in it.")
+
+    extract_parser.add_argument("-b", "--bucket",
+                                type=str,
+                                metavar="FOLDER",
+                                help="Folder name to list, or to extract "
+                                     "every member of.")
+
+    extract_parser.add_argument("-t", "--target-directory",
+                                type=str,
+                                default=".",
+                                help="Directory to extract to (default: the "
+                                     "current one).")
+
+    extract_parser.add_argument("--index",
+                                type=str,
+                                metavar="FILE",
+                                help="Index file (default: ARCHIVE.idx).")
+
+    extract_passwd_args = extract_parser.add_mutually_exclusive_group()
+
+    extract_passwd_args.add_argument("--zip-password", "-zp",
+                                     action="store_true",
+                                     help="Prompts for the password of an "
+                                          "AES-encrypted zip file.")
+
+    extract_passwd_args.add_argument("--zip-password-plaintext", "-zP",
+                                     type=str,
+                                     metavar="PASSWORD",
+                                     help="Specify zip file password in "
+                                          "plaintext, avoid this option "
+                                          "if possible.")
+
+    extract_parser.add_argument("-v", "--verbose",
+                                action="store_const",
+                                const=int(logging.INFO - 5),
+                                default=logging.INFO,
+                                help="Set log level to verbose.")
+
+    extract_parser.add_argument("-d", "--debug",
+                                action="store_const",
+                                const=logging.DEBUG,
+                                default=logging.INFO,
+                                help="Set log level to debug "
+                                     "(includes verbose).")
+
+    extract_parser.add_argument("--no-color", "--no-colour",
+                                action="store_false",
+                                help="Disable coloured logging output.")
+
+    extract_parser.add_argument("--log-json",
+                                action="store_true",
+                                help="Log JSON lines (time, level, logger, "
+                                     "message) instead of text, for log "
+                                     "shippers.")
+
+    extract_parser.set_defaults(profile=False, profile_out=None)
+
+    # arguments for execute.
+    execute_parser.add_argument("-V", "--version",
+                                action="version",
+                                version=f"{__version__}",
+                                help="print version number/info and exit")
+
+    execute_parser.add_argument("plan_file",
+                                type=str,
+                                metavar="PLAN",
+                                help="Plan file written with --plan.")
+
+    execute_parser.add_argument("-j", "--jobs",
+                                type=int,
+                                default=1,
+                                metavar="N",
+                                help="Number of items to copy at the same "
+                                     "time, or of threads compressing an "
+                                     "archive (default: 1).")
+
+    execute_parser.add_argument("--hash-threads",
+                                type=int,
+                                default=4,
+                                metavar="N",
+                                help="Number of threads hashing files, for "
+                                     "plans made with --dedup (default: 4).")
+
+    execute_parser.add_argument("--state",
+                                type=str,
+                                metavar="FILE",
+                                help="Incremental run (copy and archive "
+                                     "plans): skip items that haven't changed "
+                                     "since an earlier run with the same "
+                                     "state file.")
+
+    execute_parser.add_argument("--dry-run",
+                                action="store_true",
+                                help="Show results, but don't execute.")
+
+    exec_passwd_args = execute_parser.add_mutually_exclusive_group()
+
+    exec_passwd_args.add_argument("--zip-password", "-zp",
+                                  action="store_true",
+                                  help="Prompts for the password, for a plan "
+                                       "of an AES-encrypted zip file.")
+
+    exec_passwd_args.add_argument("--zip-password-plaintext", "-zP",
+                                  type=str,
+                                  metavar="PASSWORD",
+                                  help="Specify zip file password in "
+                                       "plaintext, avoid this option "
+                                       "if possible.")
+
+    execute_parser.add_argument("-v", "--verbose",
+                                action="store_const",
+                                const=int(logging.INFO - 5),
+                                default=logging.INFO,
+                                help="Set log level to verbose.")
+
+    execute_parser.add_argument("-d", "--debug",
+                                action="store_const",
+                                const=logging.DEBUG,
+                                default=logging.INFO,
+                                help="Set log level to debug "
+                                     "(includes verbose).")
+
+    execute_parser.add_argument("--no-color", "--no-colour",
+                                action="store_false",
+                                help="Disable coloured logging output.")
+
+    execute_parser.add_argument("--log-json",
+                                action="store_true",
+                                help="Log JSON lines (time, level, logger, "
+                                     "message) instead of text, for log "
+                                     "shippers.")
+
+    execute_parser.add_argument("--progress",
+                                action="store_true",
+                                help="Show items/s, bytes/s, bytes left and "
+                                     "an ETA while running.")
+
+    execute_parser.add_argument("--profile",
+                                action="store_true",
+                                help="Print the time spent in each phase and "
+                                     "counters when done.")
+
+    execute_parser.add_argument("--profile-out",
+                                type=str,
+                                metavar="FILE",
+                                help="Also run under cProfile and save the "
+                                     "stats to FILE; implies --profile.")
+
+    # sharding, for every operation and execute.
+    for s_p in [execute_parser] + [dyn_opts[f"{op}_ops_{t}_parser"]
+                                   for op in ("archive", "copy", "move")
+                                   for t in ("atime", "ctime", "mtime")]:
+
+        shard_args = s_p.add_argument_group("Sharding arguments",
+                description="Items are shared out by a hash of their folder "
+                            "name, so every folder is handled by one shard "
+                            "and names are the same as in an unsharded "
+                            "run.")
+
+        shard_excl = shard_args.add_mutually_exclusive_group()
+
+        shard_excl.add_argument("--shard",
+                                type=_shard_arg,
+                                metavar="K/N",
+                                help="Only handle shard K of N; N runs (on "
+                                     "any hosts) with K from 1 to N handle "
+                                     "disjoint sets of items, with no "
+                                     "coordination. An archive is named "
+                                     "after the shard ('logs.2-of-4.tar.xz') "
+                                     "unless --split is used.")
+
+        shard_excl.add_argument("--shards",
+                                type=int,
+                                metavar="N",
+                                help="Run all N shards at once on this "
+                                     "machine, each in a process of its own; "
+                                     "state and journal files are named "
+                                     "after the shard ('state.db.2-of-4').")
+
+    # traversal and filters, for every operation.
+    for f_p in (dyn_opts[f"{op}_ops_{t}_parser"]
+                for op in ("archive", "copy", "move")
+                for t in ("atime", "ctime", "mtime")):
+
+        walk_args = f_p.add_argument_group("Traversal arguments")
+
+        walk_args.add_argument("-r", "--recursive",
+                               action="store_true",
+                               help="Sort the files at any depth under the "
+                                    "source directories (into flat folders), "
+                                    "instead of the items directly inside "
+                                    "them. Directories themselves are not "
+                                    "transferred.")
+
+        walk_args.add_argument("--walk-threads",
+                               type=int,
+                               default=4,
+                               metavar="N",
+                               help="Number of threads listing directories "
+                                    "with -r/--recursive (default: 4); helps "
+                                    "most on network filesystems.")
+
+        report_args = f_p.add_argument_group("Reporting arguments")
+
+        report_args.add_argument("--progress",
+                                 action="store_true",
+                                 help="Show items/s, bytes/s, bytes left and "
+                                      "an ETA while running: a status line on "
+                                      "a terminal (every 0.5s), a JSON object "
+                                      "per line otherwise (every 10s). Use "
+                                      "instead of -v/--verbose on large "
+                                      "runs.")
+
+        report_args.add_argument("--profile",
+                                 action="store_true",
+                                 help="Print the time spent in each phase "
+                                      "(scan, bucket, rename, makedirs, copy, "
+                                      "...) and counters (syscalls, items, "
+                                      "bytes) when done.")
+
+        report_args.add_argument("--profile-out",
+                                 type=str,
+                                 metavar="FILE",
+                                 help="Also run under cProfile and save the "
+                                      "stats to FILE (read with 'python -m "
+                                      "pstats FILE'); implies --profile.")
+
+        filter_args = f_p.add_argument_group("Filter arguments",
+                description="Only items passing every filter are handled. "
+                            "Times are the ones used for sorting, as a date "
+                            "('2020-04-01', '2020-04-01 12:30') or an age "
+                            "('90m', '12h', '30d', '2w'); items inside "
+                            "source directories are checked, not what is "
+                            "inside those.")
+
+        filter_args.add_argument("--newer-than",
+                                 type=_time_arg,
+                                 metavar="TIME",
+                                 help="Only items with a time at or after "
+                                      "TIME.")
+
+        filter_args.add_argument("--older-than",
+                                 type=_time_arg,
+                                 metavar="TIME",
+                                 help="Only items with a time before TIME.")
+
+        filter_args.add_argument("--between",
+                                 type=_time_arg,
+                                 nargs=2,
+                                 metavar=("START", "END"),
+                                 help="Same as --newer-than START "
+                                      "--older-than END.")
+
+        filter_args.add_argument("--min-size",
+                                 type=_size_arg,
+                                 metavar="SIZE",
+                                 help="Only files of at least SIZE bytes "
+                                      "(K, M, G suffixes allowed).")
+
+        filter_args.add_argument("--max-size",
+                                 type=_size_arg,
+                                 metavar="SIZE",
+                                 help="Only files of at most SIZE bytes.")
+
+        filter_args.add_argument("--include",
+                                 nargs="+",
+                                 default=[],
+                                 metavar="PATTERN",
+                                 help="Only items with a name matching one "
+                                      "of the glob patterns.")
+
+        filter_args.add_argument("--exclude",
+                                 nargs="+",
+                                 default=[],
+                                 metavar="PATTERN",
+                                 help="Leave out items with a name matching "
+                                      "one of the glob patterns.")
 
-    parser = dyn_opts[f"{opts.operation}_ops_{opts.time}_parser"]
 
-    for path in opts.src:
-        if opts.individual_items:
-            if not os.path.exists(path):
-                parser.error(f"src path '{path}' not understood/does "
-                             "not exist.")
+    opts = main_parser.parse_args(argv)
+
+    if opts.time == "extract":
+        parser = extract_parser
+        opts.index = opts.index or index_path(opts.archive)
+        if not os.path.isfile(opts.archive):
+            parser.error(f"archive '{opts.archive}' does not exist.")
+        if not os.path.isfile(opts.index):
+            parser.error(f"index '{opts.index}' does not exist (archives get "
+                         "one with --index).")
+        if opts.members and (opts.list or opts.bucket):
+            parser.error("MEMBER can't be used with -l/--list or "
+                         "-b/--bucket.")
+        if not (opts.members or opts.list or opts.bucket):
+            parser.error("give MEMBER(s) or -b/--bucket to extract, or "
+                         "-l/--list.")
+        if not opts.list:
+            if not os.path.isdir(opts.target_directory):
+                parser.error(f"dest. directory '{opts.target_directory}' not "
+                             "understood/does not exist.")
+            elif not os.access(opts.target_directory, os.W_OK | os.X_OK):
+                parser.error("dest. directory is not writable/executable, "
+                             "unable to extract items here.")
+        if opts.zip_password and not opts.list:
+            opts.zip_password = getpass.getpass("Enter the password: ")
         else:
-            if not os.path.isdir(path):
-                parser.error(f"src dir '{path}' not understood/does not exist;"
-                             " use '-i' if entry is a file.")
+            opts.zip_password = opts.zip_password_plaintext
+        return opts
+
+    if opts.time == "execute":
+        parser = execute_parser
+        if not os.path.isfile(opts.plan_file):
+            parser.error(f"plan '{opts.plan_file}' does not exist.")
+        if opts.jobs < 1:
+            parser.error("-j/--jobs must be at least 1.")
+    else:
+        parser = dyn_opts[f"{opts.operation}_ops_{opts.time}_parser"]
 
-            # directories specified without using '-i' will be traversed.
-            elif not os.access(path, os.R_OK | os.X_OK):
-                parser.error(f"src dir '{path}' is unable to be traversed.")
+        for path in opts.src:
+            if opts.individual_items:
+                if not os.path.exists(path):
+                    parser.error(f"src path '{path}' not understood/does "
+                                 "not exist.")
+            else:
+                if not os.path.isdir(path):
+                    parser.error(f"src dir '{path}' not understood/does "
+                                 "not exist; use '-i' if entry is a file.")
+
+                # directories specified without using '-i' will be traversed.
+                elif not os.access(path, os.R_OK | os.X_OK):
+                    parser.error(f"src dir '{path}' is unable to be traversed.")
+
+        if opts.walk_threads < 1:
+            parser.error("--walk-threads must be at least 1.")
+        if opts.between:
+            if opts.newer_than is not None or opts.older_than is not None:
+                parser.error("--between can't be used with --newer-than or "
+                             "--older-than.")
+            opts.newer_than, opts.older_than = opts.between
+        if opts.newer_than is not None and opts.older_than is not None and \
+                opts.newer_than >= opts.older_than:
+            parser.error("the time range is empty (start is not before end).")
+        if opts.min_size is not None and opts.max_size is not None and \
+                opts.min_size > opts.max_size:
+            parser.error("--min-size is larger than --max-size.")
+
+    state = getattr(opts, "state", None)
+    if state and (os.path.isdir(state) or not os.path.isdir(
+            os.path.dirname(os.path.abspath(state)))):
+        parser.error(f"cannot use state file: '{state}'.")
+
+    journal = getattr(opts, "journal", None)
+    if journal and (os.path.isdir(journal) or not os.path.isdir(
+            os.path.dirname(os.path.abspath(journal)))):
+        parser.error(f"cannot use journal file: '{journal}'.")
+    if journal and state:
+        parser.error("--journal can't be used with --state.")
+
+    if getattr(opts, "hash_threads", 1) < 1:
+        parser.error("--hash-threads must be at least 1.")
+
+    if opts.profile_out and (os.path.isdir(opts.profile_out) or
+            not os.path.isdir(os.path.dirname(
+                os.path.abspath(opts.profile_out)))):
+        parser.error(f"cannot write profile to: '{opts.profile_out}'.")
+
+    if opts.shards is not None:
+        if opts.shards < 1:
+            parser.error("--shards must be at least 1.")
+        if opts.dry_run or getattr(opts, "plan", None):
+            parser.error("--shards can't be used with --dry-run or --plan "
+                         "(use --shard K/N).")
+        if opts.progress or opts.profile or opts.profile_out:
+            parser.error("--shards can't be used with --progress or "
+                         "--profile.")
+        if getattr(opts, "to_stdout", False):
+            parser.error("--shards can't be used with --to-stdout.")
+
+    if opts.time == "execute":
+        if opts.zip_password and not opts.dry_run:
+            opts.zip_password = getpass.getpass("Enter the password: ")
+        else:
+            opts.zip_password = opts.zip_password_plaintext
+        return opts
+
+    if opts.plan:
+        if os.path.exists(opts.plan) or not os.path.isdir(
+                os.path.dirname(os.path.abspath(opts.plan))):
+            parser.error(f"cannot write plan to: '{opts.plan}'.")
+        if opts.dry_run:
+            parser.error("--plan can't be used with --dry-run.")
+        if journal or state:
+            parser.error("--plan can't be used with --journal or --state "
+                         "(give those to 'timefops execute').")
 
     if opts.operation == "archive":
+        if opts.threads < 1:
+            parser.error("--threads must be at least 1.")
+        if opts.zipfile and opts.compression == "gz":
+            parser.error("'gz' compression not available with -z/--zipfile, "
+                         "use 'deflate'.")
+        elif not opts.zipfile and opts.compression == "deflate":
+            parser.error("'deflate' compression needs -z/--zipfile.")
+        if opts.level is not None:
+            lo = 1 if opts.compression == "bz2" else 0
+            if not opts.compression:
+                parser.error("-l/--level needs compression (-c/--compression).")
+            elif not lo <= opts.level <= 9:
+                parser.error(f"-l/--level for '{opts.compression}' must be "
+                             f"{lo}-9.")
+        if opts.store_ext is not None and not opts.zipfile:
+            parser.error("--store-ext needs -z/--zipfile.")
+        if opts.split and opts.to_stdout:
+            parser.error("--split can't be used with --to-stdout.")
+        if opts.volume_size is not None and not opts.split:
+            parser.error("--volume-size needs --split.")
+        if opts.volume_size is not None and opts.volume_size < 1:
+            parser.error("--volume-size must be at least 1 byte.")
+        if opts.index and opts.to_stdout:
+            parser.error("--index can't be used with --to-stdout.")
+        if opts.dedup and opts.zipfile:
+            parser.error("--dedup needs a tar archive (zip files can't hold "
+                         "hardlinks).")
+        if opts.plan and opts.to_stdout:
+            parser.error("--plan can't be used with --to-stdout.")
         if opts.archive:
             if os.path.exists(opts.archive):
                 parser.error(f"file '{opts.archive}' already exists.")
 
             if opts.zipfile:
-                if opts.compression == "gz":
-                    parser.error("'gz' compression not available with -z/--zipfile")
                 if not opts.archive.endswith(".zip"):
                     opts.archive = opts.archive + ".zip"
             else:
@@ -305,6 +963,10 @@ def cli(argv):
             # Make sure the file doesn't exist after (possibly) adding suffix
             if os.path.isfile(opts.archive):
                 parser.error(f"file '{opts.archive}' already exists.")
+            if opts.index and not opts.split and \
+                    os.path.exists(index_path(opts.archive)):
+                parser.error(f"file '{index_path(opts.archive)}' already "
+                             "exists.")
 
             if not os.access(os.path.dirname(opts.archive), os.W_OK | os.X_OK):
                 parser.error("directory where archive is to be created is not "
@@ -313,8 +975,6 @@ def cli(argv):
             if not opts.compression and not opts.zipfile:
                 parser.error("--to-stdout needs compression "
                         "(-c/--compression) when working with a tar archive")
-            elif opts.zipfile and opts.compression == "gz":
-                parser.error("'gz' compression not available with -z/--zipfile")
         else:
             parser.error("either one of -a/--archive or --to-stdout "
                          "is required.")
@@ -324,7 +984,7 @@ def cli(argv):
                     opts.zip_password_plaintext):
                 parser.error("To make an AES-encrypted zip file, make a "
                              "password with '-zp' or '-zP'.")
-            elif opts.zip_password and not opts.dry_run:
+            elif opts.zip_password and not (opts.dry_run or opts.plan):
                 opts.zip_password = getpass.getpass("Enter a password: ")
             elif opts.zip_password_plaintext:
                 opts.zip_password = opts.zip_password_plaintext
@@ -332,6 +992,8 @@ def cli(argv):
             enc_lvls = {"weak": 128, "medium": 192, "strong": 256}
             opts.zip_encryption = enc_lvls.get(opts.zip_encryption, 192)
     else:
+        if getattr(opts, "jobs", 1) < 1:
+            parser.error("-j/--jobs must be at least 1.")
         if not os.path.isdir(opts.target_directory):
             parser.error(f"dest. directory '{opts.target_directory}' not "
                          "understood/does not exist.")
@@ -342,26 +1004,139 @@ def cli(argv):
     return opts
 
 
+def _run_shard(args, shard):
+    """Runs shard 'shard' (K, N) of the command in 'args', in a process
+    started by launch()."""
+    args.shard, args.shards = shard, None
+    for attr in ("state", "journal"):
+        if getattr(args, attr, None):
+            setattr(args, attr, shard_path(getattr(args, attr), shard))
+    tfops = Timefops(min(args.debug, args.verbose), color=args.no_color,
+                     name=f"timefops.shard{shard[0]}",
+                     log_json=args.log_json)
+    try:
+        run(tfops, args)
+    except (JournalError, ArchiveIndexError, PlanError,
+            FileExistsError) as exc:
+        tfops.log.error(f"shard {shard[0]}/{shard[1]}: {exc}")
+        sys.exit(1)
+
+
+def launch(tfops, args):
+    """
+    *args:
+    tfops - Timefops: logs the outcome.
+    args - Namespace: parsed command line with 'shards' set.
+
+    Runs all the shards of the command at once, each in a process of its
+    own, and waits for them.
+
+    Returns:
+    list - numbers of the shards that failed.
+    """
+    n = args.shards
+    procs = [multiprocessing.Process(target=_run_shard, args=(args, (k, n)))
+             for k in range(1, n + 1)]
+    for p in procs:
+        p.start()
+    failed = []
+    for k, p in enumerate(procs, 1):
+        p.join()
+        if p.exitcode:
+            failed.append(k)
+    if failed:
+        tfops.log.error(f"{len(failed)} of {n} shard(s) failed: "
+                        f"{', '.join(map(str, failed))}.")
+    else:
+        tfops.log.success(f"all {n} shard(s) finished.")
+    return failed
+
+
 def main():
     args = cli(sys.argv[1::])
-    tfops = Timefops(min(args.debug, args.verbose), color=args.no_color)
+    profiler = Profiler() if args.profile or args.profile_out else None
+    tfops = Timefops(min(args.debug, args.verbose), color=args.no_color,
+                     profiler=profiler, log_json=args.log_json)
+    if getattr(args, "shards", None):
+        sys.exit(1 if launch(tfops, args) else 0)
+    cprofile = cProfile.Profile() if args.profile_out else None
+    if cprofile is not None:
+        cprofile.enable()
+    try:
+        run(tfops, args)
+    except (JournalError, ArchiveIndexError, PlanError,
+            FileExistsError) as exc:
+        # a journal of another run, an index or plan that isn't one (or
+        # doesn't match its archive), or an archive that exists
+        tfops.log.error(str(exc))
+        sys.exit(1)
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_out)
+        if profiler is not None:
+            tfops.log.info("\nProfile:")
+            for line in profiler.report():
+                tfops.log.info(line)
+
+
+def run(tfops, args):
+    if args.time == "extract":
+        if args.list:
+            tfops.list_archive(args.archive, bucket=args.bucket,
+                               index=args.index)
+        else:
+            tfops.extract(args.archive, args.target_directory,
+                          members=args.members, bucket=args.bucket,
+                          index=args.index, password=args.zip_password)
+        return
+
+    if args.time == "execute":
+        tfops.execute(args.plan_file, jobs=args.jobs, state=args.state,
+                      dry_run=args.dry_run, progress=args.progress,
+                      password=args.zip_password,
+                      hash_threads=args.hash_threads, shard=args.shard)
+        return
+
+    predicate = EntryFilter(args.time, newer=args.newer_than,
+                            older=args.older_than, min_size=args.min_size,
+                            max_size=args.max_size, include=args.include,
+                            exclude=args.exclude) or None
 
     if args.operation == "archive":
         tfops.archive(args.src, args.archive, args.time, args.format,
                       individual=args.individual_items, cmp_sh=args.compression,
                       zip_file=args.zipfile, to_stdout=args.to_stdout, 
                       aes_zip_create=(args.zip_password, args.zip_encryption) \
-                                     if args.zip_password \
-                                     or args.zip_encryption else (),
-                      dry_run=args.dry_run)
+                                     if args.zip_password else (),
+                      dry_run=args.dry_run, stream=args.stream,
+                      threads=args.threads, level=args.level,
+                      stored=STORED_EXTENSIONS if args.store_ext is None else \
+                             {e.lower().lstrip(".") for e in args.store_ext},
+                      state=args.state, predicate=predicate,
+                      recursive=args.recursive, walk_threads=args.walk_threads,
+                      progress=args.progress, split=args.split,
+                      volume_size=args.volume_size, index=args.index,
+                      dedup=args.dedup, hash_threads=args.hash_threads,
+                      plan_out=args.plan, shard=args.shard)
 
     elif args.operation == "copy":
         tfops.copy(args.src, args.target_directory, args.time, args.format,
-             individual=args.individual_items, dry_run=args.dry_run)
+                   individual=args.individual_items, dry_run=args.dry_run,
+                   stream=args.stream, jobs=args.jobs, state=args.state,
+                   predicate=predicate, recursive=args.recursive,
+                   walk_threads=args.walk_threads, progress=args.progress,
+                   journal=args.journal, dedup=args.dedup,
+                   hash_threads=args.hash_threads, plan_out=args.plan,
+                   shard=args.shard)
 
     elif args.operation == "move":
         tfops.move(args.src, args.target_directory, args.time, args.format,
-                   individual=args.individual_items, dry_run=args.dry_run)
+                   individual=args.individual_items, dry_run=args.dry_run,
+                   stream=args.stream, predicate=predicate,
+                   recursive=args.recursive, walk_threads=args.walk_threads,
+                   progress=args.progress, journal=args.journal,
+                   plan_out=args.plan, shard=args.shard)
 
 
 if __name__ == "__main__":
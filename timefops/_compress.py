@@ -0,0 +1,365 @@
+"""Compression helpers for timefops archives.
+    ParallelWriter compresses a tar stream in independent blocks on several
+    threads (zlib, bz2 and lzma all release the GIL while compressing).  Each
+    block is a complete gzip member/bz2 stream/xz stream, and concatenations
+    of those are still valid files for gzip, bzip2, xz and tarfile alike.
+
+    compress_member()/write_member() do the same for zip files, one member at
+    a time: members get compressed (and encrypted) in worker processes, and
+    are appended to the archive in order by a single writer.  That relies on
+    zipfile internals, so it is checked once per kind of archive first (see
+    can_write_members()).
+"""
+
+import io
+import os
+import bz2
+import lzma
+import zlib
+import zipfile
+import tempfile
+import functools
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import pyzipper
+from pyzipper.zipfile_aes import AESZipEncrypter
+
+
+def _gz_member(data, level=9):
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+def _bz2_stream(data, level=9):
+    return bz2.compress(data, level)
+
+
+def _xz_stream(data, level=6):
+    return lzma.compress(data, preset=level)
+
+
+# compression shorthand: (block compressor, block size).  Default levels match
+# the ones tarfile uses; bz2 blocks are the size of a bzip2 block anyway, so
+# they cost nothing in ratio.
+BLOCK_COMPRESSORS = {
+    "gz": (_gz_member, 1 << 20),
+    "bz2": (_bz2_stream, 900000),
+    "xz": (_xz_stream, 1 << 23),
+}
+
+# compression shorthand -> zip compression constant.
+ZIP_COMPRESSION = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bz2": zipfile.ZIP_BZIP2,
+    "xz": zipfile.ZIP_LZMA,
+}
+
+# Formats that are already compressed, these are stored as is in zip files
+# (recompressing them costs a lot of CPU for next to nothing).
+STORED_EXTENSIONS = frozenset((
+    "7z", "apk", "avi", "br", "bz2", "cab", "deb", "docx", "epub", "flac",
+    "gif", "gz", "heic", "jar", "jpeg", "jpg", "lz", "lz4", "lzma", "m4a",
+    "m4v", "mkv", "mov", "mp3", "mp4", "odt", "ogg", "opus", "png", "pptx",
+    "rar", "rpm", "tbz2", "tgz", "txz", "webm", "webp", "whl", "xlsx", "xz",
+    "zip", "zst",
+))
+
+
+def member_compression(arcname, compression, stored=STORED_EXTENSIONS):
+    """
+    *args:
+    arcname - str: name of the zip member.
+    compression - int: compression constant used for the archive.
+
+    **kwargs:
+    stored - set: extensions (lowercase, without the dot) to store as is.
+
+    Returns the compression constant to use for 'arcname'.
+    """
+    ext = os.path.splitext(arcname)[1][1:].lower()
+    return zipfile.ZIP_STORED if ext and ext in stored else compression
+
+
+class ParallelWriter:
+    def __init__(self, fileobj, cmp_sh, threads, block_size=None,
+                 level=None):
+        """
+        *args:
+        fileobj - file object: where the compressed blocks get written.
+        cmp_sh - str: compression shorthand (bz2, gz, xz).
+        threads - int: number of compression threads.
+
+        **kwargs:
+        block_size - int (optional): uncompressed size of each block.
+        level - int (optional): compression level (xz preset).
+
+        Write-only file object, blocks are written to 'fileobj' in order, with
+        at most two blocks per thread held in memory.  'offsets' holds where
+        each block starts in the compressed output (decompression can start
+        at any of them).
+        """
+        self.fileobj = fileobj
+        self._compress, self.block_size = BLOCK_COMPRESSORS[cmp_sh]
+        if level is not None:
+            self._compress = functools.partial(self._compress, level=level)
+        self.block_size = block_size or self.block_size
+        self.blocks = 0
+        self.offsets = []
+        self._written = 0
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = collections.deque()
+        self._depth = threads * 2
+        self._buf = bytearray()
+        self._pos = 0
+        self.closed = False
+
+
+    def _write_block(self, data):
+        self.offsets.append(self._written)
+        self.fileobj.write(data)
+        self._written += len(data)
+
+
+    def _submit(self, block):
+        if len(self._pending) >= self._depth:
+            self._write_block(self._pending.popleft().result())
+        self._pending.append(self._pool.submit(self._compress, block))
+        self.blocks += 1
+
+
+    def write(self, data):
+        self._buf += data
+        self._pos += len(data)
+        while len(self._buf) >= self.block_size:
+            self._submit(bytes(self._buf[:self.block_size]))
+            del self._buf[:self.block_size]
+        return len(data)
+
+
+    def tell(self):
+        """Uncompressed position (tarfile keeps track of offsets with it)."""
+        return self._pos
+
+
+    def flush(self):
+        pass
+
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._buf or not self.blocks:
+            self._submit(bytes(self._buf))
+            self._buf.clear()
+        while self._pending:
+            self._write_block(self._pending.popleft().result())
+        self._pool.shutdown()
+        self.fileobj.flush()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Files bigger than this are left to the writer (compressed serially), so no
+# more than a few of them ever sit in memory at once.
+MAX_MEMBER_SIZE = 1 << 26
+
+
+def compress_member(path, compress_type, compresslevel, aes=None):
+    """
+    *args:
+    path - str: file to compress.
+    compress_type - int: zipfile compression constant.
+    compresslevel - int: compression level (None for the default).
+
+    **kwargs:
+    aes - tuple (optional): (password (bytes), key size in bits) to encrypt
+          the member with WinZip AES (pyzipper).
+
+    Runs in a worker process.  Reads, CRCs and compresses (then encrypts) the
+    file in 8 KiB chunks, exactly like ZipFile.write does, so the member data
+    comes out byte for byte the same.
+
+    Returns:
+    None - for directories and big files, the writer adds those itself.
+    tuple - (CRC, file size, encryption header, member data)
+    """
+    if os.path.isdir(path) or os.path.getsize(path) > MAX_MEMBER_SIZE:
+        return None
+
+    compressor = (pyzipper.zipfile if aes else zipfile)._get_compressor(
+                                            compress_type, compresslevel)
+    encrypter = AESZipEncrypter(aes[0], nbits=aes[1]) if aes else None
+
+    crc = size = 0
+    chunks = []
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(1024 * 8), b""):
+            size += len(buf)
+            crc = zlib.crc32(buf, crc)
+            if compressor:
+                buf = compressor.compress(buf)
+            if encrypter:
+                buf = encrypter.encrypt(buf)
+            chunks.append(buf)
+
+    buf = compressor.flush() if compressor else b""
+    if encrypter:
+        buf = encrypter.encrypt(buf) + encrypter.flush()
+    chunks.append(buf)
+
+    header = encrypter.encryption_header() if encrypter else b""
+    return crc, size, header, b"".join(chunks)
+
+
+def compress_members(members, compresslevel, aes=None):
+    """
+    *args:
+    members - list: (path, arcname, compression constant) tuples.
+
+    Runs compress_member() (see for the other arguments) for every member,
+    small files are sent to the workers in batches to keep IPC overhead down.
+    Members without a compression constant (None) are left to the caller.
+
+    Returns:
+    list - [(result, exception), ...]
+    """
+    results = []
+    for path, _, compress_type in members:
+        if compress_type is None:
+            results.append((None, None))
+            continue
+        try:
+            results.append((compress_member(path, compress_type,
+                                            compresslevel, aes=aes), None))
+        except OSError as exc:
+            results.append((None, exc))
+    return results
+
+
+class _Precomputed(AESZipEncrypter):
+    """Stands in for the AESZipEncrypter a worker already encrypted a member
+    with: writes its encryption header and passes the data through."""
+    def __init__(self, header, nbits):
+        self.force_wz_aes_version = None
+        self.conditionally_include_crc = None
+        self.min_bytes_to_include_crc = None
+        self.aes_strength = {128: 1, 192: 2, 256: 3}[nbits]
+        self._header = header
+
+    def encryption_header(self):
+        return self._header
+
+    def encrypt(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+
+class _Flushed:
+    """Compressor stand-in, for member data that is already compressed."""
+    @staticmethod
+    def flush():
+        return b""
+
+
+def write_member(zf, path, arcname, result, compress_type=None, nbits=None):
+    """
+    *args:
+    zf - zipfile.ZipFile/pyzipper.AESZipFile: archive being written.
+    path - str: path of the file.
+    arcname - str: name of the member.
+    result - tuple: output of compress_member().
+
+    **kwargs:
+    compress_type - int (optional): compression constant the member was
+                    compressed with, the archive's one by default.
+    nbits - int (optional): AES key size, for encrypted members.
+
+    Adds a member compressed by compress_member() to 'zf'.  The headers and
+    central directory entry are still written by zipfile itself, only the
+    compressor (and encrypter) are swapped for ones that pass the finished
+    data through.
+    """
+    crc, size, header, data = result
+    kwargs = {"strict_timestamps": zf._strict_timestamps} \
+             if hasattr(zf, "_strict_timestamps") else {}
+    zinfo = getattr(zf, "zipinfo_cls", zipfile.ZipInfo).from_file(
+                                                    path, arcname, **kwargs)
+    zinfo.compress_type = zf.compression if compress_type is None \
+                          else compress_type
+    if hasattr(zinfo, "compress_level"):
+        # renamed from _compresslevel in Python 3.13
+        zinfo.compress_level = zf.compresslevel
+    else:
+        zinfo._compresslevel = zf.compresslevel
+
+    if header:
+        zf.get_encrypter = lambda: _Precomputed(header, nbits)
+    try:
+        with zf.open(zinfo, "w") as w:
+            zf.fp.write(data)
+            w._file_size = size
+            w._crc = crc
+            w._compress_size += len(data)
+            w._compressor = _Flushed
+    finally:
+        if header:
+            del zf.get_encrypter
+
+
+# (archive class, compression, AES key size) -> whether write_member() works.
+_member_support = {}
+
+
+def can_write_members(zf, nbits=None):
+    """
+    *args:
+    zf - zipfile.ZipFile/pyzipper.AESZipFile: archive about to be written.
+
+    **kwargs:
+    nbits - int (optional): AES key size, for encrypted archives.
+
+    write_member() sets private ZipInfo/_ZipWriteFile attributes, which can
+    change with any Python or pyzipper release.  A test member is written
+    that way to an in-memory archive of the same kind (once per kind) and
+    read back, so a change shows up as False here rather than as a broken
+    archive.
+
+    Returns:
+    bool - whether write_member() can be used for 'zf'.
+    """
+    key = (type(zf), zf.compression, nbits)
+    if key not in _member_support:
+        _member_support[key] = _probe_members(*key)
+    return _member_support[key]
+
+
+def _probe_members(cls, compression, nbits):
+    data = b"timefops" * 1024
+    aes = (b"timefops", nbits) if nbits else None
+    buf = io.BytesIO()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "probe")
+            with open(path, "wb") as f:
+                f.write(data)
+            result = compress_member(path, compression, None, aes=aes)
+            with cls(buf, "w", compression=compression) as z:
+                if aes:
+                    z.setpassword(aes[0])
+                    z.setencryption(pyzipper.WZ_AES, nbits=nbits)
+                write_member(z, path, "probe", result, nbits=nbits)
+        with cls(buf) as z:
+            if aes:
+                z.setpassword(aes[0])
+            return z.testzip() is None and z.read("probe") == data
+    except Exception:
+        return False
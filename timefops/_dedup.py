@@ -0,0 +1,72 @@
+"""Content deduplication for timefops.
+    Files are only compared with files of the same size, so most of them are
+    never read.  Candidates are told apart by a hash of their first 64 KiB,
+    and only files that still match (and are bigger than that) get hashed in
+    full.  Hashing runs on several threads (hashlib releases the GIL on big
+    buffers).
+"""
+
+import hashlib
+from ._transfer import ordered_map
+
+
+HEAD_SIZE = 1 << 16
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path, limit=None):
+    """Returns the BLAKE2b digest of the file at 'path', or of its first
+    'limit' bytes."""
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        if limit is not None:
+            h.update(f.read(limit))
+        else:
+            for buf in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(buf)
+    return h.digest()
+
+
+def _regroup(groups, limit, jobs):
+    """Splits every (size, [path, ...]) group by digest, keeping the groups
+    of two or more; files that can't be read are left out."""
+    digests = {}
+    todo = ((path, limit) for _, paths in groups for path in paths)
+    for (path, _), digest, exc in ordered_map(file_digest, todo, jobs=jobs):
+        if exc is None:
+            digests[path] = digest
+
+    out = []
+    for size, paths in groups:
+        same = {}
+        for path in paths:
+            if path in digests:
+                same.setdefault(digests[path], []).append(path)
+        out.extend((size, g) for g in same.values() if len(g) > 1)
+    return out
+
+
+def find_duplicates(entries, jobs=4):
+    """
+    *args:
+    entries - iterable: ScanEntry of the items (directories and symlinks
+              are ignored).
+
+    **kwargs:
+    jobs - int: number of threads hashing files.
+
+    Returns:
+    dict - path of every duplicate file -> path of the first file (in the
+           order of 'entries') with the same content.
+    """
+    by_size = {}
+    for e in entries:
+        if not (e.is_dir or e.is_link) and e.size:
+            by_size.setdefault(e.size, []).append(e.path)
+    groups = [(size, paths) for size, paths in by_size.items()
+              if len(paths) > 1]
+
+    groups = _regroup(groups, HEAD_SIZE, jobs)
+    done = [g for g in groups if g[0] <= HEAD_SIZE]
+    done += _regroup([g for g in groups if g[0] > HEAD_SIZE], None, jobs)
+    return {path: paths[0] for _, paths in done for path in paths[1:]}
@@ -0,0 +1,115 @@
+"""Scan-time filters for timefops.
+    An EntryFilter is checked against every ScanEntry as soon as it is
+    stat'ed, items it rejects are never bucketed, renamed or transferred.
+"""
+
+import os
+import re
+import time
+import fnmatch
+from datetime import datetime as dt
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)([smhdw])", re.IGNORECASE)
+_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_SIZE = re.compile(r"(\d+(?:\.\d+)?)([kmgt]?)i?b?", re.IGNORECASE)
+_BYTES = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_time(value, now=None):
+    """
+    *args:
+    value - str: an ISO date/time ('2020-04-01', '2020-04-01 12:30'), or an
+            age relative to 'now' ('90m', '12h', '30d', '2w').
+
+    **kwargs:
+    now - float (optional): timestamp ages are relative to, the current time
+          by default.
+
+    Returns:
+    float - timestamp (local time for dates without a timezone).
+    """
+    m = _DURATION.fullmatch(value.strip())
+    if m:
+        return (time.time() if now is None else now) - \
+               float(m.group(1)) * _SECONDS[m.group(2).lower()]
+    try:
+        return dt.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"'{value}' is neither a date (YYYY-MM-DD[ HH:MM]) "
+                         "nor an age (e.g. 30d, 12h)") from None
+
+
+def parse_size(value):
+    """
+    *args:
+    value - str: size in bytes, or with a binary suffix ('100K', '1.5G').
+
+    Returns:
+    int - size in bytes.
+    """
+    m = _SIZE.fullmatch(value.strip())
+    if not m:
+        raise ValueError(f"'{value}' is not a size (e.g. 512, 100K, 1.5G)")
+    return int(float(m.group(1)) * _BYTES[m.group(2).lower()])
+
+
+class EntryFilter:
+    def __init__(self, attr="mtime", newer=None, older=None, min_size=None,
+                 max_size=None, include=(), exclude=()):
+        """
+        **kwargs:
+        attr - str: time checked by 'newer'/'older' (atime, ctime, mtime).
+        newer - float (optional): keep items with a time at or after this.
+        older - float (optional): keep items with a time before this.
+        min_size - int (optional): keep files of at least this many bytes.
+        max_size - int (optional): keep files of at most this many bytes.
+        include - list: glob patterns, keep items whose name matches one.
+        exclude - list: glob patterns, drop items whose name matches one.
+
+        Sizes only apply to files, a directory's own size says nothing about
+        what's inside it.  Patterns are matched against the item's name.
+        """
+        self.attr = attr[3:] if attr.startswith("get") else attr
+        self.newer = newer
+        self.older = older
+        self.min_size = min_size
+        self.max_size = max_size
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.rejected = 0
+
+
+    def __bool__(self):
+        return any(x is not None for x in (self.newer, self.older,
+                                           self.min_size, self.max_size)) or \
+               bool(self.include or self.exclude)
+
+
+    def _match(self, e):
+        t = getattr(e, self.attr)
+        if self.newer is not None and t < self.newer:
+            return False
+        if self.older is not None and t >= self.older:
+            return False
+        if not e.is_dir:
+            if self.min_size is not None and e.size < self.min_size:
+                return False
+            if self.max_size is not None and e.size > self.max_size:
+                return False
+        if self.include or self.exclude:
+            name = os.path.basename(e.path)
+            if self.include and not any(fnmatch.fnmatch(name, p)
+                                        for p in self.include):
+                return False
+            if any(fnmatch.fnmatch(name, p) for p in self.exclude):
+                return False
+        return True
+
+
+    def __call__(self, e):
+        """Returns whether the ScanEntry 'e' should be kept."""
+        if self._match(e):
+            return True
+        self.rejected += 1
+        return False
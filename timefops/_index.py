@@ -0,0 +1,169 @@
+"""Sidecar indexes for timefops archives.
+    An index ('logs.tar.xz.idx', next to the archive) is a file of JSON
+    lines: a header (format, compression, block size), then a record per
+    member with its name, the time str it was archived under, its type,
+    size and offset (and target, for hardlinks).  Compressed tar archives
+    with an index are written in independent blocks (see
+    _compress.ParallelWriter), and every record also holds the compressed
+    offset of the block the member starts in, so a member can be read by
+    decompressing from there instead of from the start of the archive.
+"""
+
+import os
+import bz2
+import gzip
+import json
+import lzma
+import tarfile
+import contextlib
+
+
+VERSION = 1
+
+INDEX_SUFFIX = ".idx"
+
+# compression shorthand -> reader for (concatenated) blocks of it.
+DECOMPRESSORS = {
+    "gz": lambda f: gzip.GzipFile(fileobj=f, mode="rb"),
+    "bz2": bz2.BZ2File,
+    "xz": lzma.LZMAFile,
+}
+
+
+class ArchiveIndexError(ValueError):
+    """The index file can't be read."""
+
+
+def index_path(archive):
+    """Returns the path of the index of 'archive'."""
+    return archive + INDEX_SUFFIX
+
+
+class IndexedTarFile(tarfile.TarFile):
+    """TarFile that keeps the offset of the members it adds (tarfile only
+    sets it for the ones it reads)."""
+    def addfile(self, tarinfo, fileobj=None):
+        offset = self.offset
+        super().addfile(tarinfo, fileobj)
+        self.members[-1].offset = offset
+
+
+def _tar_type(m):
+    if m.isdir():
+        return "dir"
+    if m.issym():
+        return "symlink"
+    if m.islnk():
+        return "link"
+    return "file" if m.isfile() else "other"
+
+
+class ArchiveIndex:
+    def __init__(self, path, kind, compression=None):
+        """
+        *args:
+        path - str: index file to write (refused if it exists).
+        kind - str: 'tar' or 'zip'.
+
+        **kwargs:
+        compression - str (optional): compression shorthand of the archive.
+
+        Collects what the index needs while the archive is written: the time
+        str of every member (see tag()) and, for compressed tar archives,
+        the block size and compressed offset of every block.
+        """
+        self.path = path
+        self.kind = kind
+        self.compression = compression or None
+        self.buckets = []
+        self.block_size = None
+        self.blocks = None
+
+
+    def tag(self, members, bucket):
+        """Records 'bucket' as the time str of the members of the archive
+        ('members', TarFile.members/ZipFile.filelist) added since the last
+        call."""
+        self.buckets.extend([bucket.replace(os.sep, "/")] *
+                            (len(members) - len(self.buckets)))
+
+
+    def _records(self, members):
+        for m, bucket in zip(members, self.buckets):
+            if self.kind == "zip":
+                yield {"name": m.filename.rstrip("/"), "bucket": bucket,
+                       "type": "dir" if m.is_dir() else "file",
+                       "offset": m.header_offset, "size": m.file_size,
+                       "compressed": m.compress_size}
+                continue
+            rec = {"name": m.name, "bucket": bucket, "type": _tar_type(m),
+                   "offset": m.offset, "size": m.size}
+            if m.islnk():
+                rec["link"] = m.linkname
+            if self.blocks is not None:
+                rec["block"] = self.blocks[m.offset // self.block_size]
+            yield rec
+
+
+    def write(self, members):
+        """
+        *args:
+        members - list: TarFile.members (of an IndexedTarFile) or
+                  ZipFile.filelist of the finished archive.
+
+        Writes the index.
+        """
+        header = {"index": VERSION, "format": self.kind,
+                  "compression": self.compression,
+                  "block_size": self.block_size}
+        with open(self.path, "x", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for rec in self._records(members):
+                f.write(json.dumps(rec) + "\n")
+
+
+def read_index(path):
+    """
+    *args:
+    path - str: index file.
+
+    Raises:
+    ArchiveIndexError - if the file isn't a timefops index.
+
+    Returns:
+    tuple - (header, [member record, ...]), both dicts as written by
+            ArchiveIndex.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if not isinstance(header, dict) or \
+                    header.get("index") != VERSION:
+                raise ValueError
+            return header, [json.loads(line) for line in f if line.strip()]
+    except ValueError:
+        raise ArchiveIndexError(f"'{path}' is not a timefops index.")
+
+
+@contextlib.contextmanager
+def open_at(archive, header, rec):
+    """
+    *args:
+    archive - str: tar archive.
+    header - dict: header of its index.
+    rec - dict: index record of a member.
+
+    Opens 'archive' as a stream (tarfile mode 'r|') starting at the member
+    of 'rec': uncompressed archives are seeked to its header, compressed
+    ones to the start of its block, then decompressed up to its header.
+    """
+    with open(archive, "rb") as raw:
+        if header["compression"]:
+            raw.seek(rec["block"])
+            f = DECOMPRESSORS[header["compression"]](raw)
+            f.read(rec["offset"] % header["block_size"])
+        else:
+            raw.seek(rec["offset"])
+            f = raw
+        with f, tarfile.open(fileobj=f, mode="r|") as t:
+            yield t
@@ -0,0 +1,175 @@
+"""Write-ahead journal for resumable runs.
+    An append-only file of JSON lines: a header naming the task, every
+    planned item (source, time str, name) before it is transferred, a marker
+    once the whole plan is in, and every item done.  A run that was killed
+    can be picked up from it with exactly the same names, whatever happened
+    to the sources since.
+"""
+
+import os
+import json
+
+
+VERSION = 1
+
+
+class JournalError(ValueError):
+    """The journal file can't be used for this run."""
+
+
+class Journal:
+    def __init__(self, path, task, sync_every=1000):
+        """
+        *args:
+        path - str: journal file (created if needed).
+        task - str: identifies the operation, destination and folder format;
+               an existing journal of a different task is refused.
+
+        **kwargs:
+        sync_every - int: records written between fsync() calls.  Records
+                     are flushed to the OS after every item, so only a
+                     crash of the machine can lose the last ones; an item
+                     whose 'done' record got lost is simply done again.
+
+        Raises:
+        JournalError - if the file isn't a journal, or is the journal of
+                       another task.
+
+        'planned' and 'done' hold what an existing journal had in it; items
+        planned and done by this run are only written to the file, so a
+        streamed run keeps no per-item state in memory.
+        """
+        self.path = path
+        self.task = task
+        self.sync_every = sync_every
+        self.planned = {}
+        self.done = set()
+        self.complete = False
+        if os.path.exists(path):
+            self._load()
+        self._num_planned = len(self.planned)
+        self._f = open(path, "a", encoding="utf-8")
+        if not self.planned and os.path.getsize(path) == 0:
+            self._write({"journal": VERSION, "task": task})
+        self._unsynced = 0
+
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        for n, line in enumerate(lines):
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                if n == len(lines) - 1:
+                    # the last line was being written when the run died
+                    break
+                raise JournalError(f"'{self.path}' is not a timefops "
+                                   "journal.")
+            if n == 0:
+                if not isinstance(rec, dict) or \
+                        rec.get("journal") != VERSION:
+                    raise JournalError(f"'{self.path}' is not a timefops "
+                                       "journal.")
+                if rec.get("task") != self.task:
+                    raise JournalError(f"journal '{self.path}' belongs to "
+                                       f"another run ('{rec.get('task')}').")
+            elif "src" in rec:
+                self.planned[rec["src"]] = (rec["bucket"], rec["name"])
+            elif "done" in rec:
+                self.done.add(rec["done"])
+            elif "planned" in rec:
+                self.complete = True
+        if lines and lines[-1]:
+            # make sure the next record starts on a line of its own
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+
+    @property
+    def resuming(self):
+        return bool(self.planned)
+
+
+    def pending(self):
+        """
+        Returns:
+        list - (source path, time str, name) of the planned items that
+               aren't done, in plan order.
+        """
+        return [(src, p, name) for src, (p, name) in self.planned.items()
+                if src not in self.done]
+
+
+    def _write(self, rec):
+        self._f.write(json.dumps(rec) + "\n")
+        self._f.flush()
+
+
+    def sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+
+
+    def plan(self, plan):
+        """
+        *args:
+        plan - iterable: (ScanEntry, time str, basename), see Timefops._plan.
+
+        Journals the items of 'plan' before they are handed out.  A list is
+        written (and synced) as a whole up front; anything else is written
+        item by item as it is iterated.
+
+        Returns:
+        iterable - the same items.
+        """
+        if isinstance(plan, list):
+            for e, p, name in plan:
+                self._add(e, p, name)
+            self._end_plan()
+            return plan
+        return self._stream(plan)
+
+
+    def _stream(self, plan):
+        for e, p, name in plan:
+            self._add(e, p, name)
+            self._f.flush()
+            yield e, p, name
+        self._end_plan()
+
+
+    def _add(self, e, p, name):
+        self._num_planned += 1
+        self._f.write(json.dumps({"src": e.path, "bucket": p,
+                                  "name": name}) + "\n")
+
+
+    def _end_plan(self):
+        self._write({"planned": self._num_planned})
+        self.complete = True
+        self.sync()
+
+
+    def record(self, path):
+        """Marks the item with source 'path' as done."""
+        self._write({"done": path})
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+
+    def close(self):
+        """Syncs and closes the journal, to be resumed from later."""
+        if not self._f.closed:
+            self.sync()
+            self._f.close()
+
+
+    def finish(self):
+        """Closes and removes the journal of a run that completed."""
+        self._f.close()
+        os.remove(self.path)
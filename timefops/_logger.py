@@ -1,16 +1,26 @@
+import json
+import atexit
 import logging
+import logging.handlers
+from queue import SimpleQueue
+from datetime import datetime as dt
 import colorama as clr
 
 
+VERBOSE, SUCCESS = 15, 25
+logging.addLevelName(VERBOSE, "VERBOSE")
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+
 class LogFormatter(logging.Formatter):
     @staticmethod
     def _gen_msg(content, esc_code=""):
         """Generates either a colored or uncolored log message."""
         if esc_code:
             return getattr(clr.Fore, f"{esc_code}") + \
-                    f"{content} %(msg)s" + clr.Style.RESET_ALL
+                    f"{content} %(message)s" + clr.Style.RESET_ALL
         else:
-            return f"{content} %(msg)s"
+            return f"{content} %(message)s"
 
 
     def __init__(self, *custom_formats, color=True):
@@ -25,30 +35,105 @@ class LogFormatter(logging.Formatter):
                     if color else ""),
             logging.DEBUG: self._gen_msg("%(levelname)s:", esc_code="CYAN" \
                     if color else ""),
-            logging.INFO: "%(msg)s",
-            "DEFAULT": "%(levelname)s: %(msg)s",
+            logging.INFO: "%(message)s",
+            "DEFAULT": "%(levelname)s: %(message)s",
         }
 
         for d in custom_formats:
             for k, v in d.items():
                 self.FORMATS[k] = v
 
+        # one Formatter per level, built once rather than for every record
+        self._formatters = {k: logging.Formatter(v)
+                            for k, v in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno, self.FORMATS["DEFAULT"])
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        return self._formatters.get(record.levelno,
+                                    self._formatters["DEFAULT"]).format(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record (time, level, logger, message), for log
+    shippers."""
+    def format(self, record):
+        out = {
+            "time": dt.fromtimestamp(record.created).astimezone().isoformat(
+                timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage().strip("\n"),
+        }
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out)
+
+
+def _remove_handlers(logger):
+    """Removes the handler(s) an earlier init_logging() added to 'logger',
+    stopping their queue listener."""
+    for h in [h for h in logger.handlers if hasattr(h, "_timefops")]:
+        logger.removeHandler(h)
+        listener = h._timefops
+        if listener is not None:
+            atexit.unregister(listener.stop)
+            listener.stop()
 
 
-def init_logging(loglevel, name, color=True):
+def init_logging(loglevel, name, color=True, json_lines=False, queue=False):
+    """
+    *args:
+    loglevel - int: logging level.
+    name - str: logger name.
+
+    **kwargs:
+    color - bool: coloured output (text only).
+    json_lines - bool: write JSON lines (see JSONFormatter) instead of text.
+    queue - bool: hand records to a queue, formatted and written by a
+            background thread (logging.handlers.QueueListener) so the
+            threads logging don't wait on the stream.
+
+    Calling this again for the same logger replaces its handler instead of
+    adding another one.
+
+    Returns:
+    logging.Logger - with verbose() and success() methods (levels 15 and
+                     25), which do nothing when their level is disabled.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(loglevel)
-    logger.verbose = lambda msg, *args: logger._log(15, msg, args)
-    logger.success = lambda msg, *args: logger._log(25, msg, args)
+
+    def verbose(msg, *args):
+        if logger.isEnabledFor(VERBOSE):
+            logger._log(VERBOSE, msg, args)
+
+    def success(msg, *args):
+        if logger.isEnabledFor(SUCCESS):
+            logger._log(SUCCESS, msg, args)
+
+    logger.verbose = verbose
+    logger.success = success
+
     log_stream = logging.StreamHandler()
     log_stream.setLevel(loglevel)
-    log_stream.setFormatter(LogFormatter({
-      15: "VERBOSE: %(msg)s", 
-      25: LogFormatter._gen_msg("SUCCESS:", esc_code="GREEN" if color else "")
-    }, color=color))
-    logger.addHandler(log_stream)
+    if json_lines:
+        log_stream.setFormatter(JSONFormatter())
+    else:
+        log_stream.setFormatter(LogFormatter({
+          VERBOSE: "VERBOSE: %(message)s",
+          SUCCESS: LogFormatter._gen_msg("SUCCESS:",
+                                         esc_code="GREEN" if color else "")
+        }, color=color))
+
+    _remove_handlers(logger)
+    if queue:
+        handler = logging.handlers.QueueHandler(SimpleQueue())
+        handler._timefops = logging.handlers.QueueListener(
+            handler.queue, log_stream, respect_handler_level=True)
+        handler._timefops.start()
+        atexit.register(handler._timefops.stop)
+    else:
+        handler = log_stream
+        handler._timefops = None
+    logger.addHandler(handler)
     return logger
+
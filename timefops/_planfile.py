@@ -0,0 +1,76 @@
+"""Plan files for timefops.
+    A plan (what _plan() decides: every item's source, time str and final
+    name) can be written to a file instead of being carried out, reviewed,
+    and run later or somewhere else without scanning the sources again.  The
+    file is JSON lines: a header with the operation, time, folder format,
+    sources, destination and the settings the result depends on, then one
+    line per item with its expected size.
+"""
+
+import os
+import json
+from ._state import tree_signature
+
+
+VERSION = 1
+
+
+class PlanError(ValueError):
+    """The plan file can't be used."""
+
+
+def write_plan(path, operation, src, dst, method, fmt, plan, options=None):
+    """
+    *args:
+    path - str: plan file to write (refused if it exists).
+    operation - str: 'move', 'copy' or 'archive'.
+    src - list: source directories/files the plan was made from.
+    dst - str: destination directory or archive.
+    method - str: time used (atime, ctime, mtime).
+    fmt - list: datetime format(s).
+    plan - iterable: (ScanEntry, time str, basename), see Timefops._plan.
+
+    **kwargs:
+    options - dict (optional): operation settings (JSON types only).
+
+    Paths are written absolute, so the plan can be run from any directory.
+    The expected size of a directory is the total size of the files in it.
+
+    Returns:
+    int - number of items written.
+    """
+    header = {"plan": VERSION, "operation": operation,
+              "src": [os.path.abspath(x) for x in src],
+              "dst": os.path.abspath(dst), "method": method,
+              "format": list(fmt), "options": options or {}}
+    n = 0
+    with open(path, "x", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for n, (e, p, name) in enumerate(plan, 1):
+            size = tree_signature(e.path)[1] if e.is_dir else e.size
+            f.write(json.dumps({"src": os.path.abspath(e.path), "bucket": p,
+                                "name": name, "size": size,
+                                "dir": e.is_dir}) + "\n")
+    return n
+
+
+def read_plan(path):
+    """
+    *args:
+    path - str: plan file.
+
+    Raises:
+    PlanError - if the file isn't a timefops plan.
+
+    Returns:
+    tuple - (header, [item, ...]), both dicts as written by write_plan().
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if not isinstance(header, dict) or \
+                    header.get("plan") != VERSION:
+                raise ValueError
+            return header, [json.loads(line) for line in f if line.strip()]
+    except ValueError:
+        raise PlanError(f"'{path}' is not a timefops plan.")
@@ -0,0 +1,148 @@
+"""Instrumentation for timefops.
+    A Profiler adds up the time spent in each phase of an operation (scan,
+    bucket, rename, makedirs, copy, ...) along with counters (syscalls,
+    items, bytes, copy methods).  Phases nest, and the time of an inner
+    phase is not counted again in the outer one, so the phases add up to
+    the total.  Timers are kept per thread, so one Profiler can be shared by
+    operations running at the same time (AsyncTimefops).
+
+    Timefops uses NULL_PROFILER when profiling is off: its methods do
+    nothing and wrap()/iterate() hand back what they were given, so the
+    instrumented code runs as it would without it.
+"""
+
+import time
+import threading
+import contextlib
+import collections
+
+
+class Profiler:
+    def __init__(self, hooks=()):
+        """
+        **kwargs:
+        hooks - list: callables called as hook(phase, seconds) whenever a
+                phase ends (seconds exclusive of nested phases).
+        """
+        self.hooks = list(hooks)
+        self.phases = collections.defaultdict(lambda: [0.0, 0])
+        self.counters = collections.Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+
+    def __bool__(self):
+        return True
+
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the block as phase 'name'."""
+        stack = self._stack()
+        # [start, time spent in nested phases]
+        frame = [time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if stack:
+                stack[-1][1] += elapsed
+            own = elapsed - frame[1]
+            with self._lock:
+                p = self.phases[name]
+                p[0] += own
+                p[1] += 1
+            for hook in self.hooks:
+                hook(name, own)
+
+
+    def wrap(self, name, func):
+        """Returns 'func' timed as phase 'name' on every call."""
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return timed
+
+
+    def iterate(self, name, iterable):
+        """Yields from 'iterable', timing the work of producing each item as
+        phase 'name' (for generators that interleave with the consumer)."""
+        it = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+
+    def update(self, counts):
+        """Adds a mapping of counters (e.g. Scanner.syscalls)."""
+        with self._lock:
+            self.counters.update(counts)
+
+
+    def report(self):
+        """
+        Returns:
+        list - lines of a phase breakdown and the counters, for logging.
+        """
+        total = time.perf_counter() - self._start
+        lines = [f"{'phase':<12} {'seconds':>10} {'share':>7} {'calls':>9}"]
+        for name, (seconds, calls) in sorted(self.phases.items(),
+                                             key=lambda x: -x[1][0]):
+            lines.append(f"{name:<12} {seconds:>10.4f} "
+                         f"{seconds / total if total else 0:>7.1%} "
+                         f"{calls:>9}")
+        rest = total - sum(s for s, _ in self.phases.values())
+        lines.append(f"{'(other)':<12} {max(rest, 0):>10.4f} "
+                     f"{max(rest, 0) / total if total else 0:>7.1%}")
+        lines.append(f"{'total':<12} {total:>10.4f}")
+        if self.counters:
+            lines.append("counters: " + ", ".join(
+                f"{k} {v}" for k, v in sorted(self.counters.items())))
+        return lines
+
+
+class _NullProfiler:
+    """Stands in for a Profiler when profiling is off."""
+    hooks = ()
+
+    def __bool__(self):
+        return False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def wrap(self, name, func):
+        return func
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def count(self, name, n=1):
+        pass
+
+    def update(self, counts):
+        pass
+
+
+_NULL_PHASE = contextlib.nullcontext()
+NULL_PROFILER = _NullProfiler()
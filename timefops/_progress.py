@@ -0,0 +1,160 @@
+"""Progress reporting for long timefops runs.
+    A Progress polls an operation's Report from a thread of its own at a
+    fixed interval, so the transfer loop does nothing extra per item.  On a
+    terminal it redraws a single status line; otherwise (a log file, a pipe
+    to a log shipper) it writes one JSON object per update.
+"""
+
+import sys
+import json
+import time
+import threading
+import collections
+
+
+def human_size(n):
+    """Formats a number of bytes with binary units (as parse_size reads
+    them)."""
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(n) < 1024 or unit == "TiB":
+            break
+        n /= 1024
+    return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+
+
+def human_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+class Progress:
+    def __init__(self, report, items=None, size=None, interval=None,
+                 stream=None, window=10):
+        """
+        *args:
+        report - Report: the running operation's report (see _report).
+
+        **kwargs:
+        items - int (optional): number of items planned (None if unknown,
+                e.g. while streaming).
+        size - int (optional): bytes of the files planned.
+        interval - float: seconds between updates (0.5 on a terminal, 10
+                   otherwise, by default).
+        stream - file: where to write (stderr by default).
+        window - int: number of updates the rates (and so the ETA) are
+                 averaged over.
+        """
+        self.report = report
+        self.items = items
+        self.size = size
+        self.stream = stream or sys.stderr
+        try:
+            self.tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self.tty = False
+        self.interval = interval or (0.5 if self.tty else 10.0)
+        self._samples = collections.deque(maxlen=window + 1)
+        self._stop = threading.Event()
+        self._thread = None
+        self._width = 0
+        self._started = None
+
+
+    def status(self):
+        """
+        Returns:
+        dict - items and bytes done, totals (None if unknown), rates over
+               the last updates, bytes left and ETA in seconds (None if
+               unknown).
+        """
+        report = self.report
+        now = time.perf_counter()
+        done, nbytes = len(report), report.bytes
+        self._samples.append((now, done, nbytes))
+        t0, done0, bytes0 = self._samples[0]
+        span = now - t0
+        items_rate = (done - done0) / span if span > 0 else 0.0
+        bytes_rate = (nbytes - bytes0) / span if span > 0 else 0.0
+
+        left = None if self.size is None else max(self.size - nbytes, 0)
+        eta = None
+        if left is not None and bytes_rate > 0 and self.size:
+            eta = left / bytes_rate
+        elif self.items is not None and items_rate > 0:
+            eta = max(self.items - done, 0) / items_rate
+        return {
+            "operation": report.operation,
+            "items": done,
+            "total_items": self.items,
+            "skipped": report.skipped,
+            "bytes": nbytes,
+            "total_bytes": self.size,
+            "bytes_left": left,
+            "items_per_second": round(items_rate, 1),
+            "bytes_per_second": round(bytes_rate),
+            "eta": None if eta is None else round(eta, 1),
+            "elapsed": round(now - self._started, 1),
+        }
+
+
+    def _line(self, st):
+        items = f"{st['items']}" if st["total_items"] is None else \
+                f"{st['items']}/{st['total_items']}"
+        parts = [f"{items} items", human_size(st["bytes"])]
+        if st["skipped"]:
+            parts.append(f"{st['skipped']} skipped")
+        parts.append(f"{st['items_per_second']:.0f} items/s")
+        parts.append(f"{human_size(st['bytes_per_second'])}/s")
+        if st["bytes_left"] is not None:
+            parts.append(f"{human_size(st['bytes_left'])} left")
+        if st["eta"] is not None:
+            parts.append(f"ETA {human_time(st['eta'])}")
+        return "  ".join(parts)
+
+
+    def draw(self, final=False):
+        st = self.status()
+        if self.tty:
+            line = self._line(st)
+            pad = max(self._width - len(line), 0)
+            self._width = len(line)
+            self.stream.write(f"\r{line}{' ' * pad}" +
+                              ("\n" if final else ""))
+        else:
+            if final:
+                st["done"] = True
+            self.stream.write(json.dumps(st) + "\n")
+        self.stream.flush()
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.draw()
+
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._samples.append((self._started, len(self.report),
+                              self.report.bytes))
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="timefops-progress")
+        self._thread.start()
+        return self
+
+
+    def close(self):
+        """Stops updating, writes the final status."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.draw(final=True)
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,66 @@
+"""Name collision handling for timefops.
+    Items that end up with the same name under the same folder get enumerated
+    ('name(1).ext', 'name(2).ext', ...), in the order they were scanned.
+"""
+
+import os
+
+
+def add_enumerate(f, num):
+    """Seperates a path and adds 'num' in the right spot, used for renaming."""
+    name, suffix = os.path.splitext(f)
+    return f"{name}({num}){suffix}"
+
+
+class NameResolver:
+    def __init__(self, dst=None, taken=()):
+        """
+        **kwargs:
+        dst - str (optional): destination directory, names that already exist
+              under it are treated as taken.
+        taken - iterable: (folder, name) pairs to treat as taken too (names
+                given out by an earlier run that aren't there yet).
+
+        Single pass collision resolver, keyed on (folder, name).  Every name
+        handed out is remembered, so a generated 'a(1).txt' can't clash with
+        an item that is really called 'a(1).txt'.
+        """
+        self.dst = dst
+        self.counts = {}
+        self._existing = {}
+        for key in taken:
+            self.counts.setdefault(tuple(key), 1)
+
+
+    def _exists(self, folder, name):
+        """Whether 'name' already exists in the destination 'folder'; each
+        folder is only listed once."""
+        if self.dst is None:
+            return False
+
+        try:
+            names = self._existing[folder]
+        except KeyError:
+            try:
+                names = set(os.listdir(os.path.join(self.dst, folder)))
+            except OSError:
+                names = set()
+            self._existing[folder] = names
+        return name in names
+
+
+    def __call__(self, folder, basename):
+        """Returns the name 'basename' should be given under 'folder'."""
+        key = (folder, basename)
+        k = self.counts.get(key, 0)
+        name = add_enumerate(basename, k) if k else basename
+
+        while (k and (folder, name) in self.counts) or \
+                self._exists(folder, name):
+            k += 1
+            name = add_enumerate(basename, k)
+
+        self.counts[key] = k + 1
+        if k:
+            self.counts.setdefault((folder, name), 1)
+        return name
@@ -0,0 +1,154 @@
+"""Results of timefops operations.
+    A Report keeps one row per item in columns (lists of shared strings and
+    typed arrays) rather than one object per item, so a run over millions
+    of items costs a few bytes per item.  Rows are turned into ItemResults
+    only when they are looked at.
+"""
+
+import os
+import time
+import array
+import collections
+
+
+ItemResult = collections.namedtuple("ItemResult", (
+    "path", "bucket", "name", "target", "status", "size", "duration", "error"
+))
+
+DONE, SKIPPED = 0, 1
+STATUS = ("done", "skipped")
+
+
+class Report:
+    __slots__ = ("operation", "dst", "on_item", "paths", "buckets", "names",
+                 "errors", "unchanged", "_status", "_sizes", "_durations",
+                 "_bytes", "_start", "elapsed")
+
+    def __init__(self, operation, dst="", on_item=None):
+        """
+        *args:
+        operation - str: name of the operation (move, copy, archive).
+
+        **kwargs:
+        dst - str: destination directory; targets are relative to the
+              archive for archives.
+        on_item - callable (optional): called as on_item(entry, target,
+                  error) for every item added.
+
+        Item sizes are the items' own (files only, 0 for directories),
+        durations the time spent on each item by whichever thread did it.
+        """
+        self.operation = operation
+        self.dst = dst
+        self.on_item = on_item
+        self.paths = []
+        self.buckets = []
+        self.names = []
+        self.errors = {}
+        self.unchanged = 0
+        self._status = array.array("b")
+        self._sizes = array.array("q")
+        self._durations = array.array("d")
+        self._bytes = 0
+        self._start = time.perf_counter()
+        self.elapsed = None
+
+
+    def add(self, e, p, name, error=None, duration=0.0):
+        """
+        *args:
+        e - ScanEntry: the item.
+        p - str: time str (folder) it went to.
+        name - str: name it got.
+
+        **kwargs:
+        error - Exception (optional): what the item was skipped for.
+        duration - float: seconds spent on the item.
+        """
+        size = 0 if e.is_dir else e.size
+        if error is not None:
+            self.errors[len(self.paths)] = error
+        else:
+            self._bytes += size
+        self.paths.append(e.path)
+        self.buckets.append(p)
+        self.names.append(name)
+        self._status.append(DONE if error is None else SKIPPED)
+        self._sizes.append(size)
+        self._durations.append(duration)
+        if self.on_item is not None:
+            self.on_item(e, os.path.join(self.dst, p, name), error)
+
+
+    def finish(self):
+        """Stops the clock, returns the report."""
+        self.elapsed = time.perf_counter() - self._start
+        return self
+
+
+    def __len__(self):
+        return len(self.paths)
+
+
+    def __getitem__(self, i):
+        return ItemResult(self.paths[i], self.buckets[i], self.names[i],
+                          os.path.join(self.dst, self.buckets[i],
+                                       self.names[i]),
+                          STATUS[self._status[i]], self._sizes[i],
+                          self._durations[i], self.errors.get(i))
+
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+    @property
+    def done(self):
+        return len(self) - len(self.errors)
+
+
+    @property
+    def skipped(self):
+        return len(self.errors)
+
+
+    @property
+    def bytes(self):
+        """Bytes of the items that were done (kept as a running total, so
+        it can be polled while the operation runs)."""
+        return self._bytes
+
+
+    def failed(self):
+        """ItemResults of the skipped items (to retry them)."""
+        return [self[i] for i in sorted(self.errors)]
+
+
+    def renamed(self):
+        """ItemResults of the items that got enumerated names."""
+        return [self[i] for i, (path, name) in
+                enumerate(zip(self.paths, self.names))
+                if os.path.basename(path) != name]
+
+
+    def summary(self):
+        """
+        Returns:
+        dict - aggregate counters and throughput.
+        """
+        elapsed = self.elapsed if self.elapsed is not None else \
+                  time.perf_counter() - self._start
+        done, size = self.done, self.bytes
+        return {
+            "operation": self.operation,
+            "items": len(self),
+            "done": done,
+            "skipped": self.skipped,
+            "unchanged": self.unchanged,
+            "renamed": sum(os.path.basename(path) != name for path, name in
+                           zip(self.paths, self.names)),
+            "bytes": size,
+            "seconds": elapsed,
+            "items_per_second": done / elapsed if elapsed else 0.0,
+            "bytes_per_second": size / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,202 @@
+"""Directory scanning for timefops.
+    Every entry is stat'ed at most once, and the fields that the operations
+    need from that stat are kept in a compact ScanEntry record.
+"""
+
+import os
+import stat
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+# directories listed ahead of the consumer of a threaded walk, per thread
+READ_AHEAD = 64
+
+# is_link is only ever True for entries of walk(), which doesn't follow
+# symlinks; the other scans stat what a link points to.
+ScanEntry = collections.namedtuple("ScanEntry", ("path", "size", "atime",
+                                                 "ctime", "mtime", "is_dir",
+                                                 "inode", "is_link"),
+                                   defaults=(False,))
+
+
+class Scanner:
+    def __init__(self, onerror=None, predicate=None):
+        """
+        **kwargs:
+        onerror - callable (optional): called with the OSError raised for an
+                  entry that can't be listed/stat'ed, the entry is skipped.
+        predicate - callable (optional): called with every ScanEntry, entries
+                    it returns False for are dropped (see _filter).
+        """
+        self.onerror = onerror
+        self.predicate = predicate
+        self.syscalls = collections.Counter()
+
+
+    @staticmethod
+    def make_entry(path, st):
+        """Builds a ScanEntry for 'path' from an os.stat_result."""
+        return ScanEntry(path, st.st_size, st.st_atime, st.st_ctime,
+                         st.st_mtime, stat.S_ISDIR(st.st_mode), st.st_ino,
+                         stat.S_ISLNK(st.st_mode))
+
+
+    def _error(self, exc):
+        if self.onerror is None:
+            raise exc
+        self.onerror(exc)
+
+
+    def stat(self, path):
+        """Stats a single path (following symlinks, like os.path.get*time)."""
+        self.syscalls["stat"] += 1
+        return self.make_entry(path, os.stat(path))
+
+
+    def scandir(self, path):
+        """Yields a ScanEntry for each immediate child of the 'path' directory,
+        reusing the DirEntry objects instead of looking children up by name."""
+        root = os.path.abspath(path)
+        self.syscalls["scandir"] += 1
+        try:
+            it = os.scandir(root)
+        except OSError as exc:
+            self._error(exc)
+            return
+
+        with it:
+            for d in it:
+                self.syscalls["stat"] += 1
+                try:
+                    st = d.stat()
+                except OSError as exc:
+                    self._error(exc)
+                    continue
+                yield self.make_entry(os.path.join(root, d.name), st)
+
+
+    def _read_dir(self, path):
+        """Lists one directory for walk(), returns (file entries,
+        subdirectory paths, errors, number of stat calls)."""
+        files, dirs, errors, stats = [], [], [], 0
+        try:
+            it = os.scandir(path)
+        except OSError as exc:
+            return files, dirs, [exc], stats
+
+        with it:
+            for d in it:
+                try:
+                    # d_type is enough for this, no stat needed
+                    if d.is_dir(follow_symlinks=False):
+                        dirs.append(d.path)
+                        continue
+                    stats += 1
+                    st = d.stat(follow_symlinks=False)
+                except OSError as exc:
+                    errors.append(exc)
+                    continue
+                files.append(self.make_entry(d.path, st))
+        return files, dirs, errors, stats
+
+
+    def walk(self, path, threads=1):
+        """
+        *args:
+        path - str: directory path.
+
+        **kwargs:
+        threads - int: number of threads listing directories.
+
+        Yields a ScanEntry for every file under 'path', at any depth, in
+        breadth-first order.  Symlinks are not followed: a link (to a file
+        or a directory) is yielded as an entry of its own, with the link's
+        times and is_link set, and is transferred as a link.  With several
+        threads, every directory is queued on the pool as soon as its parent
+        has been listed, so idle threads pick up whatever directory is
+        pending, wherever it is in the tree; the entries still come out in
+        the same order as a serial walk.
+        No more than READ_AHEAD directories per thread are listed ahead of
+        the consumer, so a slow consumer doesn't end up with the whole tree
+        in memory; subdirectories past that are listed when reached.
+        """
+        root = os.path.abspath(path)
+
+        if threads <= 1:
+            def read(p):
+                return self._read_dir(p)
+            pool = None
+        else:
+            lock = threading.Lock()
+            ahead = [0]
+            def read(p):
+                files, dirs, errors, stats = self._read_dir(p)
+                with lock:
+                    n = max(0, min(len(dirs), READ_AHEAD * threads - ahead[0]))
+                    ahead[0] += n
+                try:
+                    dirs = [pool.submit(read, d) for d in dirs[:n]] + dirs[n:]
+                except RuntimeError:
+                    # the pool shut down, the walk was abandoned
+                    dirs = []
+                return files, dirs, errors, stats
+            pool = ThreadPoolExecutor(max_workers=threads)
+
+        try:
+            queue = collections.deque([root])
+            while queue:
+                item = queue.popleft()
+                if pool is None:
+                    files, dirs, errors, stats = read(item)
+                else:
+                    if isinstance(item, str):
+                        with lock:
+                            ahead[0] += 1
+                        item = pool.submit(read, item)
+                    files, dirs, errors, stats = item.result()
+                    with lock:
+                        ahead[0] -= 1
+                self.syscalls["scandir"] += 1
+                self.syscalls["stat"] += stats
+                for exc in errors:
+                    self._error(exc)
+                queue.extend(dirs)
+                yield from files
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+
+    def scan(self, src, individual=False, recursive=False, threads=1):
+        """
+        *args:
+        src - list: list of paths.
+
+        **kwargs:
+        individual - bool: changes how items in src are evaluated (literal).
+        recursive - bool: yield the files at any depth under the directories
+                    in src (see walk()) instead of their immediate children.
+        threads - int: number of threads walking directories (recursive).
+
+        Yields a ScanEntry for every item in src (individual), or for every
+        item inside the directories in src, that passes the predicate.
+        """
+        entries = self._scan(src, individual, recursive, threads)
+        if self.predicate is not None:
+            entries = filter(self.predicate, entries)
+        yield from entries
+
+
+    def _scan(self, src, individual, recursive, threads):
+        for path in src:
+            if recursive and (not individual or os.path.isdir(path)):
+                yield from self.walk(path, threads)
+            elif individual:
+                try:
+                    yield self.stat(os.path.abspath(path))
+                except OSError as exc:
+                    self._error(exc)
+            else:
+                yield from self.scandir(path)
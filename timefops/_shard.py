@@ -0,0 +1,61 @@
+"""Sharding for timefops.
+    A run can be split into N shards, handled by independent processes or
+    machines with no coordination between them: every item goes to the
+    shard picked by a hash of its time str, so all the items of a folder
+    land in the same shard (and get the same names as in an unsharded run).
+    Shards are given as 'K/N', K counting from 1.
+"""
+
+import os
+import zlib
+from ._volumes import ARCHIVE_EXTENSIONS
+
+
+def parse_shard(value):
+    """
+    *args:
+    value - str: 'K/N', with 1 <= K <= N.
+
+    Raises:
+    ValueError - if 'value' isn't a shard.
+
+    Returns:
+    tuple - (K, N)
+    """
+    try:
+        k, n = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise ValueError(f"invalid shard '{value}', expected 'K/N'.")
+    if not 1 <= k <= n:
+        raise ValueError(f"invalid shard '{value}', K must be between 1 "
+                         "and N.")
+    return k, n
+
+
+def shard_of(bucket, n):
+    """Returns the shard (1 to 'n') of the time str 'bucket'; CRC-32 of it
+    with '/' as separator, so it is the same on every platform and run."""
+    return zlib.crc32(bucket.replace(os.sep, "/").encode("utf-8")) % n + 1
+
+
+def shard_plan(plan, shard):
+    """
+    *args:
+    plan - iterable: (ScanEntry, time str, basename), see Timefops._plan.
+    shard - tuple: (K, N)
+
+    Returns:
+    iterable - the items of 'plan' in shard K (a list if 'plan' is one).
+    """
+    k, n = shard
+    items = (item for item in plan if shard_of(item[1], n) == k)
+    return list(items) if isinstance(plan, list) else items
+
+
+def shard_path(path, shard):
+    """Returns 'path' tagged with the shard, before the archive extension if
+    it has one ('logs.tar.xz' -> 'logs.2-of-4.tar.xz', 'state.db' ->
+    'state.db.2-of-4')."""
+    ext = next((x for x in ARCHIVE_EXTENSIONS if path.endswith(x)), "")
+    stem = path[:len(path) - len(ext)]
+    return f"{stem}.{shard[0]}-of-{shard[1]}{ext}"
@@ -0,0 +1,150 @@
+"""Persistent state for incremental runs.
+    A small SQLite database remembers what earlier runs transferred: for
+    every source path, the (inode, size, mtime) it had and where it went.
+    Items that haven't changed since are left out of the next plan.
+"""
+
+import os
+import sqlite3
+
+
+# inode/size/mtime hold tree_signature() for directories.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    task TEXT NOT NULL,
+    path TEXT NOT NULL,
+    inode INTEGER,
+    size INTEGER,
+    mtime REAL,
+    bucket TEXT,
+    dest TEXT,
+    PRIMARY KEY (task, path)
+) WITHOUT ROWID
+"""
+
+
+def tree_signature(path):
+    """
+    *args:
+    path - str: directory path.
+
+    A directory's own mtime doesn't change when a file deep inside it gets
+    modified, so directories are compared by (number of entries, total size,
+    newest mtime) of everything under them instead.
+
+    Returns:
+    tuple - (count, size, mtime)
+    """
+    count = size = 0
+    newest = os.stat(path).st_mtime
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for d in it:
+                try:
+                    st = d.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                count += 1
+                size += st.st_size
+                newest = max(newest, st.st_mtime)
+                if d.is_dir(follow_symlinks=False):
+                    stack.append(d.path)
+    return count, size, newest
+
+
+class StateDB:
+    def __init__(self, path, task, batch=1000):
+        """
+        *args:
+        path - str: database file (created if needed).
+        task - str: identifies the operation, destination and folder format,
+               each task has its own set of records.
+
+        **kwargs:
+        batch - int: records written per transaction (0 writes them all at
+                once, on commit()).
+
+        Every record of 'task' is loaded up front, so checking an item costs
+        a dict lookup rather than a query.
+        """
+        self.path = path
+        self.task = task
+        self.batch = batch
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(_SCHEMA)
+        self.known = {row[0]: row[1:] for row in self.db.execute(
+                        "SELECT path, inode, size, mtime, bucket, dest "
+                        "FROM items WHERE task = ?", (task,))}
+        self.skipped = self.changed = self.new = 0
+        self.replacing = set()
+        self._seen = {}
+        self._pending = []
+
+
+    @staticmethod
+    def signature(e):
+        """(inode, size, mtime) of a ScanEntry, see tree_signature() for
+        directories."""
+        if e.is_dir:
+            return tree_signature(e.path)
+        return e.inode, e.size, e.mtime
+
+
+    def filter(self, plan):
+        """
+        *args:
+        plan - iterable: (ScanEntry, time str, basename), see Timefops._plan.
+
+        Yields the items of 'plan' that are new or changed since they were
+        recorded.  A changed item still in the same time str keeps the name
+        it was given before, so it replaces its earlier copy (its path is
+        added to 'replacing').
+        """
+        for e, p, name in plan:
+            sig = self.signature(e)
+            row = self.known.get(e.path)
+            if row is None:
+                self.new += 1
+            elif tuple(row[:3]) == tuple(sig):
+                self.skipped += 1
+                continue
+            else:
+                self.changed += 1
+                if row[3] == p:
+                    name = row[4]
+                    self.replacing.add(e.path)
+            self._seen[e.path] = (*sig, p, name)
+            yield e, p, name
+
+
+    def record(self, e):
+        """Marks an item yielded by filter() as done, it is written with the
+        next batch (or by commit())."""
+        self._pending.append((self.task, e.path, *self._seen.pop(e.path)))
+        if self.batch and len(self._pending) >= self.batch:
+            self.commit()
+
+
+    def recorded(self, plan):
+        """Yields the items of 'plan', recording each one once the consumer
+        is done with it (asks for the next item)."""
+        for item in plan:
+            yield item
+            self.record(item[0])
+
+
+    def commit(self):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO items VALUES "
+                                "(?, ?, ?, ?, ?, ?, ?)", self._pending)
+        self._pending.clear()
+
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,258 @@
+"""File transfer helpers for timefops (copying/moving items into folders)."""
+
+import os
+import sys
+import stat
+import errno
+import shutil
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# ioctl request for cloning a whole file (linux/fs.h), supported by btrfs, XFS
+# (with reflink=1), OCFS2, and a few others.
+FICLONE = 0x40049409
+
+# errnos meaning "this way of copying doesn't work here", as opposed to a real
+# I/O error; the next method gets tried instead.
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTTY,
+                errno.EOPNOTSUPP, errno.EBADF}
+
+_CHUNK = 1 << 30
+
+# (method, src st_dev, dst st_dev) combinations known not to work.
+_failed = set()
+
+
+class DirCache:
+    def __init__(self):
+        """Remembers which destination folders were already created, so
+        os.makedirs only runs once per folder."""
+        self.made = set()
+
+
+    def makedirs(self, path):
+        if path not in self.made:
+            os.makedirs(path, exist_ok=True)
+            self.made.add(path)
+
+
+def ordered_map(func, iterable, jobs=1, depth=None, processes=False):
+    """
+    *args:
+    func - callable: called as func(*item) for every item.
+    iterable - iterable: argument tuples.
+
+    **kwargs:
+    jobs - int: number of workers (1 runs everything inline).
+    depth - int (optional): maximum number of items in flight, 4 per worker
+            by default.
+    processes - bool: use worker processes instead of threads (func and the
+                items must be picklable).
+
+    Yields (item, result, exception) for every item, in input order no matter
+    which worker finishes first.  The iterable is consumed lazily, so no more
+    than 'depth' items are ever queued.
+    """
+    if jobs <= 1:
+        for item in iterable:
+            try:
+                yield item, func(*item), None
+            except Exception as exc:
+                yield item, None, exc
+        return
+
+    depth = depth or jobs * 4
+    pending = collections.deque()
+
+    def drain():
+        item, fut = pending.popleft()
+        exc = fut.exception()
+        return item, None if exc else fut.result(), exc
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=jobs) as pool:
+        for item in iterable:
+            if len(pending) >= depth:
+                yield drain()
+            pending.append((item, pool.submit(func, *item)))
+        while pending:
+            yield drain()
+
+
+def _reflink(fsrc, fdst, size):
+    fcntl.ioctl(fdst, FICLONE, fsrc)
+
+
+def _copy_file_range(fsrc, fdst, size):
+    offset = 0
+    while offset < size:
+        n = os.copy_file_range(fsrc, fdst, min(_CHUNK, size - offset),
+                               offset)
+        if not n:
+            if offset:
+                break
+            # Some filesystems (procfs, some FUSE mounts) just return 0.
+            raise OSError(errno.EOPNOTSUPP, "copy_file_range returned 0")
+        offset += n
+
+
+def _sendfile(fsrc, fdst, size):
+    offset = 0
+    while offset < size:
+        n = os.sendfile(fdst, fsrc, offset, min(_CHUNK, size - offset))
+        if not n:
+            break
+        offset += n
+
+
+def _buffered(fsrc, fdst, size):
+    while True:
+        buf = os.read(fsrc, 1 << 20)
+        if not buf:
+            break
+        os.write(fdst, buf)
+
+
+# Tried in order, the first one that works is used.
+COPY_METHODS = []
+if fcntl is not None and sys.platform.startswith("linux"):
+    COPY_METHODS.append(("reflink", _reflink))
+if hasattr(os, "copy_file_range"):
+    COPY_METHODS.append(("copy_file_range", _copy_file_range))
+if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+    COPY_METHODS.append(("sendfile", _sendfile))
+COPY_METHODS.append(("buffered", _buffered))
+
+
+def copy_file(src, dst):
+    """
+    *args:
+    src - str: path of the file to copy.
+    dst - str: path of the new file.
+
+    Like shutil.copy2, but lets the kernel do the copying where it can: a
+    reflink (FICLONE) first, then copy_file_range, then sendfile, then a
+    plain read/write loop.  Anything that isn't a regular file is left to
+    shutil.copy2.
+
+    Returns:
+    str - name of the method that did the copying.
+    """
+    fsrc = os.open(src, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0) |
+                   getattr(os, "O_BINARY", 0))
+    try:
+        st = os.fstat(fsrc)
+        if not stat.S_ISREG(st.st_mode):
+            os.close(fsrc)
+            fsrc = None
+            shutil.copy2(src, dst)
+            return "shutil"
+
+        fdst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                       getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            dev = (st.st_dev, os.fstat(fdst).st_dev)
+            for name, func in COPY_METHODS:
+                if (name, *dev) in _failed:
+                    continue
+                try:
+                    func(fsrc, fdst, st.st_size)
+                    break
+                except OSError as exc:
+                    if exc.errno not in _UNSUPPORTED or name == "buffered":
+                        raise
+                    _failed.add((name, *dev))
+                    os.lseek(fdst, 0, os.SEEK_SET)
+                    os.ftruncate(fdst, 0)
+        finally:
+            os.close(fdst)
+    finally:
+        if fsrc is not None:
+            os.close(fsrc)
+
+    shutil.copystat(src, dst)
+    return name
+
+
+class Mover:
+    def __init__(self, dst, max_fds=128):
+        """
+        *args:
+        dst - str: destination directory path.
+
+        **kwargs:
+        max_fds - int: maximum number of directory fds kept open.
+
+        Moves items with a plain rename, relative to cached directory fds
+        (where the platform supports it), creating destination folders once
+        each.  Only works within one filesystem, anything else falls back to
+        shutil.move.
+        """
+        self.dst = os.path.abspath(dst)
+        self.max_fds = max_fds
+        self.dirs = DirCache()
+        self.fallbacks = 0
+        self._fds = {}
+        self._use_fds = os.rename in os.supports_dir_fd and \
+                        hasattr(os, "O_DIRECTORY")
+
+
+    def _fd(self, path, keep=None):
+        """Returns an fd for the 'path' directory, closing the least recently
+        used ones (but never the fd of 'keep') to stay within max_fds."""
+        try:
+            fd = self._fds[path] = self._fds.pop(path)
+            return fd
+        except KeyError:
+            pass
+
+        for old in list(self._fds):
+            if len(self._fds) < self.max_fds:
+                break
+            if old != keep:
+                os.close(self._fds.pop(old))
+        fd = self._fds[path] = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        return fd
+
+
+    def move(self, src, folder, name):
+        """Moves the 'src' path to 'folder/name' under the destination."""
+        src_dir, src_name = os.path.split(src)
+        dst_dir = os.path.join(self.dst, folder)
+        self.dirs.makedirs(dst_dir)
+
+        try:
+            if self._use_fds:
+                # the source fd must stay open (its number could be reused)
+                # when the destination one is opened
+                src_fd = self._fd(src_dir)
+                os.rename(src_name, name, src_dir_fd=src_fd,
+                          dst_dir_fd=self._fd(dst_dir, keep=src_dir))
+            else:
+                os.rename(src, os.path.join(dst_dir, name))
+        except OSError as exc:
+            if exc.errno != errno.EXDEV:
+                raise
+            # e.g. a bind mount or btrfs subvolume inside the same filesystem
+            self.fallbacks += 1
+            shutil.move(src, os.path.join(dst_dir, name))
+
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,67 @@
+"""Archive volumes for timefops.
+    In split mode, every time str gets archives of its own, named after the
+    target archive ('logs.tar.xz' -> 'logs-2020-04-01.tar.xz'), each holding
+    at most a given number of bytes of items ('logs-2020-04-01.2.tar.xz',
+    ...).  Volumes are independent, so they can be written in parallel,
+    restored one by one, and expired by deleting files.
+"""
+
+import os
+from ._state import tree_signature
+
+
+ARCHIVE_EXTENSIONS = (".tar.gz", ".tar.bz2", ".tar.xz", ".tar", ".zip")
+
+
+def volume_path(dst, bucket, num=1):
+    """
+    *args:
+    dst - str: path of the (unsplit) archive.
+    bucket - str: time str, folders separated by os.sep.
+
+    **kwargs:
+    num - int: volume number, starting at 1.
+
+    Returns:
+    str - 'dst' with the time str (and volume number, from the second one
+          on) inserted before the archive extension.
+    """
+    ext = next((x for x in ARCHIVE_EXTENSIONS if dst.endswith(x)), "")
+    stem = dst[:len(dst) - len(ext)]
+    tag = bucket.replace(os.sep, "-")
+    return f"{stem}-{tag}{f'.{num}' if num > 1 else ''}{ext}"
+
+
+def split_volumes(plan, dst, max_size=None):
+    """
+    *args:
+    plan - iterable: (ScanEntry, time str, basename), see Timefops._plan.
+    dst - str: path of the (unsplit) archive.
+
+    **kwargs:
+    max_size - int (optional): bytes of items (before compression) per
+               volume; an item is never split, so one larger than this gets
+               a volume of its own.
+
+    Returns:
+    list - (volume path, [(ScanEntry, time str, basename), ...]), time strs
+           in the order they were first seen.
+    """
+    buckets = {}
+    for item in plan:
+        buckets.setdefault(item[1], []).append(item)
+
+    volumes = []
+    for p, items in buckets.items():
+        num, vol, size = 1, [], 0
+        for item in items:
+            e = item[0]
+            item_size = 0 if not max_size else \
+                        tree_signature(e.path)[1] if e.is_dir else e.size
+            if vol and max_size and size + item_size > max_size:
+                volumes.append((volume_path(dst, p, num), vol))
+                num, vol, size = num + 1, [], 0
+            vol.append(item)
+            size += item_size
+        volumes.append((volume_path(dst, p, num), vol))
+    return volumes
@@ -7,21 +7,60 @@
 
 import os
 import sys
+import errno
+import logging
+import time
 import collections
+import contextlib
+import itertools
 import shutil
-import errno
 import tarfile
 import zipfile
 import pyzipper
 from datetime import datetime as dt
-from ._logger import init_logging
+from ._logger import init_logging, VERBOSE
+from ._scan import Scanner
+from ._bucket import BucketFormatter
+from ._rename import NameResolver, add_enumerate
+from ._compress import (ParallelWriter, ZIP_COMPRESSION, STORED_EXTENSIONS,
+                        can_write_members, compress_members,
+                        member_compression, write_member)
+from ._transfer import DirCache, Mover, ordered_map, copy_file
+from ._state import StateDB
+from ._journal import Journal
+from ._report import Report
+from ._volumes import split_volumes
+from ._dedup import find_duplicates
+from ._planfile import PlanError, read_plan, write_plan
+from ._shard import shard_of, shard_path, shard_plan
+from ._index import (ArchiveIndex, ArchiveIndexError, IndexedTarFile,
+                     index_path, open_at, read_index)
+from ._profile import NULL_PROFILER
+from ._progress import Progress, human_size
 
 
 
 class Timefops:
-    def __init__(self, log_level, color=True, name=__name__):
-        self.log = init_logging(log_level, name, color=color)
+    def __init__(self, log_level, color=True, name=__name__, profiler=None,
+                 log_json=False, log_queue=False):
+        """
+        *args:
+        log_level - int: logging level.
+
+        **kwargs:
+        color - bool: coloured log output.
+        name - str: logger name.
+        profiler - _profile.Profiler (optional): collects the time spent in
+                   each phase (scan, bucket, rename, makedirs, copy, ...) and
+                   counters (syscalls, items, bytes) of the operations.
+        log_json - bool: log JSON lines instead of text (see _logger).
+        log_queue - bool: format and write log records on a background
+                    thread instead of the thread logging them.
+        """
+        self.log = init_logging(log_level, name, color=color,
+                                json_lines=log_json, queue=log_queue)
         self.num_warn = 0
+        self.prof = profiler or NULL_PROFILER
 
 
     @staticmethod
@@ -36,19 +75,67 @@ class Timefops:
     @staticmethod
     def add_enumerate(f, num):
         """Seperates a path and adds 'num' in the right spot, used for renaming."""
-        name, suffix = os.path.splitext(f)
-        return f"{name}({num}){suffix}"
+        return add_enumerate(f, num)
 
 
-    def path_time_map(self, src, method, fmt, individual=False):
+    def scan(self, src, individual=False, predicate=None, recursive=False,
+             walk_threads=1):
         """
         *args:
         src - list: list of paths.
-        method - str: 'os.path' function to use (getatime, getctime, getmtime) .
+
+        **kwargs:
+        individual - bool: changes how items in src are evaluated (literal).
+        predicate - callable (optional): items it returns False for are left
+                    out (see _filter.EntryFilter).
+        recursive - bool: scan the files at any depth under the source
+                    directories, instead of their immediate children.
+        walk_threads - int: number of threads listing directories (recursive).
+
+        Stats every item once (see _scan.Scanner), skipping items that can't
+        be stat'ed with a warning.
+
+        Returns:
+        { absolute_path: ScanEntry }
+        """
+        scanner = Scanner(onerror=self._scan_error, predicate=predicate)
+        with self.prof.phase("scan"):
+            entries = {e.path: e for e in scanner.scan(
+                src, individual=individual, recursive=recursive,
+                threads=walk_threads)}
+        self._log_scan(scanner, len(entries))
+        return entries
+
+
+    def _scan_error(self, exc):
+        self.num_warn += 1
+        self.log.warning("Unable to read: "
+                         f"'{os.path.relpath(exc.filename)}' "
+                         f"({exc.strerror}), skipping.")
+
+
+    def _log_scan(self, scanner, num):
+        self.prof.update(scanner.syscalls)
+        self.log.debug(f"scanned {num} item(s) -- "
+                       f"{scanner.syscalls['scandir']} scandir(), "
+                       f"{scanner.syscalls['stat']} stat() call(s)")
+        rejected = getattr(scanner.predicate, "rejected", 0)
+        if rejected:
+            self.log.verbose(f"{rejected} item(s) left out by the filters.")
+
+
+    def path_time_map(self, src, method, fmt, individual=False, entries=None):
+        """
+        *args:
+        src - list: list of paths.
+        method - str: time to use (atime, ctime, mtime; or the 'os.path'
+                 function names getatime, getctime, getmtime).
         fmt - str: datetime format identitfier.
 
         **kwargs:
         individual - bool: changes how items in src are evaluated (literal).
+        entries - dict (optional): output of scan(), src is not rescanned when
+                  this is given.
 
         Maps the file/folder path to a time str, determined by the 'fmt' argument.
 
@@ -58,61 +145,355 @@ class Timefops:
         self.log.debug(f"format predicate -- {len(fmt)} levels, sample: " 
                        f"'{'/'.join(dt.now().strftime(x) for x in fmt)}'")
 
-        if individual:
-            return {os.path.abspath(x): '/'.join(dt.fromtimestamp(getattr(
-                os.path, method)(x)).strftime(sub_fmt) for sub_fmt in fmt) 
-                   for x in src}
-        else:
-            return {os.path.abspath(y): '/'.join(dt.fromtimestamp(getattr(
-                os.path, method)(y)).strftime(sub_fmt) for sub_fmt in fmt)
-                   for x in list((os.scandir(path) for path in src)) 
-                      for sub_fmt in fmt for y in x}
+        if entries is None:
+            entries = self.scan(src, individual=individual)
+
+        attr = method[3:] if method.startswith("get") else method
+        bucket = BucketFormatter(fmt)
+        with self.prof.phase("bucket"):
+            time_map = {e.path: bucket(getattr(e, attr))
+                        for e in entries.values()}
 
+        self.log.debug(f"bucket cache ({bucket.unit or 'disabled'}) -- "
+                       f"{bucket.hits} hit(s), {bucket.misses} miss(es)")
+        return time_map
 
-    def _rename_duplicates(self, f):
+
+    def _rename_duplicates(self, f, dst=None, taken=()):
         """
         *args:
         f - dict; (use the output of path_time_map())
 
+        **kwargs:
+        dst - str (optional): destination directory, names already taken
+              under it are skipped when enumerating.
+        taken - iterable: (time str, name) pairs to skip as well.
+
         Will rename any files/folders (by enumerating) if there are any
-        duplicates that fall under the same time string.
+        duplicates that fall under the same time string.  This is a single
+        pass over 'f' (see _rename.NameResolver).
 
         Returns:
         dict - {absolute_path: basename (renamed using add_enumerate)}
+        dict - {time str: {basename: [absolute_path, ...]}} (duplicates only)
         """
-        basename_map = {x: os.path.basename(x) for x in f}
-
-        filter_dict = collections.defaultdict(dict)
-        for fn, date in f.items():
-            filter_dict[os.path.basename(fn)].update({fn: date})
-
-        to_rename = collections.defaultdict(
-                lambda: collections.defaultdict(list))
-
-        for key, val in filter_dict.items():
-            if len(val) > 1:
-                for date, occur in collections.Counter(val.values()).items():
-                    if occur > 1:
-                        for subk, subv in val.items():
-                            if subv == date:
-                                to_rename[subv][os.path.basename(subk)
-                                        ].append(subk)
-
-        for d, i in to_rename.items():
-            for bn, p in i.items():
-                self.log.debug(f"{len(p)} instances of '{bn}' --> "
-                               f"{[os.path.relpath(x) for x in p]}")
-                for k, v in enumerate(p):
-                    if k > 0:
-                        basename_map[v] = self.add_enumerate(
-                                                os.path.basename(v), k)
-                    else:
-                        basename_map[v] = os.path.basename(v)
+        resolver = NameResolver(dst, taken=taken)
+        basename_map = {}
+        groups = collections.defaultdict(list)
+
+        with self.prof.phase("rename"):
+            for fn, date in f.items():
+                bn = os.path.basename(fn)
+                basename_map[fn] = resolver(date, bn)
+                groups[date, bn].append(fn)
+
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        to_rename = collections.defaultdict(dict)
+        for (date, bn), p in groups.items():
+            if len(p) > 1:
+                to_rename[date][bn] = p
+                if debug:
+                    self.log.debug(f"{len(p)} instances of '{bn}' --> "
+                                   f"{[os.path.relpath(x) for x in p]}")
 
         return basename_map, to_rename
 
 
-    def _recurse_zip_helper(self, zf, path, zippath):
+    def _stream_plan(self, src, method, fmt, individual=False, dst=None,
+                     predicate=None, recursive=False, walk_threads=1,
+                     taken=(), shard=None):
+        """
+        Generator version of path_time_map() + _rename_duplicates(), items are
+        yielded as soon as they are scanned.  Only a counter per distinct
+        (time str, name) pair is kept, so memory doesn't grow with the
+        number of items.
+        """
+        scanner = Scanner(onerror=self._scan_error, predicate=predicate)
+        bucket = BucketFormatter(fmt)
+        attr = method[3:] if method.startswith("get") else method
+        resolver = NameResolver(dst, taken=taken)
+
+        num = 0
+        for num, e in enumerate(scanner.scan(src, individual=individual,
+                                             recursive=recursive,
+                                             threads=walk_threads), 1):
+            p = bucket(getattr(e, attr))
+            if shard is None or shard_of(p, shard[1]) == shard[0]:
+                yield e, p, resolver(p, os.path.basename(e.path))
+
+        self._log_scan(scanner, num)
+        self.log.debug(f"{len(resolver.counts)} distinct name(s) across "
+                       "buckets")
+
+
+    def _plan(self, src, dst, method, fmt, individual=False, stream=False,
+              existing=True, predicate=None, recursive=False, walk_threads=1,
+              taken=(), journal=None, plan=None, shard=None):
+        """
+        *args:
+        src - list: directories/filenames.
+        dst - str: destination path (directory or archive), may be None.
+        method - str: time to use (atime, ctime, mtime).
+        fmt - str: datetime format identitfier.
+
+        **kwargs:
+        individual - bool: changes how items in src are evaluated (literal).
+        stream - bool: yield items while scanning instead of building the
+                 full path_time_map()/_rename_duplicates() maps first.
+        existing - bool: whether names already present under the 'dst'
+                   directory should be avoided.
+        predicate - callable (optional): items it returns False for are left
+                    out before being bucketed (see _filter.EntryFilter).
+        recursive - bool: plan the files at any depth under the source
+                    directories, instead of their immediate children.
+        walk_threads - int: number of threads listing directories (recursive).
+        taken - iterable: (time str, name) pairs no item may be given.
+        journal - _journal.Journal (optional): the plan is journaled, or
+                  taken from the journal if it is of an unfinished run (see
+                  _journal_plan).
+        plan - list (optional): a plan made earlier (see execute()), used
+               instead of scanning 'src'.
+        shard - tuple (optional): (K, N), only plan the items of shard K of
+                N (see _shard).  Every time str is in one shard, so names are
+                the same as in an unsharded run.
+
+        Returns:
+        iterable - (ScanEntry, time str, basename (renamed if needed))
+        """
+        if plan is not None and shard is not None:
+            plan, shard = shard_plan(plan, shard), None
+        if journal is not None:
+            return self._journal_plan(journal, src, dst, method, fmt,
+                                      individual=individual, stream=stream,
+                                      existing=existing, predicate=predicate,
+                                      recursive=recursive,
+                                      walk_threads=walk_threads, plan=plan,
+                                      shard=shard)
+        if plan is not None:
+            return plan
+
+        if stream and not individual and dst:
+            # Items created under a directory that is still being scanned
+            # may or may not show up, so scan those up front.
+            d = os.path.abspath(dst)
+            if any(os.path.commonpath([d, os.path.abspath(x)]) ==
+                   os.path.abspath(x) for x in src):
+                self.log.verbose("destination is inside a source directory, "
+                                 "not streaming.")
+                stream = False
+
+        existing_dst = dst if existing else None
+        if stream:
+            # scanning, bucketing and renaming are interleaved here, they are
+            # timed together as one phase
+            return self.prof.iterate("plan", self._stream_plan(
+                src, method, fmt, individual=individual, dst=existing_dst,
+                predicate=predicate, recursive=recursive,
+                walk_threads=walk_threads, taken=taken, shard=shard))
+
+        entries = self.scan(src, individual=individual, predicate=predicate,
+                            recursive=recursive, walk_threads=walk_threads)
+        file_time_map = self.path_time_map(src, method, fmt, entries=entries)
+        if shard is not None:
+            k, n = shard
+            file_time_map = {i: p for i, p in file_time_map.items()
+                             if shard_of(p, n) == k}
+        rename_map = self._rename_duplicates(file_time_map, dst=existing_dst,
+                                             taken=taken)[0]
+        return [(entries[i], p, rename_map[i])
+                for i, p in file_time_map.items()]
+
+
+    def _journal_plan(self, journal, src, dst, method, fmt, predicate=None,
+                      plan=None, **kwargs):
+        """
+        *args:
+        journal - _journal.Journal: journal of this run.
+        (the rest as for _plan())
+
+        A new journal gets the plan written to it.  Resuming, the items an
+        earlier run planned but didn't finish come first, under the names
+        they were given then; if that run was stopped while still scanning
+        (streaming), the sources are scanned again for the items it didn't
+        get to, which can't take any of the names handed out already.
+        Items whose target exists count as done (targets only appear once
+        the item is complete).
+
+        Returns:
+        iterable - (ScanEntry, time str, basename (renamed if needed))
+        """
+        if not journal.resuming:
+            return journal.plan(plan if plan is not None else self._plan(
+                src, dst, method, fmt, predicate=predicate, **kwargs))
+
+        scanner = Scanner(onerror=self._scan_error)
+        pending = []
+        for path, p, name in journal.pending():
+            if os.path.lexists(os.path.join(dst, p, name)):
+                journal.record(path)
+                continue
+            try:
+                pending.append((scanner.stat(path), p, name))
+            except OSError as exc:
+                self._scan_error(exc)
+
+        self.log.verbose(f"resuming from journal '{journal.path}' -- "
+                         f"{len(pending)} of {len(journal.planned)} planned "
+                         "item(s) left" +
+                         ("." if journal.complete else
+                          ", scanning for the rest."))
+        if journal.complete:
+            return pending
+
+        planned = journal.planned
+        def rest(e):
+            return e.path not in planned and \
+                   (predicate is None or predicate(e))
+
+        fresh = self._plan(src, dst, method, fmt, predicate=rest,
+                           taken=list(planned.values()), **kwargs)
+        return itertools.chain(pending, journal.plan(fresh))
+
+
+    def _task(self, operation, method, fmt, dst=None):
+        """Identifies a run by its operation, time, format and destination
+        (for state and journal files)."""
+        return " ".join((operation, method, "/".join(fmt),
+                         os.path.abspath(dst) if dst else "")).rstrip()
+
+
+    def _open_journal(self, journal, operation, method, fmt, dst,
+                      shard=None):
+        """
+        *args:
+        journal - str: journal path (see _journal.Journal), may be None.
+        (the rest as for _open_state())
+
+        **kwargs:
+        shard - tuple (optional): (K, N), a journal belongs to one shard.
+
+        Returns:
+        Journal - or None, if 'journal' is None.
+        """
+        if not journal:
+            return None
+        task = self._task(operation, method, fmt, dst)
+        if shard is not None:
+            task += f" shard {shard[0]}/{shard[1]}"
+        return Journal(journal, task)
+
+
+    def _open_state(self, state, operation, method, fmt, dst=None, batch=1000):
+        """
+        *args:
+        state - str: state database path (see _state.StateDB), may be None.
+        operation - str: name of the operation.
+        method - str: time to use (atime, ctime, mtime).
+        fmt - str: datetime format identitfier.
+
+        **kwargs:
+        dst - str (optional): destination directory.
+        batch - int: records written per transaction.
+
+        Records are kept apart per operation, time, format and destination,
+        so changing any of them starts over.
+
+        Returns:
+        StateDB - or None, if 'state' is None.
+        """
+        if not state:
+            return None
+        db = StateDB(state, self._task(operation, method, fmt, dst),
+                     batch=batch)
+        self.log.debug(f"state '{state}' -- {len(db.known)} record(s) for "
+                       f"'{db.task}'")
+        return db
+
+
+    def _log_state(self, db):
+        self.log.verbose(f"incremental run -- {db.new} new, {db.changed} "
+                         f"changed, {db.skipped} unchanged item(s) skipped.")
+
+
+    def _write_plan(self, path, operation, src, dst, method, fmt, plan,
+                    **options):
+        """Writes 'plan' to the plan file 'path' (see _planfile.write_plan,
+        'options' being the operation settings execute() needs)."""
+        with self.prof.phase("write plan"):
+            n = write_plan(path, operation, src, dst, method, fmt, plan,
+                           options)
+        self.log.success(f"plan of {n} item(s) written to "
+                         f"'{os.path.relpath(path)}'.")
+
+
+    @staticmethod
+    def _plan_totals(plan):
+        """Returns (items, bytes of the files) of a plan, or (None, None) if
+        it is still being scanned (streamed)."""
+        if not isinstance(plan, list):
+            return None, None
+        return len(plan), sum(e.size for e, _, _ in plan if not e.is_dir)
+
+
+    def _progress(self, report, totals, show):
+        """Returns a started-on-enter Progress for 'report' (see _progress),
+        or a context that does nothing if 'show' is False."""
+        if not show:
+            return contextlib.nullcontext()
+        return Progress(report, *totals)
+
+
+    def _count_report(self, report):
+        """Adds a finished Report's totals to the profiler counters."""
+        if self.prof:
+            self.prof.count("items", report.done)
+            self.prof.count("skipped", report.skipped)
+            self.prof.count("bytes", report.bytes)
+        return report
+
+
+    def _zip_walk(self, path, zippath, follow=True):
+        """Yields (path, zip path, is link) for 'path' and, if it is a
+        directory, everything under it, in the order _recurse_zip_helper adds
+        them.  Symlinks under 'path' (and 'path' itself, unless 'follow') are
+        yielded as links, never followed."""
+        if not follow and os.path.islink(path):
+            yield path, zippath, True
+        elif os.path.isfile(path):
+            yield path, zippath, False
+        elif os.path.isdir(path):
+            if zippath:
+                yield path, zippath, False
+            try:
+                names = sorted(os.listdir(path))
+            except PermissionError:
+                self.num_warn += 1
+                self.log.warning("Insufficient permissions to add: "
+                                f"'{os.path.relpath(path)}', skipping.")
+                return
+            for nm in names:
+                yield from self._zip_walk(os.path.join(path, nm),
+                                          os.path.join(zippath, nm),
+                                          follow=False)
+
+
+    @staticmethod
+    def _write_zip_link(zf, path, zippath):
+        """Adds the symlink 'path' to 'zf' as a link member, the way Info-ZIP
+        stores them (the link's mode in the external attributes, its target
+        as the data)."""
+        st = os.lstat(path)
+        zinfo = getattr(zf, "zipinfo_cls", zipfile.ZipInfo)(
+                    zippath, max(time.localtime(st.st_mtime)[:6],
+                                 (1980, 1, 1, 0, 0, 0)))
+        zinfo.create_system = 3
+        zinfo.external_attr = st.st_mode << 16
+        zf.writestr(zinfo, os.readlink(path),
+                    compress_type=zipfile.ZIP_STORED)
+
+
+    def _recurse_zip_helper(self, zf, path, zippath, stored=frozenset(),
+                            follow=True):
         """Borrowed from the source module. Evaluates whether the path is 
         a file and can just be added, or if it is a directory and needs to be 
         recursivley run (zipfile does not already do this, for some reason)
@@ -121,23 +502,130 @@ class Timefops:
         zf - zipfile.Zipfile: zipfile object instance
         path - str: path to the file/directory 
         zippath - str: zip path (dir the path will be added under in the file)
+
+        **kwargs:
+        stored - set: extensions of files to store instead of compress.
+        follow - bool: follow 'path' if it is a symlink (see _zip_walk).
         """
-        try:
-            if os.path.isfile(path):
-                zf.write(path, arcname=zippath)
-            elif os.path.isdir(path):
-                if zippath:
-                    zf.write(path, zippath)
-                for nm in sorted(os.listdir(path)):
-                    self._recurse_zip_helper(zf,
-                             os.path.join(path, nm), os.path.join(zippath, nm))
-        except PermissionError:
-            self.num_warn += 1
-            self.log.warning("Insufficient permissions to add: "
-                            f"'{os.path.relpath(path)}', skipping.")
-
-
-    def move(self, src, dst, method, fmt, individual=False, dry_run=False):
+        for p, zp, is_link in self._zip_walk(path, zippath, follow=follow):
+            try:
+                if is_link:
+                    self._write_zip_link(zf, p, zp)
+                    continue
+                zf.write(p, zp, compress_type=member_compression(
+                                                zp, zf.compression, stored))
+            except PermissionError:
+                self.num_warn += 1
+                self.log.warning("Insufficient permissions to add: "
+                                f"'{os.path.relpath(p)}', skipping.")
+
+
+    def _write_zip(self, zf, plan, processes=1, aes=None, stored=frozenset(),
+                   on_item=None, index=None):
+        """
+        *args:
+        zf - zipfile.ZipFile/pyzipper.AESZipFile: archive being written.
+        plan - iterable: output of _plan().
+
+        **kwargs:
+        processes - int: number of worker processes compressing members.
+        aes - tuple (optional): (password (bytes), key size in bits).
+        stored - set: extensions of files to store instead of compress.
+        on_item - callable (optional): called as on_item(entry, zip path,
+                  None) once an item and everything under it was added.
+        index - _index.ArchiveIndex (optional): members get tagged in it.
+
+        Adds every item in the plan to 'zf'; with more than one process, the
+        members are compressed/encrypted in parallel (see _compress), the
+        archive itself is identical to the serial one (bar AES salts).  If
+        this zipfile can't take precompressed members, it is done serially.
+        """
+        if processes > 1 and not can_write_members(
+                zf, nbits=aes[1] if aes else None):
+            self.log.verbose("zipfile internals not as expected, compressing "
+                             "members in this process.")
+            processes = 1
+        if processes <= 1:
+            for e, p, name in plan:
+                zp = os.path.join(p, name)
+                self._recurse_zip_helper(zf, e.path, zp, stored=stored,
+                                         follow=not e.is_link)
+                self.log.verbose("added: %s", zp)
+                if index is not None:
+                    index.tag(zf.filelist, p)
+                if on_item is not None:
+                    on_item(e, zp, None)
+            return
+
+        # Items are reported (and tagged) in plan order, once the members
+        # queued up to their end are written: (number of members queued,
+        # item, time str, name).  An item without members (e.g. a FIFO,
+        # which can't be added) waits for the ones before it.
+        pending = collections.deque()
+        queued = [0]
+
+        def done(e, p, name):
+            if index is not None:
+                index.tag(zf.filelist, p)
+            if on_item is not None:
+                on_item(e, os.path.join(p, name), None)
+
+        # Members go to the workers in batches of up to 64 files/8 MiB.
+        def batches():
+            batch, size = [], 0
+            for e, p, name in plan:
+                for path, zp, is_link in self._zip_walk(
+                        e.path, os.path.join(p, name), follow=not e.is_link):
+                    # links are written by this process (compression None)
+                    batch.append((path, zp, None if is_link else
+                                  member_compression(zp, zf.compression,
+                                                     stored)))
+                    queued[0] += 1
+                    if not is_link:
+                        size += e.size if path == e.path else \
+                                os.path.getsize(path)
+                    if len(batch) >= 64 or size >= 1 << 23:
+                        yield batch, zf.compresslevel, aes
+                        batch, size = [], 0
+                if on_item is not None or index is not None:
+                    pending.append((queued[0], e, p, name))
+            if batch:
+                yield batch, zf.compresslevel, aes
+
+        written = 0
+        for (batch, *_), results, exc in ordered_map(compress_members,
+                                                     batches(),
+                                                     jobs=processes,
+                                                     processes=True):
+            if exc is not None:
+                raise exc
+            for (path, zp, ctype), (result, exc) in zip(batch, results):
+                try:
+                    if exc is not None:
+                        raise exc
+                    if ctype is None:
+                        self._write_zip_link(zf, path, zp)
+                    elif result is None:
+                        zf.write(path, zp, compress_type=ctype)
+                    else:
+                        write_member(zf, path, zp, result, compress_type=ctype,
+                                     nbits=aes[1] if aes else None)
+                    self.log.verbose("added: %s", zp)
+                except PermissionError:
+                    self.num_warn += 1
+                    self.log.warning("Insufficient permissions to add: "
+                                    f"'{os.path.relpath(path)}', skipping.")
+                written += 1
+                while pending and pending[0][0] <= written:
+                    done(*pending.popleft()[1:])
+        while pending:
+            done(*pending.popleft()[1:])
+
+
+    def move(self, src, dst, method, fmt, individual=False, dry_run=False,
+             stream=False, predicate=None, recursive=False, walk_threads=1,
+             on_item=None, progress=False, journal=None, plan=None,
+             plan_out=None, shard=None):
         """
         *args:
         src - list: directories/filenames.
@@ -145,9 +633,30 @@ class Timefops:
         fmt - str: datetime format identitfier.
 
         **kwargs:
-        cmp - str (optional): compression shorthand (bz2, gz, xz).
         individual - bool: changes how items in src are evaluated (literal).
         dry_run - bool: whether to actually run, or just print expected results.
+        stream - bool: move items while the sources are still being scanned.
+        predicate - callable (optional): only items it returns True for are
+                    handled (see _filter.EntryFilter).
+        recursive - bool: handle the files at any depth under the source
+                    directories (flattened into the folders), instead of
+                    their immediate children.
+        walk_threads - int: number of threads listing directories (recursive).
+        on_item - callable (optional): called as on_item(entry, target,
+                  error) after every item, error being the PermissionError
+                  it was skipped for, or None.
+        progress - bool: show items/s, bytes/s, bytes left and ETA on stderr
+                   while running (see _progress.Progress).
+        journal - str (optional): journal path; the plan and every item done
+                  are written to it, so that a run that was stopped can be
+                  resumed with the same names by running it again (see
+                  _journal).  It is removed once the run completes.
+        plan - list (optional): items to handle instead of scanning 'src'
+               (see execute()).
+        plan_out - str (optional): write the plan to this file (see
+                   _planfile) instead of running it.
+        shard - tuple (optional): (K, N), only handle the items of shard K
+                of N, whole time strs at a time (see _shard).
 
 
         Moves files/folders & puts them in folders by a date defined by the
@@ -156,52 +665,185 @@ class Timefops:
         This function will raise an Exception if the source and dest. paths are
         on different drives/filesystems, this was done as a precaution due to
         unexpected behaviour. To get around this, just use _copy() instead.
+
+        Returns:
+        Report - per-item results and totals (see _report), None for dry
+                 runs.
         """
 
-        # Make sure moving is local only (all platforms)
+        # Make sure moving is local only (all platforms), looking up the
+        # mount point once per device.
+        mounts = {}
+        def mount_point(path):
+            dev = os.stat(path).st_dev
+            if dev not in mounts:
+                mounts[dev] = self.find_mount_point(path)
+            return mounts[dev]
+
+        dst_mount = mount_point(dst)
         for path in src:
-            if self.find_mount_point(path) != self.find_mount_point(dst):
+            if mount_point(path) != dst_mount:
                 self.log.error("For transferring files to a different "
                                "filesystem, use the copy function.")
                 sys.exit(1)
 
-        file_time_map = self.path_time_map(src, f"get{method}", fmt,
-                                           individual=individual)
-
-        rename_map = self._rename_duplicates(file_time_map)[0]
+        journal = None if dry_run or plan_out else \
+                  self._open_journal(journal, "move", method, fmt, dst,
+                                     shard=shard)
+        plan = self._plan(src, dst, method, fmt, individual=individual,
+                          stream=stream, predicate=predicate,
+                          recursive=recursive, walk_threads=walk_threads,
+                          journal=journal, plan=plan, shard=shard)
+        if plan_out:
+            return self._write_plan(plan_out, "move", src, dst, method, fmt,
+                                    plan)
 
         if dry_run:
             self.log.info(f"\nCreating directories based on {method}.\n")
             self.log.info("Item list:")
 
-        # Move the associated items to the designated path.
-        for n, (i, p) in enumerate(file_time_map.items(), 1):
-            target_dir = os.path.join(dst, p)
-            if not dry_run:
-                os.makedirs(target_dir, exist_ok=True)
-                try:
-                    shutil.move(i, os.path.join(target_dir, rename_map.get(i)))
-                    self.log.verbose("done moving: "
-                                    f"{os.path.relpath(i)}")
-                except PermissionError:
-                    self.num_warn += 1
-                    self.log.warning("Insufficient permissions "
-                                    f"to move: '{os.path.relpath(i)}', "
-                                    "skipping.")
-            else:
+            n = 0
+            for n, (e, p, name) in enumerate(plan, 1):
                 self.log.info("{}. {} --> {}".format(
-                    n, os.path.relpath(i), os.path.join(target_dir,
-                                                        rename_map.get(i))
+                    n, os.path.relpath(e.path), os.path.join(dst, p, name)
                 ))
+            self.log.info(f"\n# of items to be moved: {n}")
+            return
 
-        if dry_run:
-            self.log.info(f"\n# of items to be moved: {len(file_time_map)}")
-        else:
-            self.log.success("contents moved -- finished with "
-                            f"{self.num_warn} warning(s).")
+        verbose = self.log.isEnabledFor(VERBOSE)
+        report = Report("move", dst, on_item=on_item)
+
+        # Move the associated items to the designated path.
+        try:
+            with Mover(dst) as mover, self.prof.phase("move"), \
+                 self._progress(report, self._plan_totals(plan), progress):
+                mover.dirs.makedirs = self.prof.wrap("makedirs",
+                                                     mover.dirs.makedirs)
+                for e, p, name in plan:
+                    start = time.perf_counter()
+                    try:
+                        mover.move(e.path, p, name)
+                        if verbose:
+                            self.log.verbose("done moving: "
+                                             f"{os.path.relpath(e.path)}")
+                    except PermissionError as exc:
+                        self.num_warn += 1
+                        self.log.warning("Insufficient permissions to move: "
+                                         f"'{os.path.relpath(e.path)}', "
+                                         "skipping.")
+                        report.add(e, p, name, error=exc)
+                    else:
+                        if journal is not None:
+                            journal.record(e.path)
+                        report.add(e, p, name,
+                                   duration=time.perf_counter() - start)
+            if journal is not None:
+                journal.finish()
+        finally:
+            if journal is not None:
+                journal.close()
 
+        self._count_report(report.finish())
+        self.prof.count("makedirs", len(mover.dirs.made))
+        n, elapsed = report.done, report.elapsed
+        self.log.verbose(f"{n} item(s) moved in {elapsed:.2f}s "
+                         f"({n / elapsed if elapsed else n:.0f} items/s, "
+                         f"{len(mover.dirs.made)} folder(s), "
+                         f"{mover.fallbacks} cross-device fallback(s))")
+        self.log.success("contents moved -- finished with "
+                        f"{self.num_warn} warning(s).")
+        return report
+
+
+    @staticmethod
+    def _copy_item(e, target, replace=False):
+        """Copies a scanned item (ScanEntry) to the 'target' path, returns how
+        the file(s) got copied (see _transfer.copy_file).
+
+        The copy is made under a hidden temporary name next to 'target' and
+        renamed into place once complete, so an interrupted run never leaves
+        a partial item under its real name.  An existing 'target' is only
+        replaced if 'replace' is True (an earlier copy of the item, see
+        _state.StateDB.replacing); otherwise FileExistsError is raised."""
+        folder, name = os.path.split(target)
+        tmp = os.path.join(folder, f".{name}.tfpart")
+        if not replace and os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "target already exists",
+                                  target)
+        if not e.is_dir:
+            try:
+                if e.is_link:
+                    # from a recursive walk, which doesn't follow links
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(tmp)
+                    os.symlink(os.readlink(e.path), tmp)
+                    how = "symlink"
+                else:
+                    how = copy_file(e.path, tmp)
+                os.replace(tmp, target)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp)
+                raise
+            return how
+
+        if os.path.isdir(tmp):
+            # left over from a run that was killed
+            shutil.rmtree(tmp)
+        used = collections.Counter()
+        def copy_function(s, d):
+            used[copy_file(s, d)] += 1
+            return d
+
+        try:
+            shutil.copytree(e.path, tmp, copy_function=copy_function)
+            if replace and os.path.isdir(target):
+                # copied by an earlier (incremental) run, and changed since
+                shutil.rmtree(target)
+            os.rename(tmp, target)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return ", ".join(f"{k} x{v}" for k, v in sorted(used.items())) or \
+               "empty"
 
-    def copy(self, src, dst, method, fmt, individual=False, dry_run=False):
+
+    @staticmethod
+    def _link_item(original, target):
+        """Hardlinks the 'target' path to the already copied 'original' (via
+        a temporary name, like _copy_item), returns False if it can't be
+        (different filesystem, no hardlink support, ...)."""
+        folder, name = os.path.split(target)
+        tmp = os.path.join(folder, f".{name}.tfpart")
+        if os.path.lexists(target):
+            return False
+        try:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            os.link(original, tmp)
+            os.replace(tmp, target)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            return False
+        return True
+
+
+    def _dedup(self, plan, jobs=4):
+        """Runs _dedup.find_duplicates() on the items of 'plan' (a list),
+        returns its {duplicate path: original path} map."""
+        with self.prof.phase("dedup"):
+            links = find_duplicates((e for e, _, _ in plan), jobs=jobs)
+        self.prof.count("duplicates", len(links))
+        self.log.debug(f"{len(links)} duplicate file(s) found")
+        return links
+
+
+    def copy(self, src, dst, method, fmt, individual=False, dry_run=False,
+             stream=False, jobs=1, state=None, predicate=None,
+             recursive=False, walk_threads=1, on_item=None, progress=False,
+             journal=None, dedup=False, hash_threads=4, plan=None,
+             plan_out=None, shard=None):
         """
         *args:
         src - list: directories/filenames.
@@ -209,68 +851,430 @@ class Timefops:
         fmt - str: datetime format identitfier.
 
         **kwargs:
-        cmp - str (optional): compression shorthand (bz2, gz, xz).
         individual - bool: changes how items in src are evaluated (literal).
         dry_run - bool: whether to actually run, or just print expected results.
+        stream - bool: copy items while the sources are still being scanned.
+        jobs - int: number of items copied at the same time (threads).
+        state - str (optional): state database path, items that haven't
+                changed since they were copied by an earlier run are skipped.
+        predicate - callable (optional): only items it returns True for are
+                    handled (see _filter.EntryFilter).
+        recursive - bool: handle the files at any depth under the source
+                    directories (flattened into the folders), instead of
+                    their immediate children.
+        walk_threads - int: number of threads listing directories (recursive).
+        on_item - callable (optional): called as on_item(entry, target,
+                  error) after every item, error being the PermissionError
+                  it was skipped for, or None.
+        progress - bool: show items/s, bytes/s, bytes left and ETA on stderr
+                   while running (see _progress.Progress).
+        journal - str (optional): journal path; the plan and every item done
+                  are written to it, so that a run that was stopped can be
+                  resumed with the same names by running it again (see
+                  _journal).  It is removed once the run completes.
+        plan - list (optional): items to handle instead of scanning 'src'
+               (see execute()).
+        plan_out - str (optional): write the plan to this file (see
+                   _planfile) instead of running it.
+        dedup - bool: files with the same content as an earlier file of the
+                run are hardlinked to its copy instead of copied again (see
+                _dedup); the whole plan is made first.
+        hash_threads - int: number of threads hashing files for 'dedup'.
+        shard - tuple (optional): (K, N), only handle the items of shard K
+                of N, whole time strs at a time (see _shard).
 
 
         Copies files/folders & puts them in folders by last by a date defined by
         the method parameter (atime, ctime, mtime) and fmt (format identifier).
-        """
 
-        file_time_map = self.path_time_map(src, f"get{method}", fmt,
-                                           individual=individual)
+        Returns:
+        Report - per-item results and totals (see _report), None for dry
+                 runs.
+        """
 
-        rename_map = self._rename_duplicates(file_time_map)[0]
+        if state and journal:
+            raise ValueError("a journal can't be used with a state file.")
+        journal = None if dry_run or plan_out else \
+                  self._open_journal(journal, "copy", method, fmt, dst,
+                                     shard=shard)
+        plan = self._plan(src, dst, method, fmt, individual=individual,
+                          stream=stream, predicate=predicate,
+                          recursive=recursive, walk_threads=walk_threads,
+                          journal=journal, plan=plan, shard=shard)
+        if plan_out:
+            return self._write_plan(plan_out, "copy", src, dst, method, fmt,
+                                    plan, dedup=dedup)
+        db = self._open_state(state, "copy", method, fmt, dst)
+        if db is not None:
+            filtered = self.prof.iterate("state", db.filter(plan))
+            plan = list(filtered) if isinstance(plan, list) else filtered
+        links = {}
+        if dedup:
+            plan = list(plan)
+            links = self._dedup(plan, jobs=hash_threads)
 
         if dry_run:
             self.log.info(f"\nCreating directories based on {method}.\n")
             self.log.info("Item list:")
 
-        # Copy the associated items to the designated path.
-        for n, (i, p) in enumerate(file_time_map.items(), 1):
-            target_dir = os.path.join(dst, p)
-            if not dry_run:
-                os.makedirs(target_dir, exist_ok=True)
-                try:
-                    shutil.copytree(i, os.path.join(target_dir,
-                                                    rename_map.get(i)))
-                    self.log.verbose(f"done copying: {os.path.relpath(i)}")
-                except PermissionError:
-                    self.num_warn += 1
-                    self.log.warning("Insufficient permissions to copy the "
-                                     f"directory: '{os.path.relpath(i)}', "
-                                     "skipping.")
-                except OSError as exc:
-                    # If not a directory, copy the file(s)
-                    if exc.errno == errno.ENOTDIR:
-                        try:
-                            shutil.copy2(i, os.path.join(target_dir,
-                                                         rename_map.get(i)))
-                            self.log.verbose(f"done copying: "
-                                             f"{os.path.relpath(i)}")
-                        except PermissionError:
-                            self.num_warn += 1
-                            self.log.warning("Insufficient permissions to copy "
-                                            f"the file: '{os.path.relpath(i)}',"
-                                             " skipping.")
-            else:
+            n = 0
+            for n, (e, p, name) in enumerate(plan, 1):
                 self.log.info("{}. {} --> {}".format(
-                              n, os.path.relpath(i), os.path.join(target_dir,
-                                                     rename_map.get(i))
+                              n, os.path.relpath(e.path), os.path.join(dst, p,
+                                                                       name)
                 ))
+            self.log.info(f"\n# of items to be copied: {n}")
+            if dedup:
+                self.log.info("# of duplicates to be hardlinked: "
+                              f"{len(links)}")
+            if db is not None:
+                self.log.info(f"# of unchanged items skipped: {db.skipped}")
+                db.close()
+            return
+
+        dirs = DirCache()
+        makedirs = self.prof.wrap("makedirs", dirs.makedirs)
+        verbose = self.log.isEnabledFor(VERBOSE)
+        report = Report("copy", dst, on_item=on_item)
+
+        # copy target of every original that got copied, for 'links'
+        targets = {}
+        originals = set(links.values())
+
+        def tasks(items):
+            for e, p, name in items:
+                target_dir = os.path.join(dst, p)
+                makedirs(target_dir)
+                yield e, p, name
+
+        def copy_item(e, p, name):
+            start = time.perf_counter()
+            target = os.path.join(dst, p, name)
+            original = targets.get(links.get(e.path))
+            if original is not None and self._link_item(original, target):
+                how = "hardlink"
+            else:
+                how = self._copy_item(e, target, replace=db is not None and
+                                      e.path in db.replacing)
+            return how, time.perf_counter() - start
+
+        # Copy the associated items to the designated path, results come back
+        # in plan order, whatever the number of jobs.  Duplicates go last,
+        # once every original is in place.
+        results = ordered_map(copy_item, tasks(
+            [x for x in plan if x[0].path not in links] if links else plan),
+            jobs=jobs)
+        if links:
+            results = itertools.chain(results, ordered_map(copy_item, tasks(
+                [x for x in plan if x[0].path in links]), jobs=jobs))
+        linked = 0
+        try:
+            with self.prof.phase("copy"), \
+                 self._progress(report, self._plan_totals(plan), progress):
+                for (e, p, name), result, exc in results:
+                    if exc is None:
+                        how, duration = result
+                        if e.path in originals:
+                            targets[e.path] = os.path.join(dst, p, name)
+                        if how == "hardlink":
+                            linked += 1
+                        if not e.is_dir:
+                            self.prof.count(how)
+                        if verbose:
+                            self.log.verbose(f"done copying ({how}): "
+                                             f"{os.path.relpath(e.path)}")
+                        if db is not None:
+                            db.record(e)
+                        if journal is not None:
+                            journal.record(e.path)
+                        report.add(e, p, name, duration=duration)
+                    elif isinstance(exc, PermissionError):
+                        self.num_warn += 1
+                        kind = "directory" if e.is_dir else "file"
+                        self.log.warning("Insufficient permissions to copy "
+                                         f"the {kind}: "
+                                         f"'{os.path.relpath(e.path)}', "
+                                         "skipping.")
+                        report.add(e, p, name, error=exc)
+                    elif isinstance(exc, FileExistsError):
+                        self.num_warn += 1
+                        self.log.warning(f"'{os.path.relpath(exc.filename)}' "
+                                         "already exists, skipping.")
+                        report.add(e, p, name, error=exc)
+                    else:
+                        raise exc
+            if journal is not None:
+                journal.finish()
+        finally:
+            if journal is not None:
+                journal.close()
+            if db is not None:
+                # whatever got copied is recorded, even if the run failed
+                with self.prof.phase("state"):
+                    db.commit()
+                db.close()
+                self._log_state(db)
+                report.unchanged = db.skipped
+
+        if dedup:
+            self.log.info(f"{linked} duplicate(s) stored as hardlinks.")
+        self.log.success("contents copied -- finished with "
+                        f"{self.num_warn} warning(s).")
+        self.prof.count("makedirs", len(dirs.made))
+        return self._count_report(report.finish())
+
+
+    @contextlib.contextmanager
+    def _open_tar(self, dst, cmp_sh, to_stdout, threads=1, level=None,
+                  index=None, created=None):
+        """Opens a tar archive for writing; with more than one thread, the
+        compression is done by a _compress.ParallelWriter.  With an 'index'
+        (_index.ArchiveIndex), it is written once the archive is complete;
+        compressed archives then always go through a ParallelWriter, so
+        members can be reached from the start of their block.  The paths of
+        the files made are appended to 'created' (a list) as they are."""
+        created = [] if created is None else created
+        tar_class = tarfile.TarFile if index is None else IndexedTarFile
+        if (threads <= 1 and index is None) or not cmp_sh:
+            kwargs = {}
+            if level is not None and cmp_sh:
+                kwargs["preset" if cmp_sh == "xz" else "compresslevel"] = level
+            with tar_class.open(dst, mode=f"x:{cmp_sh}" if cmp_sh else "x",
+                                fileobj=sys.stdout.buffer \
+                                        if to_stdout else None, **kwargs) as t:
+                if not to_stdout:
+                    created.append(dst)
+                yield t
+            if index is not None:
+                index.write(t.members)
+                created.append(index.path)
+            return
+
+        out = sys.stdout.buffer if to_stdout else open(dst, "xb")
+        if not to_stdout:
+            created.append(dst)
+        try:
+            with ParallelWriter(out, cmp_sh, threads, level=level) as w:
+                with tar_class.open(fileobj=w, mode="w") as t:
+                    yield t
+            self.log.debug(f"{w.blocks} '{cmp_sh}' block(s) of "
+                           f"{w.block_size} bytes compressed")
+            self.prof.count("blocks", w.blocks)
+        finally:
+            if not to_stdout:
+                out.close()
+        if index is not None:
+            index.block_size, index.blocks = w.block_size, w.offsets
+            index.write(t.members)
+            created.append(index.path)
+
+
+    @contextlib.contextmanager
+    def _open_zip(self, dst, cmp_sh, level=None, aes=None, index=None,
+                  created=None):
+        """Opens a zip file for writing, an AES-encrypted one if 'aes'
+        (password (bytes), key size in bits) is given.  With an 'index'
+        (_index.ArchiveIndex), it is written once the zip file is complete.
+        The paths of the files made are appended to 'created' (a list)."""
+        created = [] if created is None else created
+        compression = ZIP_COMPRESSION.get(cmp_sh, zipfile.ZIP_STORED)
+        if aes is None:
+            with zipfile.ZipFile(dst, mode="x", compression=compression,
+                                 compresslevel=level) as z:
+                if isinstance(dst, str):
+                    created.append(dst)
+                yield z
+        else:
+            with pyzipper.AESZipFile(dst, mode="x", compression=compression,
+                                     compresslevel=level) as z:
+                z.setpassword(aes[0])
+                z.setencryption(pyzipper.WZ_AES, nbits=aes[1])
+                if isinstance(dst, str):
+                    created.append(dst)
+                yield z
+        if index is not None:
+            index.write(z.filelist)
+            created.append(index.path)
+
+
+    @staticmethod
+    def _zip_timer(add):
+        """Adapts 'add' (called like Report.add) to _write_zip's on_item.
+        zip items are reported as a whole once their last member is in, the
+        time since the previous item is what they took."""
+        last = [time.perf_counter()]
+        def zip_item(e, zp, error):
+            now = time.perf_counter()
+            add(e, os.path.dirname(zp), os.path.basename(zp), error=error,
+                duration=now - last[0])
+            last[0] = now
+        return zip_item
+
+
+    def _write_tar(self, t, plan, add, index=None, links=None):
+        """Adds every item in the plan to the tarfile 't', calling 'add'
+        (like Report.add) for each, and tagging its members in 'index'
+        (optional, _index.ArchiveIndex).  Files in 'links' (see _dedup) are
+        added as hardlink members to their original, if it is in 't'."""
+        links = links or {}
+        # member name of every original added
+        arcnames = {}
+        for e, p, name in plan:
+            start = time.perf_counter()
+            arcname = os.path.join(p, name)
+            original = arcnames.get(links.get(e.path))
+            try:
+                if original is None:
+                    t.add(e.path, arcname=arcname)
+                    self.log.verbose("added: %s", arcname)
+                else:
+                    info = t.gettarinfo(e.path, arcname)
+                    info.type, info.linkname, info.size = \
+                        tarfile.LNKTYPE, original, 0
+                    t.addfile(info)
+                    self.prof.count("hardlink")
+                    self.log.verbose("added: %s (link to %s)", arcname,
+                                     original)
+            except PermissionError as exc:
+                self.num_warn += 1
+                self.log.warning("Insufficient permissions to add: "
+                                 f"'{os.path.relpath(e.path)}', skipping.")
+                add(e, p, name, error=exc)
+            else:
+                add(e, p, name, duration=time.perf_counter() - start)
+                if links:
+                    arcnames.setdefault(links.get(e.path, e.path), arcname)
+            if index is not None:
+                index.tag(t.members, p)
+
+
+    def _archive_split(self, plan, dst, method, report, db, totals, cmp_sh="",
+                       zip_file=False, aes=(), dry_run=False, threads=1,
+                       level=None, stored=STORED_EXTENSIONS,
+                       volume_size=None, progress=False, index=False,
+                       links=None, created=None):
+        """
+        *args:
+        plan - list: output of _plan() (filtered by 'db').
+        dst - str: archive path the volumes are named after.
+        method - str: time used.
+        report - Report: the operation's report.
+        db - StateDB: state database, may be None.
+        totals - tuple: output of _plan_totals().
+
+        **kwargs:
+        (as for archive(), 'aes' being its 'aes_zip_create', 'links' the
+        output of _dedup())
+
+        archive() with split=True: writes an archive per time str, split
+        into volumes of at most 'volume_size' bytes of items (see
+        _volumes).  Inside, items keep their time str folders, so unpacking
+        every volume gives the same tree as the single archive would.  Up to
+        'threads' volumes are written at the same time, each on one thread.
+
+        Returns:
+        Report - or None for dry runs.
+        """
+        volumes = split_volumes(plan, dst, volume_size)
 
         if dry_run:
-            self.log.info(f"\n# of items to be copied: {len(file_time_map)}")
+            self.log.info(f"\nCreating archives based on {method}.\n")
+            for path, items in volumes:
+                self.log.info(f"{os.path.relpath(path)}:")
+                for e, p, name in items:
+                    self.log.info(f"  {os.path.relpath(e.path)} --> "
+                                  f"{os.path.join(p, name)}")
+            self.log.info(f"\n# of archives to be created: {len(volumes)}")
+            self.log.info(f"# of items to be archived: {len(plan)}")
+            if db is not None:
+                self.log.info(f"# of unchanged items skipped: {db.skipped}")
+                db.close()
+            return
+
+        if db is not None and not plan:
+            db.close()
+            self._log_state(db)
+            self.log.success("nothing new or changed, no archive created.")
+            report.unchanged = db.skipped
+            return report.finish()
+
+        if aes and zip_file:
+            aes = (bytes(aes[0], "utf-8"), aes[1])
         else:
-            self.log.success("contents copied -- finished with "
-                            f"{self.num_warn} warning(s).")
+            aes = None
+        for path, _ in volumes:
+            if os.path.exists(path):
+                raise FileExistsError(errno.EEXIST, "archive already exists",
+                                      path)
+            if index and os.path.exists(index_path(path)):
+                raise FileExistsError(errno.EEXIST, "index already exists",
+                                      index_path(path))
+
+        def write_volume(path, items):
+            results = []
+            def add(e, p, name, error=None, duration=0.0):
+                results.append((e, p, name, error, duration))
+
+            idx = ArchiveIndex(index_path(path), "zip" if zip_file else "tar",
+                               cmp_sh) if index else None
+            try:
+                if zip_file:
+                    with self._open_zip(path, cmp_sh, level, aes, index=idx,
+                                        created=created) as z:
+                        self._write_zip(z, items, aes=aes,
+                                        stored=stored,
+                                        on_item=self._zip_timer(add),
+                                        index=idx)
+                else:
+                    with self._open_tar(path, cmp_sh, False, level=level,
+                                        index=idx, created=created) as t:
+                        self._write_tar(t, items, add, index=idx,
+                                        links=links)
+            except BaseException:
+                # don't leave a partial volume (or index) behind
+                for f in (path, index_path(path)) if index else (path,):
+                    with contextlib.suppress(OSError):
+                        os.remove(f)
+                raise
+            return results
+
+        with self.prof.phase("archive"), \
+             self._progress(report, totals, progress):
+            # closed on errors too, so that no volume is still being written
+            # once this returns
+            with contextlib.closing(ordered_map(write_volume, volumes,
+                                                jobs=threads)) as done:
+                for (path, items), results, exc in done:
+                    if exc is not None:
+                        raise exc
+                    for e, p, name, error, duration in results:
+                        if db is not None and error is None:
+                            db.record(e)
+                        report.add(e, p, name, error=error,
+                                   duration=duration)
+                    self.log.verbose("archive created: "
+                                     f"{os.path.relpath(path)} "
+                                     f"({len(items)} item(s))")
 
+        self.log.success(f"{len(volumes)} archive(s) created -- finished "
+                         f"with {self.num_warn} warning(s).")
+        if db is not None:
+            with self.prof.phase("state"):
+                db.commit()
+            db.close()
+            self._log_state(db)
+            report.unchanged = db.skipped
+        return self._count_report(report.finish())
 
 
     def archive(self, src, dst, method, fmt, cmp_sh="", individual=False,
                 zip_file=False, to_stdout=False, aes_zip_create=(),
-                dry_run=False):
+                dry_run=False, stream=False, threads=1, level=None,
+                stored=STORED_EXTENSIONS, state=None, predicate=None,
+                recursive=False, walk_threads=1, on_item=None,
+                progress=False, split=False, volume_size=None, index=False,
+                dedup=False, hash_threads=4, plan=None, plan_out=None,
+                shard=None, created=None):
         """
         *args:
         src - list: directories/filenames.
@@ -278,83 +1282,165 @@ class Timefops:
         fmt - str: datetime format identitfier.
 
         **kwargs:
-        cmp_sh - str (optional): compression shorthand (bz2, gz, xz).
+        cmp_sh - str (optional): compression shorthand (bz2, gz, xz; deflate
+                 for zip files).
         individual - bool: changes how items in src are evaluated (literal).
         zip_file - bool: decides whether to use zipfile or tarfile.
         to_stdout - bool: if True, prints binary output to stdout.
         dry_run - bool: whether to actually run, or just print expected results.
+        stream - bool: add items while the sources are still being scanned.
+        threads - int: number of threads compressing the tar archive (or
+                  worker processes compressing zip file members).
+        level - int (optional): compression level (preset for xz).
+        stored - set: extensions of zip members that are stored instead of
+                 compressed (already compressed formats by default).
+        state - str (optional): state database path, only items that are new
+                or changed since an earlier run are archived.
+        predicate - callable (optional): only items it returns True for are
+                    handled (see _filter.EntryFilter).
+        recursive - bool: handle the files at any depth under the source
+                    directories (flattened into the folders), instead of
+                    their immediate children.
+        walk_threads - int: number of threads listing directories (recursive).
+        on_item - callable (optional): called as on_item(entry, target,
+                  error) after every item, error being the PermissionError
+                  it was skipped for, or None.
+        progress - bool: show items/s, bytes/s, bytes left and ETA on stderr
+                   while running (see _progress.Progress).
+        split - bool: make an archive per time str instead of one archive,
+                named after 'dst' (see _archive_split).
+        volume_size - int (optional): with 'split', bytes of items (before
+                      compression) per archive, more go to numbered volumes.
+        index - bool: write a sidecar index of the members next to the
+                archive ('dst' + '.idx', see _index), for list_archive() and
+                extract().  Compressed tar archives are then written in
+                blocks (as with more than one thread).
+        dedup - bool: files with the same content as an earlier file in the
+                archive are added as hardlink members to it (see _dedup);
+                tar archives only, the whole plan is made first.
+        hash_threads - int: number of threads hashing files for 'dedup'.
+        plan - list (optional): items to archive instead of scanning 'src'
+               (see execute()).
+        plan_out - str (optional): write the plan to this file (see
+                   _planfile) instead of running it.
+        shard - tuple (optional): (K, N), only archive the items of shard K
+                of N (see _shard).  Unless 'split', the archive is named
+                after the shard ('logs.tar.xz' -> 'logs.2-of-4.tar.xz').
+        created - list (optional): the path of every file the run makes
+                  (archives, volumes, indexes) is appended to it once it is
+                  created, so a caller can remove them if it stops the run
+                  (see _async).
 
 
         Makes a tar archive containing the files/folders specified in 'src' 
         nested under folders by a date defined by the 'method' parameter
         (atime, ctime, mtime) and fmt (format identifier). This archive can be
         compressed by passing a valid compression method to 'cmp_sh'.
-        """
-        file_time_map = self.path_time_map(src, f"get{method}", fmt,
-                                           individual=individual)
 
-        rename_map = self._rename_duplicates(file_time_map) 
+        Returns:
+        Report - per-item results and totals (see _report), None for dry
+                 runs.
+        """
+        if split and to_stdout:
+            raise ValueError("split archives can't be written to stdout.")
+        if index and to_stdout:
+            raise ValueError("no index can be written for stdout.")
+        if dedup and zip_file:
+            raise ValueError("zip files can't hold hardlinks, dedup needs a "
+                             "tar archive.")
+        if plan_out and to_stdout:
+            raise ValueError("a plan can't be made for stdout.")
+        if shard is not None and not (split or to_stdout):
+            dst = shard_path(dst, shard)
+        # volumes are made per time str, and duplicates are found among every
+        # item, so the whole plan is needed first
+        plan = self._plan(src, None if to_stdout else dst, method, fmt,
+                          individual=individual,
+                          stream=stream and not (split or dedup),
+                          existing=False, predicate=predicate,
+                          recursive=recursive, walk_threads=walk_threads,
+                          plan=plan, shard=shard)
+        if plan_out:
+            return self._write_plan(
+                plan_out, "archive", src, dst, method, fmt, plan,
+                cmp_sh=cmp_sh or "", zip_file=zip_file, level=level,
+                stored=sorted(stored), split=split, volume_size=volume_size,
+                index=index, dedup=dedup,
+                aes=aes_zip_create[1] if aes_zip_create else None)
+        report = Report("archive", on_item=on_item)
+        # Records are only written once the archive is complete.
+        db = self._open_state(state, "archive", method, fmt, batch=0)
+        if db is not None:
+            filtered = self.prof.iterate("state", db.filter(plan))
+            plan = list(filtered) if isinstance(plan, list) else filtered
+        links = self._dedup(plan, jobs=hash_threads) if dedup else None
+        totals = self._plan_totals(plan)
+        if split:
+            return self._archive_split(plan, dst, method, report, db, totals,
+                                       cmp_sh=cmp_sh, zip_file=zip_file,
+                                       aes=aes_zip_create, dry_run=dry_run,
+                                       threads=threads, level=level,
+                                       stored=stored, volume_size=volume_size,
+                                       progress=progress, index=index,
+                                       links=links, created=created)
+        if db is not None:
+            if not dry_run:
+                plan = iter(plan)
+                first = next(plan, None)
+                if first is None:
+                    db.close()
+                    self._log_state(db)
+                    self.log.success("nothing new or changed, no archive "
+                                     "created.")
+                    report.unchanged = db.skipped
+                    return report.finish()
+                plan = self.prof.iterate("state", db.recorded(
+                    itertools.chain([first], plan)))
 
-        if aes_zip_create:
-            aes_zip_password, aes_encryption_lvl = aes_zip_create
+        idx = ArchiveIndex(index_path(dst), "zip" if zip_file else "tar",
+                           cmp_sh) if index else None
 
         if not dry_run:
+            # the password is only asked for (and a str) when writing a zip
+            aes = None
+            if aes_zip_create and zip_file:
+                aes_zip_password, aes_encryption_lvl = aes_zip_create
+                aes = (bytes(aes_zip_password, "utf-8"), aes_encryption_lvl)
+
             # Put the associated items into either a tar archive or a zip file,
             # nesting the items under the designated path.
             if zip_file:
-                if aes_zip_create:
-                    with pyzipper.AESZipFile(sys.stdout.buffer \
-                                             if to_stdout else dst,
-                                             mode='x',
-                                             compression={
-                                                "bz2": pyzipper.ZIP_BZIP2,
-                                                "xz" : pyzipper.ZIP_LZMA
-                                                }.get(cmp_sh,
-                                                    pyzipper.ZIP_STORED)) as az:
-                        az.setpassword(bytes(aes_zip_password, "utf-8"))
-                        az.setencryption(pyzipper.WZ_AES, 
-                                         nbits=aes_encryption_lvl)
-                        for i, p in file_time_map.items():
-                            self._recurse_zip_helper(az, i, 
-                                    os.path.join(p, rename_map[0].get(i)))
-                            self.log.verbose("added: "
-                                      f"{os.path.join(p,rename_map[0].get(i))}")
-
-                        self.log.success("zip file created -- finished with "
-                                        f"{self.num_warn} warning(s).")
-                else:
-                    with zipfile.ZipFile(sys.stdout.buffer \
-                                         if to_stdout else dst,
-                                         mode="x",
-                                         compression={
-                                             "bz2": zipfile.ZIP_BZIP2,
-                                             "xz" : zipfile.ZIP_LZMA
-                                             }.get(zipfile.ZIP_STORED)) as z:
-                        for i, p in file_time_map.items():
-                            self._recurse_zip_helper(z, i, 
-                                    os.path.join(p, rename_map[0].get(i)))
-                            self.log.verbose("added: "
-                                      f"{os.path.join(p,rename_map[0].get(i))}")
-
-                        self.log.success("zip file created -- finished with "
-                                        f"{self.num_warn} warning(s).")
+                with self.prof.phase("archive"), \
+                     self._progress(report, totals, progress), \
+                     self._open_zip(sys.stdout.buffer if to_stdout else dst,
+                                    cmp_sh, level, aes, index=idx,
+                                    created=created) as z:
+                    self._write_zip(z, plan, processes=threads, aes=aes,
+                                    stored=stored,
+                                    on_item=self._zip_timer(report.add),
+                                    index=idx)
+
+                    self.log.success("zip file created -- finished with "
+                                    f"{self.num_warn} warning(s).")
             else:
-                with tarfile.open(dst, mode=f"x:{cmp_sh}" if cmp_sh else "x",
-                                  fileobj=sys.stdout.buffer \
-                                          if to_stdout else None) as t:
-                    for i, p in file_time_map.items():
-                        try:
-                            t.add(i, arcname=os.path.join(
-                                             p, rename_map[0].get(i)))
-                            self.log.verbose(
-                              f"added: {os.path.join(p, rename_map[0].get(i))}")
-                        except PermissionError:
-                            self.num_warn += 1
-                            self.log.warning("Insufficient permissions to add: "
-                                  f"'{os.path.relpath(i)}', skipping.")
+                with self.prof.phase("archive"), \
+                     self._progress(report, totals, progress), \
+                     self._open_tar(dst, cmp_sh, to_stdout, threads,
+                                    level, index=idx,
+                                    created=created) as t:
+                    self._write_tar(t, plan, report.add, index=idx,
+                                    links=links)
 
                     self.log.success("tar archive created -- finished with "
                                     f"{self.num_warn} warning(s).")
+
+            if db is not None:
+                with self.prof.phase("state"):
+                    db.commit()
+                db.close()
+                self._log_state(db)
+                report.unchanged = db.skipped
+            return self._count_report(report.finish())
         else:
             self.log.info(f"\nCreating directories based on {method}.\n")
             if to_stdout:
@@ -362,18 +1448,256 @@ class Timefops:
             else:
                 self.log.info(f"writing to file: '{os.path.relpath(dst)}'")
             if cmp_sh:
-                self.log.info(f"- using '{cmp_sh}' compression.")
+                self.log.info(f"- using '{cmp_sh}' compression"
+                              f"{f' (level {level})' if level is not None else ''}.")
+            if cmp_sh and zip_file and stored:
+                self.log.info(f"- storing {len(stored)} already compressed "
+                              "format(s) as is.")
+            if cmp_sh and threads > 1 and not zip_file:
+                self.log.info(f"- compressing on {threads} threads.")
+            elif zip_file and threads > 1:
+                self.log.info(f"- compressing members in {threads} "
+                              "processes.")
             if zip_file and aes_zip_create:
                 self.log.info("\nzip file using AES encryption "
-                             f"({aes_encryption_lvl}-bit)")
-            if zip_file and aes_zip_password:
+                             f"({aes_zip_create[1]}-bit)")
+            if zip_file and aes_zip_create:
                 self.log.info("password-protection will be set.")
+            if dedup:
+                self.log.info(f"- {len(links)} duplicate(s) to be added as "
+                              "hardlinks.")
+            if index:
+                self.log.info("\nwriting an index to: "
+                              f"'{os.path.relpath(index_path(dst))}'")
             self.log.info("\nItem list:")
 
-            for n, (i, p) in enumerate(file_time_map.items(), 1):
+            n = 0
+            for n, (e, p, name) in enumerate(plan, 1):
                 target_dir = os.path.join(dst, p)
                 self.log.info("{}. {} --> {}".format(
-                    n, os.path.relpath(i), os.path.relpath(os.path.join(
-                        target_dir, rename_map[0].get(i)))
+                    n, os.path.relpath(e.path), os.path.relpath(os.path.join(
+                        target_dir, name))
                 ))
-            self.log.info(f"\n# of items to be archived: {len(file_time_map)}")
+            self.log.info(f"\n# of items to be archived: {n}")
+            if db is not None:
+                self.log.info(f"# of unchanged items skipped: {db.skipped}")
+                db.close()
+
+
+    def execute(self, path, jobs=1, state=None, dry_run=False,
+                progress=False, password=None, hash_threads=4, on_item=None,
+                shard=None):
+        """
+        *args:
+        path - str: plan file (written by move/copy/archive with 'plan_out').
+
+        **kwargs:
+        jobs - int: items copied at the same time (copy), or threads
+               compressing the archive (archive).
+        state - str (optional): state database path (copy and archive),
+                see copy()/archive().
+        dry_run - bool: whether to actually run, or just print expected
+                  results.
+        progress - bool: show progress on stderr while running.
+        password - str (optional): password, for a plan of an AES-encrypted
+                   zip file.
+        hash_threads - int: number of threads hashing files, for plans made
+                       with 'dedup'.
+        on_item - callable (optional): see move().
+        shard - tuple (optional): (K, N), only run the items of shard K of N
+                (see _shard), so a plan can be shared out between processes
+                or machines.
+
+        Runs a plan without scanning the sources again: every item is stat'ed
+        once (items that are gone are skipped, items whose size changed since
+        they were planned are warned about) and handled under the time str
+        and name it was planned with.
+
+        Raises:
+        _planfile.PlanError - if the file isn't a plan, or a password is
+                              needed.
+
+        Returns:
+        Report - per-item results and totals (see _report), None for dry
+                 runs.
+        """
+        header, items = read_plan(path)
+        operation, options = header["operation"], header["options"]
+        if options.get("aes") and password is None:
+            raise PlanError(f"plan '{path}' is of an AES-encrypted zip file, "
+                            "a password is needed.")
+
+        if shard is not None:
+            k, n = shard
+            items = [x for x in items if shard_of(x["bucket"], n) == k]
+
+        scanner = Scanner(onerror=self._scan_error)
+        plan = []
+        with self.prof.phase("scan"):
+            for item in items:
+                try:
+                    e = scanner.stat(item["src"])
+                except OSError as exc:
+                    self._scan_error(exc)
+                    continue
+                if not e.is_dir and e.size != item["size"]:
+                    self.num_warn += 1
+                    self.log.warning(f"'{os.path.relpath(e.path)}' changed "
+                                     "size since it was planned.")
+                plan.append((e, item["bucket"], item["name"]))
+        self._log_scan(scanner, len(plan))
+        self.log.verbose(f"running plan '{path}' -- {operation}, "
+                         f"{len(plan)} of {len(items)} item(s).")
+
+        args = (header["src"], header["dst"], header["method"],
+                header["format"])
+        kwargs = {"dry_run": dry_run, "progress": progress,
+                  "on_item": on_item, "plan": plan, "shard": shard}
+        if operation == "move":
+            return self.move(*args, **kwargs)
+        if operation == "copy":
+            return self.copy(*args, jobs=jobs, state=state,
+                             dedup=options["dedup"], hash_threads=hash_threads,
+                             **kwargs)
+        return self.archive(
+            *args, cmp_sh=options["cmp_sh"], zip_file=options["zip_file"],
+            aes_zip_create=(password, options["aes"]) if options["aes"]
+                           else (),
+            threads=jobs, level=options["level"],
+            stored=set(options["stored"]), state=state,
+            split=options["split"], volume_size=options["volume_size"],
+            index=options["index"], dedup=options["dedup"],
+            hash_threads=hash_threads, **kwargs)
+
+
+    def list_archive(self, archive, bucket=None, index=None):
+        """
+        *args:
+        archive - str: archive written with an index (see archive()).
+
+        **kwargs:
+        bucket - str (optional): list the members archived under this time
+                 str, instead of the time strs themselves.
+        index - str (optional): index file, 'archive' + '.idx' by default.
+
+        Lists what is in 'archive' from its index, without opening it.
+
+        Returns:
+        list - the index records listed (see _index), or for time strs,
+               {'bucket', 'members', 'size'} dicts.
+        """
+        _, records = read_index(index or index_path(archive))
+        if bucket is not None:
+            bucket = bucket.replace(os.sep, "/").strip("/")
+            listed = [r for r in records if r["bucket"] == bucket]
+            for r in listed:
+                size = "-" if r["type"] == "dir" else human_size(r["size"])
+                self.log.info(f"{size:>10}  {r['name']}")
+            self.log.info(f"\n# of members in '{bucket}': {len(listed)}")
+            return listed
+
+        buckets = {}
+        for r in records:
+            b = buckets.setdefault(r["bucket"], {"bucket": r["bucket"],
+                                                 "members": 0, "size": 0})
+            b["members"] += 1
+            b["size"] += r["size"]
+        for b in buckets.values():
+            self.log.info(f"{b['bucket']}  {b['members']} member(s), "
+                          f"{human_size(b['size'])}")
+        self.log.info(f"\n# of folders: {len(buckets)}")
+        return list(buckets.values())
+
+
+    @staticmethod
+    def _selected(name, names):
+        """Whether member 'name' is one of 'names' or under one of them."""
+        parts = name.split("/")
+        return any("/".join(parts[:i]) in names
+                   for i in range(1, len(parts) + 1))
+
+
+    def extract(self, archive, dst, members=(), bucket=None, index=None,
+                password=None):
+        """
+        *args:
+        archive - str: archive written with an index (see archive()).
+        dst - str: directory to extract to (members keep their path).
+
+        **kwargs:
+        members - iterable: names of the members to extract, as listed by
+                  list_archive(); directories come with everything under
+                  them.
+        bucket - str (optional): extract every member archived under this
+                 time str instead.
+        index - str (optional): index file, 'archive' + '.idx' by default.
+        password - str (optional): password of an AES-encrypted zip file.
+
+        Extracts members without reading the archive from the start: tar
+        archives are read from the offset (or compressed block) the index
+        gives for each run of wanted members, zip members are found through
+        the central directory.
+
+        Raises:
+        _index.ArchiveIndexError - if the index isn't one, or doesn't match
+                                   the archive.
+
+        Returns:
+        list - names of the members extracted.
+        """
+        header, records = read_index(index or index_path(archive))
+        if bucket is not None:
+            bucket = bucket.replace(os.sep, "/").strip("/")
+            wanted = [r for r in records if r["bucket"] == bucket]
+            if not wanted:
+                self.num_warn += 1
+                self.log.warning(f"nothing archived under '{bucket}'.")
+        else:
+            names = {m.strip("/") for m in members}
+            wanted = [r for r in records if r["name"] in names]
+            for name in sorted(names - {r["name"] for r in wanted}):
+                self.num_warn += 1
+                self.log.warning(f"'{name}' is not in the index, skipping.")
+        names = {r["name"] for r in wanted}
+        # hardlinks (see _dedup) need their target extracted too
+        by_name = {r["name"]: r for r in records}
+        for r in list(wanted):
+            target = by_name.get(r.get("link"))
+            if target is not None and not self._selected(target["name"],
+                                                         names):
+                wanted.append(target)
+                names.add(target["name"])
+
+        extracted = []
+        if header["format"] == "zip":
+            with pyzipper.AESZipFile(archive) as z:
+                if password is not None:
+                    z.setpassword(bytes(password, "utf-8"))
+                for info in z.infolist():
+                    if self._selected(info.filename.rstrip("/"), names):
+                        z.extract(info, dst)
+                        extracted.append(info.filename.rstrip("/"))
+                        self.log.verbose("extracted: %s", extracted[-1])
+        else:
+            kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") \
+                     else {}
+            seen = set()
+            for rec in sorted(wanted, key=lambda r: r["offset"]):
+                if rec["name"] in seen:
+                    continue
+                # extract from here on, as long as members are wanted
+                with open_at(archive, header, rec) as t:
+                    for m in t:
+                        if not self._selected(m.name, names):
+                            break
+                        t.extract(m, dst, **kwargs)
+                        seen.add(m.name)
+                        extracted.append(m.name)
+                        self.log.verbose("extracted: %s", m.name)
+                if rec["name"] not in seen:
+                    raise ArchiveIndexError(f"'{archive}' doesn't match its "
+                                            "index.")
+
+        self.log.success(f"{len(extracted)} member(s) extracted -- finished "
+                         f"with {self.num_warn} warning(s).")
+        return extracted